@@ -0,0 +1,190 @@
+# Active-learning screening loop.
+# A lightweight classifier (logistic regression on TF-IDF or embedding features) is refit as
+# labels arrive. Only the articles it cannot decide on are sent to an oracle (query_openai or a
+# human reviewer), most likely inclusions first; confident inclusions are decided automatically,
+# and once a recall-targeted stopping rule fires every remaining article is auto-excluded.
+import os
+import sys
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+
+BATCH_SIZE = 10       # articles sent to the oracle per round
+SEED_SIZE = 20        # random articles labelled before the first model is fit
+INCLUDE_ABOVE = 0.99  # estimated inclusion probability above which an article is auto-included
+TARGET_RECALL = 0.95  # estimated recall required before stopping
+PATIENCE = 30         # consecutive oracle exclusions required before stopping
+C = 10                # inverse regularisation strength of the classifiers
+
+
+def tfidf_features(texts, max_features=50000):
+    '''TF-IDF features of titles plus abstracts (sparse matrix).'''
+    vectorizer = TfidfVectorizer(sublinear_tf=True, ngram_range=(1, 2), min_df=2,
+                                 max_features=max_features, stop_words='english')
+    return vectorizer.fit_transform(['' if text is None else str(text) for text in texts])
+
+
+def embedding_features(texts, model_name=None):
+    '''Transformer embeddings from screeningfunctions (float32 matrix).'''
+    from screeningfunctions import embed_texts, MODEL_NAME
+    return embed_texts(list(texts), model_name or MODEL_NAME)
+
+
+class ActiveScreener:
+    '''
+    Screening loop over a fixed feature matrix; rows are articles.
+    labels holds 1 (include), 0 (exclude) or -1 (not labelled by the oracle).
+
+    Two classifiers are refit after every batch: a class-balanced one ranks the articles
+    to query, an unweighted one estimates how many inclusions remain among the unlabelled.
+    '''
+
+    def __init__(self, features, batch_size=BATCH_SIZE, seed_size=SEED_SIZE, include_above=INCLUDE_ABOVE,
+                 target_recall=TARGET_RECALL, patience=PATIENCE, C=C, random_state=0):
+        self.features = features
+        self.batch_size = batch_size
+        self.seed_size = seed_size
+        self.include_above = include_above
+        self.target_recall = target_recall
+        self.patience = patience
+        self.C = C
+        self.rng = np.random.default_rng(random_state)
+        self.labels = np.full(features.shape[0], -1, dtype=np.int8)
+        self.rank_score = np.zeros(features.shape[0])
+        self.proba = None  # unweighted inclusion probabilities, None until both classes are labelled
+        self.quiet = 0     # oracle exclusions since the last inclusion
+        self.stopped = False
+
+    def add_labels(self, rows, decisions):
+        '''Record oracle decisions (True/1 = include) and refit the classifiers.'''
+        decisions = np.asarray(decisions, dtype=np.int8)
+        self.labels[np.asarray(rows, dtype=int)] = decisions
+        self.quiet = 0 if decisions.any() else self.quiet + len(decisions)
+        self.fit()
+
+    def fit(self):
+        labelled = np.flatnonzero(self.labels >= 0)
+        if len(np.unique(self.labels[labelled])) < 2:
+            return  # need both classes; keep sampling at random
+        X, y = self.features[labelled], self.labels[labelled]
+        ranker = LogisticRegression(C=self.C, class_weight='balanced', max_iter=2000).fit(X, y)
+        estimator = LogisticRegression(C=self.C, max_iter=2000).fit(X, y)
+        self.rank_score = ranker.predict_proba(self.features)[:, 1]
+        self.proba = estimator.predict_proba(self.features)[:, 1]
+
+    def auto_included(self):
+        '''Unlabelled rows confidently predicted as inclusions.'''
+        if self.proba is None:
+            return np.zeros(len(self.labels), dtype=bool)
+        return (self.labels < 0) & (self.proba >= self.include_above)
+
+    def next_batch(self):
+        '''Rows to send to the oracle next; empty when nothing is left to ask about.'''
+        rows = np.flatnonzero((self.labels < 0) & ~self.auto_included())
+        if self.proba is None:
+            size = self.seed_size if not (self.labels >= 0).any() else self.batch_size
+            return self.rng.choice(rows, size=min(size, len(rows)), replace=False)
+        return rows[np.argsort(-self.rank_score[rows], kind='stable')][:self.batch_size]
+
+    def estimated_recall(self):
+        '''Inclusions found (or auto-included) over those plus the expected number left undecided.'''
+        if self.proba is None:
+            return 0.0
+        auto = self.auto_included()
+        found = int(np.sum(self.labels == 1)) + float(self.proba[auto].sum())
+        expected = float(self.proba[(self.labels < 0) & ~auto].sum())
+        return found / (found + expected) if found + expected > 0 else 1.0
+
+    def should_stop(self):
+        return (self.proba is not None and self.quiet >= self.patience
+                and self.estimated_recall() >= self.target_recall)
+
+    def decisions(self):
+        '''
+        Final decision per article: the oracle's label where there is one, included if confidently
+        predicted so, and excluded otherwise (only meaningful once the loop has stopped).
+        '''
+        return np.where(self.labels >= 0, self.labels == 1, self.auto_included())
+
+    def run(self, oracle, max_queries=None):
+        '''
+        Screen until the stopping rule fires or every article is decided.
+
+        Parameters:
+        oracle - callable taking a list of row numbers and returning include decisions.
+        max_queries - optional budget of oracle decisions.
+
+        Returns: boolean array of final decisions.
+        '''
+        while max_queries is None or self.queries() < max_queries:
+            batch = self.next_batch()
+            if max_queries is not None:
+                batch = batch[:max_queries - self.queries()]
+            if not len(batch):
+                break
+            self.add_labels(batch, oracle(list(batch)))
+            if self.should_stop():
+                self.stopped = True
+                break
+        return self.decisions()
+
+    def queries(self):
+        return int(np.sum(self.labels >= 0))
+
+    def report(self):
+        undecided = self.labels < 0
+        decided = self.decisions()
+        return {'articles': len(self.labels), 'oracle_decisions': self.queries(),
+                'auto_included': int(np.sum(undecided & decided)),
+                'auto_excluded': int(np.sum(undecided & ~decided)),
+                'estimated_recall': round(self.estimated_recall(), 3), 'stopped_early': self.stopped}
+
+
+def label_oracle(labels):
+    '''Oracle answering from known decisions, e.g. the human labels, to simulate a screen.'''
+    labels = np.asarray(labels, dtype=bool)
+    return lambda rows: labels[rows]
+
+
+def llm_decision(response):
+    '''Include an article when the model finds BMI as main exposure, BP as main outcome and MR as main method.'''
+    if not response:
+        return False
+    terms = response.get('term_analysis', {})
+    return bool(terms.get('bmi_adiposity', {}).get('is_main_exposure')
+                and terms.get('blood_pressure', {}).get('is_main_outcome')
+                and terms.get('mendelian_randomisation', {}).get('is_main_method'))
+
+
+def llm_oracle(titles, abstracts):
+    '''Oracle calling query_openai from Scripts/utils.py for each requested article.'''
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Scripts'))
+    from utils import construct_prompt, query_openai, clean_abstract
+    return lambda rows: [llm_decision(query_openai(construct_prompt(titles[row], clean_abstract(abstracts[row]))))
+                         for row in rows]
+
+
+def simulate(path='HUMAN_DECISION_Score.csv', features='tfidf', **options):
+    '''
+    Replay a screen against human decisions and report oracle calls and recall.
+
+    Parameters:
+    path - csv with title, abstract and Human (Included/Excluded) columns.
+    features - 'tfidf' or 'embedding'.
+    '''
+    df = pd.read_csv(path)
+    texts = (df['title'].fillna('') + '. ' + df['abstract'].fillna('')).tolist()
+    matrix = tfidf_features(texts) if features == 'tfidf' else embedding_features(texts)
+    truth = (df['Human'] == 'Included').to_numpy()
+    screener = ActiveScreener(matrix, **options)
+    decided = screener.run(label_oracle(truth))
+    report = screener.report()
+    report['recall'] = round(float(decided[truth].mean()), 3) if truth.any() else 1.0
+    report['call_reduction'] = round(1 - report['oracle_decisions'] / len(truth), 3)
+    return report
+
+
+if __name__ == '__main__':
+    # Replay the screen on the human decisions, e.g. python active_learning.py HUMAN_DECISION_Score.csv
+    print(simulate(*sys.argv[1:2]))
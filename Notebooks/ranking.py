@@ -0,0 +1,168 @@
+# Centroid-based relevance ranking of a corpus.
+# Corpus embeddings are written once to a memory-mapped float32 matrix (L2-normalised, so
+# cosine similarity is a dot product) and scored against one or more inclusion centroids in
+# vectorised chunks, or through an optional FAISS index for very large corpora. The ranked
+# article indices let LLM screening go in priority order and stop early.
+import sys
+import json
+import numpy as np
+
+from screeningfunctions import embed_texts, calculate_centroid, MODEL_NAME
+
+try:
+    import faiss
+except ImportError:  # brute-force scoring over the memmap is used
+    faiss = None
+
+CHUNK_ROWS = 65536  # rows scored per matrix product; bounds memory for memmapped corpora
+
+
+def normalize_rows(matrix):
+    '''L2-normalise the rows of a matrix, leaving all-zero rows at zero.'''
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, np.finfo(np.float32).tiny)
+
+
+def build_embedding_matrix(records, path, model_name=MODEL_NAME, text_field='title', batch_rows=4096):
+    '''
+    Embed a corpus into a memory-mapped float32 matrix.
+
+    Parameters:
+    records - iterable of dicts with idx and the text field (e.g. ingest.iter_articles).
+    path - matrix file; the article indices go to path.ids.npy and the shape to path.json.
+    model_name - embedding model.
+    text_field - record field to embed, 'title' or 'abstract'.
+    batch_rows - texts embedded and written at a time.
+
+    Returns: read-only memmap of shape (articles, hidden size) with unit-length rows.
+    '''
+    ids, dim, batch = [], 0, []
+    with open(path, 'wb') as f:
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_rows:
+                dim = _write_batch(f, batch, ids, model_name, text_field)
+        if batch:
+            dim = _write_batch(f, batch, ids, model_name, text_field)
+    np.save(path + '.ids.npy', np.asarray(ids, dtype=np.int64))
+    with open(path + '.json', 'w') as f:
+        json.dump({'rows': len(ids), 'dim': dim, 'model': model_name, 'text_field': text_field}, f)
+    return open_embedding_matrix(path)
+
+
+def _write_batch(f, batch, ids, model_name, text_field):
+    vectors = normalize_rows(embed_texts([record[text_field] for record in batch], model_name))
+    f.write(vectors.tobytes())
+    ids.extend(record['idx'] for record in batch)
+    batch.clear()
+    return vectors.shape[1]
+
+
+def open_embedding_matrix(path):
+    '''Open a matrix written by build_embedding_matrix as a read-only memmap.'''
+    with open(path + '.json') as f:
+        meta = json.load(f)
+    if not meta['rows']:
+        return np.empty((0, meta['dim']), dtype=np.float32)
+    return np.memmap(path, dtype=np.float32, mode='r', shape=(meta['rows'], meta['dim']))
+
+
+def article_ids(path):
+    '''Article index of every row of an embedding matrix.'''
+    return np.load(path + '.ids.npy')
+
+
+def similarity_scores(matrix, centroids, chunk_rows=CHUNK_ROWS):
+    '''
+    Cosine similarity of every row to its closest inclusion centroid.
+
+    Parameters:
+    matrix - (n, d) unit-length embeddings, typically a memmap.
+    centroids - (d,) or (k, d) centroids; normalised here.
+
+    Returns: float32 array of n scores.
+    '''
+    centroids = normalize_rows(np.atleast_2d(centroids)).T
+    scores = np.empty(len(matrix), dtype=np.float32)
+    for start in range(0, len(matrix), chunk_rows):
+        block = np.asarray(matrix[start:start + chunk_rows])
+        scores[start:start + len(block)] = (block @ centroids).max(axis=1)
+    return scores
+
+
+def rank_articles(matrix, ids, centroids, top_k=None, chunk_rows=CHUNK_ROWS):
+    '''
+    Rank a corpus by similarity to the inclusion centroids.
+
+    Returns: (article indices, scores), most similar first; only the top_k best if given.
+    '''
+    scores = similarity_scores(matrix, centroids, chunk_rows)
+    if top_k is not None and top_k < len(scores):
+        best = np.argpartition(-scores, top_k)[:top_k]
+        order = best[np.argsort(-scores[best], kind='stable')]
+    else:
+        order = np.argsort(-scores, kind='stable')
+    return np.asarray(ids)[order], scores[order]
+
+
+class FaissIndex:
+    '''
+    Inner-product FAISS index over unit-length embeddings; HNSW for approximate search of
+    large corpora, flat for exact search.
+    '''
+
+    def __init__(self, dim, hnsw_neighbours=32):
+        if faiss is None:
+            raise ImportError('faiss is not installed: pip install faiss-cpu')
+        if hnsw_neighbours:
+            self.index = faiss.IndexHNSWFlat(dim, hnsw_neighbours, faiss.METRIC_INNER_PRODUCT)
+        else:
+            self.index = faiss.IndexFlatIP(dim)
+
+    @classmethod
+    def from_matrix(cls, matrix, hnsw_neighbours=32, chunk_rows=CHUNK_ROWS):
+        index = cls(matrix.shape[1], hnsw_neighbours)
+        for start in range(0, len(matrix), chunk_rows):
+            index.index.add(np.ascontiguousarray(matrix[start:start + chunk_rows], dtype=np.float32))
+        return index
+
+    @classmethod
+    def load(cls, path):
+        index = cls.__new__(cls)
+        index.index = faiss.read_index(path)
+        return index
+
+    def save(self, path):
+        faiss.write_index(self.index, path)
+
+    def search(self, ids, centroids, top_k):
+        '''
+        Return (article indices, scores) of the top_k rows closest to any centroid, best first.
+        '''
+        scores, rows = self.index.search(normalize_rows(np.atleast_2d(centroids)), top_k)
+        best = {}
+        for row, score in zip(rows.ravel(), scores.ravel()):
+            if row >= 0 and score > best.get(row, -np.inf):
+                best[row] = score
+        order = sorted(best, key=best.get, reverse=True)[:top_k]
+        return np.asarray(ids)[order], np.asarray([best[row] for row in order], dtype=np.float32)
+
+
+def save_ranking(path, ranked_ids):
+    '''Save a ranking for screening_engine --priority.'''
+    np.save(path, np.asarray(ranked_ids, dtype=np.int64))
+
+
+if __name__ == '__main__':
+    # Rank an embedded corpus against accepted titles, e.g.
+    # python ranking.py corpus.f32 accepted_titles.txt ranking.npy
+    matrix_path, accepted_path, ranking_path = sys.argv[1:4]
+    with open(matrix_path + '.json') as f:
+        model_name = json.load(f)['model']
+    with open(accepted_path) as f:
+        accepted = [line.strip() for line in f if line.strip()]
+    centroid = calculate_centroid(normalize_rows(embed_texts(accepted, model_name)))
+    ranked, scores = rank_articles(open_embedding_matrix(matrix_path), article_ids(matrix_path), centroid)
+    save_ranking(ranking_path, ranked)
+    print(f'Ranked {len(ranked)} articles; top scores: {np.round(scores[:5], 3).tolist()}')
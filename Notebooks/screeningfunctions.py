@@ -1,18 +1,136 @@
 # Import necessary libraries
-from transformers import AutoTokenizer, AutoModel
-import torch
+# Embedding engine for screening by similarity: texts are tokenized once, embedded in
+# length-sorted batches under torch.inference_mode with attention-mask mean pooling, and the
+# float32 vectors are cached on disk keyed by model name and text hash.
+import hashlib
+import sqlite3
 import numpy as np
-tokenizer = AutoTokenizer.from_pretrained('bert-base-uncased')
-model = AutoModel.from_pretrained('bert-base-uncased')
 
-def get_embedding(text):
+MODEL_NAME = 'bert-base-uncased'
+BATCH_SIZE = 32
+MAX_LENGTH = 512
+EMBEDDING_CACHE_PATH = 'embedding_cache.sqlite'
+
+_models = {}  # model name -> (tokenizer, model), loaded on first use
+
+
+def load_model(model_name=MODEL_NAME):
+    '''
+    Load a tokenizer and model once per process, in evaluation mode.
+    transformers and torch are only imported here, so importing this module stays cheap.
+    '''
+    if model_name not in _models:
+        from transformers import AutoTokenizer, AutoModel
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModel.from_pretrained(model_name)
+        model.eval()
+        _models[model_name] = (tokenizer, model)
+    return _models[model_name]
+
+
+def text_key(text, model_name=MODEL_NAME):
+    '''Cache key of one text embedded by one model.'''
+    return hashlib.sha256(f'{model_name}\x00{text}'.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    '''SQLite store of float32 embeddings keyed by text_key.'''
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)')
+        self._conn.commit()
+
+    def get_many(self, keys, chunk_size=900):
+        '''Return {key: vector} for the keys that are cached.'''
+        found = {}
+        for start in range(0, len(keys), chunk_size):
+            chunk = keys[start:start + chunk_size]
+            rows = self._conn.execute(
+                f'SELECT key, vector FROM embeddings WHERE key IN ({",".join("?" * len(chunk))})', chunk)
+            for key, vector in rows:
+                found[key] = np.frombuffer(vector, dtype=np.float32)
+        return found
+
+    def put_many(self, keys, vectors):
+        self._conn.executemany('INSERT OR REPLACE INTO embeddings VALUES (?, ?)',
+                               ((key, np.ascontiguousarray(vector, dtype=np.float32).tobytes())
+                                for key, vector in zip(keys, vectors)))
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+
+def _embed(texts, model_name, batch_size, max_length):
+    '''Embed texts with the model; returns a float32 matrix in the order of texts.'''
+    import torch
+    tokenizer, model = load_model(model_name)
+    # Tokenize everything in one call, then pad per batch of similar lengths so little
+    # compute is spent on padding
+    encoded = tokenizer(texts, truncation=True, max_length=max_length)
+    features = [{name: encoded[name][i] for name in encoded.keys()} for i in range(len(texts))]
+    order = np.argsort([len(feature['input_ids']) for feature in features], kind='stable')
+    embeddings = np.empty((len(texts), model.config.hidden_size), dtype=np.float32)
+    with torch.inference_mode():
+        for start in range(0, len(order), batch_size):
+            rows = order[start:start + batch_size]
+            batch = tokenizer.pad([features[row] for row in rows], return_tensors='pt')
+            hidden = model(**batch).last_hidden_state
+            # Mean over real tokens only: padding positions are masked out
+            mask = batch['attention_mask'].unsqueeze(-1).to(hidden.dtype)
+            pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+            embeddings[rows] = pooled.float().numpy()
+    return embeddings
+
+
+def embed_texts(texts, model_name=MODEL_NAME, batch_size=BATCH_SIZE, max_length=MAX_LENGTH,
+                cache_path=EMBEDDING_CACHE_PATH):
+    '''
+    Embed a list of texts (titles or abstracts).
+
+    Parameters:
+    texts - list of strings.
+    model_name - Hugging Face model, e.g. bert-base-uncased or dmis-lab/biobert-v1.1.
+    batch_size - texts per forward pass.
+    max_length - tokens kept per text.
+    cache_path - SQLite embedding cache, None to always run the model.
+
+    Returns: contiguous float32 NumPy array of shape (len(texts), hidden size).
+    '''
+    texts = ['' if text is None else str(text) for text in texts]
+    unique = list(dict.fromkeys(texts))
+    keys = [text_key(text, model_name) for text in unique]
+    cache = EmbeddingCache(cache_path) if cache_path else None
+    try:
+        vectors = cache.get_many(keys) if cache is not None else {}
+        missing = [i for i, key in enumerate(keys) if key not in vectors]
+        if missing:
+            computed = _embed([unique[i] for i in missing], model_name, batch_size, max_length)
+            missing_keys = [keys[i] for i in missing]
+            vectors.update(zip(missing_keys, computed))
+            if cache is not None:
+                cache.put_many(missing_keys, computed)
+    finally:
+        if cache is not None:
+            cache.close()
+    row_of = {text: vectors[key] for text, key in zip(unique, keys)}
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.ascontiguousarray(np.stack([row_of[text] for text in texts]), dtype=np.float32)
+
+
+def get_embedding(text, model_name=MODEL_NAME):
     '''
-    The function takes in text, a tokenizer, model and arguments for the pretrained tokenizer.
-    The functions process the parameters and returns embeddings
+    The function takes in text, or a list of texts, and returns their mean-pooled embeddings:
+    a 1-D float32 array for a single text, a 2-D array with one row per text for a list.
     '''
-    inputs = tokenizer(text,padding=True,truncation=True, return_tensors='pt')
-    outputs = model(**inputs)
-    return outputs.last_hidden_state.mean(dim=1).detach().numpy
+    if isinstance(text, str):
+        return embed_texts([text], model_name)[0]
+    return embed_texts(list(text), model_name)
+
 
 def calculate_centroid(embeddings):
-    return np.mean(embeddings,axis = 0)
\ No newline at end of file
+    return np.mean(np.asarray(embeddings, dtype=np.float32), axis=0)
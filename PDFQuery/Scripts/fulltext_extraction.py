@@ -0,0 +1,318 @@
+# Batch full-text data extraction: a fixed set of questions asked of every paper in a PDF index.
+# Retrieval is restricted to the paper being asked about (the multipdfquery notebook searched
+# one store of all papers, so answers mixed chunks from different studies) and combines BM25 with
+# embeddings (hybrid_search), every question is embedded once for all papers, and the
+# question/paper calls run concurrently through the screening pipeline's backend, rate limiter
+# and response cache (Scripts/). The result is one table per paper plus a summary with one row
+# per paper and one column per question.
+#   python fulltext_extraction.py pdf_index ../Data/Raw --out extraction
+import os
+import sys
+import csv
+import json
+import time
+import asyncio
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Scripts"))
+from pdf_ingest import PDFIndex, make_embedder, pdf_paths, INDEX_DIR, TOP_K
+from hybrid_search import HybridRetriever, MODES
+from llm_backends import make_backend
+from rate_limiter import RateLimitScheduler, REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE
+from response_cache import ResponseCache, cache_key, CACHE_PATH
+from response_schema import reply_text, parse_reply
+from prompt_registry import MODEL
+
+OUTPUT_DIR = "fulltext_extraction"
+MAX_IN_FLIGHT = 8
+CALL_TIMEOUT = 120      # seconds allowed for a single API call before it is retried
+TEMPERATURE = 0         # extraction should be repeatable
+ANSWER_TOKENS = 300     # completion limit per answer
+PROMPT_VERSION = "fulltext-qa-1"  # part of the cache key; change it when the prompt template changes
+NOT_REPORTED = "Not reported"
+
+# Column name -> question asked of every paper; replace with --questions questions.json
+QUESTIONS = {
+    "aim": "What is the aim of this study?",
+    "design": "What is the study design (e.g. two-sample Mendelian randomisation, randomised controlled trial, cohort)?",
+    "population": "Which populations, cohorts, consortia or biobanks were used, and what were the sample sizes?",
+    "exposure": "What is the exposure and how was it measured or instrumented?",
+    "outcome": "What is the outcome and how was it defined?",
+    "instruments": "Which genetic variants (SNPs) were used as instruments, how were they selected and how strong were they (e.g. F-statistic)?",
+    "methods": "Which statistical methods were used (e.g. IVW, MR-Egger, weighted median, sensitivity analyses)?",
+    "main_result": "What is the main result, with effect sizes and confidence intervals?",
+    "conclusion": "What do the authors conclude?",
+}
+
+SYSTEM_MESSAGE = ("You are an expert in biomedical text analysis extracting data from research papers. "
+                  "Answer only from the excerpts given. Return valid JSON ONLY.")
+
+
+def construct_prompt(question, chunks):
+    """
+    Question plus the paper's most relevant excerpts, each labelled with its page.
+
+    Parameters:
+    question - question text.
+    chunks - chunk records from PDFIndex.chunks.
+
+    Returns: prompt asking for {"answer": ..., "quote": ...}.
+    """
+    excerpts = "\n\n".join(f"[page {chunk['page']}]\n{chunk['text']}" for chunk in chunks)
+    return f"""Excerpts from a research paper:
+
+{excerpts}
+
+Question: {question}
+
+Answer concisely from the excerpts only. If they do not answer the question, answer "{NOT_REPORTED}".
+Return JSON: {{"answer": "<answer>", "quote": "<shortest supporting sentence from the excerpts, or empty>"}}"""
+
+
+def embed_questions(index, questions):
+    """Embed every question (new ones in one embedder call); returns a (questions, dim) matrix of unit vectors."""
+    return index.embed_queries(list(questions.values()))
+
+
+def retrieve(index, doc_hash, questions, question_vectors, k=TOP_K, retriever=None):
+    """
+    Top-k chunks of one paper for every question.
+
+    Parameters:
+    questions - column name -> question.
+    question_vectors - embed_questions matrix, or None for lexical retrieval.
+    retriever - hybrid_search.HybridRetriever; without one the paper's chunks are scored
+                against all question vectors in one matrix product (vector search only).
+
+    Returns: list (one per question) of chunk records with a score, best first.
+    """
+    if retriever is not None:
+        vectors = question_vectors if question_vectors is not None else [None] * len(questions)
+        return [retriever.search(question, k, [doc_hash], vector)
+                for question, vector in zip(questions.values(), vectors)]
+    rows = index.document_rows([doc_hash])
+    if not len(rows):
+        return [[] for _ in question_vectors]
+    scores = np.asarray(index.matrix()[rows]) @ question_vectors.T  # (chunks, questions)
+    retrieved = []
+    for column in scores.T:
+        best = np.argsort(-column, kind="stable")[:k]
+        chunks = index.chunks(rows[best])
+        for chunk, score in zip(chunks, column[best]):
+            chunk["score"] = float(score)
+        retrieved.append(chunks)
+    return retrieved
+
+
+async def answer_question(backend, scheduler, cache, prompt, timeout=CALL_TIMEOUT):
+    """
+    Ask one question of one paper, through the response cache and the rate limiter.
+
+    Returns: dict with answer and quote, or None if no valid JSON answer came back.
+    """
+    model = backend.model or MODEL
+    key = cache_key(prompt, SYSTEM_MESSAGE, model, TEMPERATURE, PROMPT_VERSION)
+    cached = cache.get(key) if cache is not None else None
+    if cached is not None:
+        return cached
+
+    async def request():
+        return await asyncio.wait_for(backend.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": SYSTEM_MESSAGE},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=TEMPERATURE,
+            max_tokens=ANSWER_TOKENS,
+            response_format={"type": "json_object"}
+        ), timeout)
+
+    response = await scheduler.run(request, prompt, ANSWER_TOKENS)
+    data = parse_reply(reply_text(response.choices[0].message))
+    if not isinstance(data, dict) or not isinstance(data.get("answer"), str):
+        return None
+    data = {"answer": data["answer"].strip(), "quote": str(data.get("quote") or "").strip()}
+    if cache is not None:
+        cache.put(key, data)
+    return data
+
+
+async def extract_async(index, documents, questions=QUESTIONS, backend=None, scheduler=None, cache=None,
+                        k=TOP_K, max_in_flight=MAX_IN_FLIGHT, timeout=CALL_TIMEOUT, retrieval="hybrid"):
+    """
+    Ask every question of every paper concurrently.
+
+    Parameters:
+    index - PDFIndex holding the papers.
+    documents - doc_hash -> paper name of the papers to extract from.
+    questions - column name -> question.
+    backend - llm_backends backend; scheduler - RateLimitScheduler; cache - ResponseCache or None.
+    max_in_flight - questions awaiting an answer at once.
+    retrieval - "hybrid" (BM25 fused with vectors), "lexical" (BM25 only, no embeddings) or "vector".
+                Hybrid falls back to lexical if the questions cannot be embedded (e.g. offline).
+
+    Returns: doc_hash -> {column: dict of question, answer, quote, pages, chunks, score, error}.
+    """
+    retriever = HybridRetriever(index, retrieval) if retrieval != "vector" else None
+    # One embedding per question, shared by all papers
+    vectors = None
+    if retrieval != "lexical":
+        try:
+            vectors = embed_questions(index, questions)
+        except Exception as e:
+            if retrieval == "vector":
+                raise
+            # Without question vectors every search would retry the embedder; use BM25 alone
+            print(f"WARNING: Could not embed the questions, using BM25 only - {e!r}")
+            retriever.mode = "lexical"
+    semaphore = asyncio.Semaphore(max_in_flight)
+    results = {doc_hash: {} for doc_hash in documents}
+
+    async def ask(doc_hash, column, question, chunks):
+        record = {"question": question, "answer": None, "quote": "",
+                  "pages": " ".join(str(page) for page in sorted({chunk["page"] for chunk in chunks})),
+                  "chunks": " ".join(str(chunk["row"]) for chunk in chunks),
+                  "score": round(chunks[0]["score"], 4) if chunks else None, "error": None}
+        results[doc_hash][column] = record
+        if not chunks:
+            record["error"] = "no text extracted"
+            return
+        async with semaphore:
+            try:
+                data = await answer_question(backend, scheduler, cache, construct_prompt(question, chunks), timeout)
+            except Exception as e:
+                print(f"ERROR: Failed to query OpenAI for {documents[doc_hash]} / {column} - {e!r}")
+                record["error"] = repr(e)
+                return
+        if data is None:
+            record["error"] = "invalid JSON response"
+        else:
+            record.update(data)
+
+    tasks = []
+    for doc_hash in documents:
+        retrieved = retrieve(index, doc_hash, questions, vectors, k, retriever)
+        tasks.extend(ask(doc_hash, column, question, chunks)
+                     for (column, question), chunks in zip(questions.items(), retrieved))
+    await asyncio.gather(*tasks)
+    return results
+
+
+def _table_name(name, doc_hash):
+    stem = os.path.splitext(name)[0]
+    return "".join(c if c.isalnum() or c in "-_" else "_" for c in stem) + f"_{doc_hash[:8]}.csv"
+
+
+def write_tables(results, documents, questions, out_dir=OUTPUT_DIR):
+    """
+    Write one CSV per paper (a row per question) and summary.csv (a row per paper, a column per question).
+
+    Returns: path of summary.csv.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    fields = ["column", "question", "answer", "quote", "pages", "chunks", "score", "error"]
+    summary = []
+    for doc_hash, name in documents.items():
+        answers = results[doc_hash]
+        table = _table_name(name, doc_hash)
+        with open(os.path.join(out_dir, table), "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            for column in questions:
+                writer.writerow({"column": column, **answers[column]})
+        summary.append({"paper": name, "doc_hash": doc_hash, "table": table,
+                        **{column: answers[column]["answer"] for column in questions}})
+    path = os.path.join(out_dir, "summary.csv")
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["paper", "doc_hash", "table", *questions])
+        writer.writeheader()
+        writer.writerows(summary)
+    return path
+
+
+def run_extraction(index_dir=INDEX_DIR, pdfs=None, questions=QUESTIONS, out_dir=OUTPUT_DIR, backend="openai",
+                   model=None, embedder=None, k=TOP_K, max_in_flight=MAX_IN_FLIGHT, cache_path=CACHE_PATH,
+                   requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE, workers=None,
+                   retrieval="hybrid"):
+    """
+    Full-text extraction pipeline: index the PDFs (new ones only), answer every question for
+    every paper and write the tables.
+
+    Parameters:
+    index_dir - pdf_ingest index folder.
+    pdfs - PDF files/folders to add and extract from; every paper in the index if None.
+    questions - column name -> question.
+    out_dir - folder for the per-paper tables and summary.csv.
+    backend, model - llm_backends.make_backend settings.
+    embedder - pdf_ingest embedder spec for a new index (e.g. "local"), default the index's own.
+    cache_path - response cache; re-running unchanged questions on unchanged papers costs nothing. None disables it.
+    retrieval - "hybrid", "lexical" or "vector" (see extract_async).
+
+    Returns: doc_hash -> {column: answer record} (see extract_async).
+    """
+    start = time.perf_counter()
+    index = PDFIndex(index_dir, make_embedder(embedder) if embedder else None)
+    try:
+        if pdfs:
+            print(f"Index update: {index.add(pdfs, workers=workers)}")
+            wanted = {index.hash_file(path) for path in pdf_paths(pdfs)}
+        else:
+            wanted = None
+        # Without PDFs, every paper an indexed file still points at (not replaced or deleted ones)
+        documents = {doc_hash: name for doc_hash, name, pages, n_chunks, error in index.documents(live=wanted is None)
+                     if wanted is None or doc_hash in wanted}
+        print(f"Asking {len(questions)} questions of {len(documents)} papers")
+        llm = make_backend(backend, model)
+        scheduler = RateLimitScheduler(requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute,
+                                       completion_tokens=ANSWER_TOKENS, model=llm.model or MODEL)
+        cache = ResponseCache(cache_path) if cache_path else None
+
+        async def extract():
+            try:
+                return await extract_async(index, documents, questions, llm, scheduler, cache, k, max_in_flight,
+                                           retrieval=retrieval)
+            finally:
+                await llm.aclose()
+
+        try:
+            results = asyncio.run(extract())
+        finally:
+            if cache is not None:
+                print(f"Response cache summary: {cache.report()}")
+                cache.close()
+    finally:
+        index.close()
+    path = write_tables(results, documents, questions, out_dir)
+    failed = sum(record["error"] is not None for answers in results.values() for record in answers.values())
+    print(f"Wrote {len(documents)} paper tables and {path} in {time.perf_counter() - start:.1f}s "
+          f"({failed} unanswered); {llm.report()}; rate limiter: {scheduler.stats()}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ask a fixed set of questions of every paper in a PDF index.")
+    parser.add_argument("index", help="pdf_ingest index folder")
+    parser.add_argument("pdfs", nargs="*", help="PDFs or folders to add and extract from (default: every indexed paper)")
+    parser.add_argument("--questions", default=None, help='JSON file of {"column": "question"} (default: QUESTIONS)')
+    parser.add_argument("--out", default=OUTPUT_DIR, help="output folder")
+    parser.add_argument("--backend", default="openai", choices=["openai", "local", "recorded"])
+    parser.add_argument("--model", default=None, help=f"chat model (default {MODEL})")
+    parser.add_argument("--embedder", default=None, help="embedder of a new index, openai:MODEL or local:MODEL")
+    parser.add_argument("--k", type=int, default=TOP_K, help="chunks retrieved per question and paper")
+    parser.add_argument("--retrieval", default="hybrid", choices=MODES,
+                        help="BM25 fused with embeddings, BM25 only (no embedding calls) or embeddings only")
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT)
+    parser.add_argument("--rpm", type=int, default=REQUESTS_PER_MINUTE, help="requests per minute limit")
+    parser.add_argument("--tpm", type=int, default=TOKENS_PER_MINUTE, help="tokens per minute limit")
+    parser.add_argument("--no-cache", action="store_true", help="do not use the response cache")
+    args = parser.parse_args()
+
+    questions = QUESTIONS
+    if args.questions:
+        with open(args.questions) as f:
+            questions = json.load(f)
+    run_extraction(args.index, args.pdfs or None, questions, args.out, args.backend, args.model, args.embedder,
+                   args.k, args.max_in_flight, None if args.no_cache else CACHE_PATH, args.rpm, args.tpm,
+                   retrieval=args.retrieval)
@@ -0,0 +1,323 @@
+# Hybrid lexical + semantic retrieval over the chunks of a pdf_ingest index.
+# Dense embeddings alone miss exact technical terms that full-text screening of MR papers turns
+# on ("IVW", "MR-Egger", SNP rsIDs, "F-statistic"), so a local BM25 index over the same chunks
+# is searched first and its ranking is fused with the vector ranking by reciprocal rank fusion
+# (RRF). The BM25 index lives next to the vectors (INDEX_DIR/bm25) and is updated incrementally:
+# chunks added to the PDF index since the last update become a new immutable segment of
+# array-backed postings (term ids, offsets, chunk rows, term frequencies as NumPy arrays), and
+# segments are merged into one when there are more than MAX_SEGMENTS.
+import os
+import re
+import json
+import time
+import argparse
+import collections
+import numpy as np
+
+from pdf_ingest import PDFIndex, make_embedder, TOP_K
+
+K1 = 1.2          # BM25 term frequency saturation
+B = 0.75          # BM25 document length normalisation
+RRF_K = 60        # reciprocal rank fusion constant: fused score = sum of 1 / (RRF_K + rank)
+CANDIDATES = 50   # chunks taken from each ranking into the fusion
+MAX_SEGMENTS = 8  # postings segments kept before they are merged into one
+MODES = ("hybrid", "lexical", "vector")
+
+# Words joined by hyphens or slashes are kept whole ("mr-egger") as well as split ("mr", "egger")
+TOKEN = re.compile(r"\w+(?:[-/]\w+)*")
+STOPWORDS = frozenset("""a an and are as at be been but by for from had has have in into is it its of on or
+that the their there these this those to was were which with within""".split())
+
+
+def tokenize(text):
+    """Lower-case terms of a text for BM25: words, numbers, rsIDs and hyphenated terms with their parts."""
+    tokens = []
+    for match in TOKEN.findall(text.lower()):
+        if match not in STOPWORDS:
+            tokens.append(match)
+        if "-" in match or "/" in match:
+            tokens.extend(part for part in re.split(r"[-/]", match) if part and part not in STOPWORDS)
+    return tokens
+
+
+class BM25Index:
+    """
+    Incrementally built BM25 index over the chunk rows of a PDFIndex, stored in a folder:
+      meta.json      - rows and terms covered, segment files
+      vocabulary.txt - one term per line, the line number is the term id (append-only)
+      lengths.u32    - tokens per chunk row (append-only)
+      seg_NNNNNN.npz - postings: sorted term ids, offsets into rows/tfs, chunk rows, term frequencies
+    New files are written before meta.json is replaced, and anything meta.json does not cover
+    is dropped on open, so an interrupted update leaves the previous index intact.
+
+    Parameters:
+    directory - index folder, created if missing.
+    """
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.meta_path = os.path.join(directory, "meta.json")
+        self.vocabulary_path = os.path.join(directory, "vocabulary.txt")
+        self.lengths_path = os.path.join(directory, "lengths.u32")
+        meta = {"rows": 0, "terms": 0, "segments": [], "next_segment": 0}
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                meta.update(json.load(f))
+        self.rows = meta["rows"]
+        self.next_segment = meta["next_segment"]
+        terms = []
+        if os.path.exists(self.vocabulary_path):
+            with open(self.vocabulary_path, encoding="utf-8") as f:
+                terms = f.read().split("\n")[:meta["terms"]]
+        self._rewrite(self.vocabulary_path, "".join(term + "\n" for term in terms).encode("utf-8"))
+        self.vocabulary = {term: i for i, term in enumerate(terms)}
+        self.lengths = np.fromfile(self.lengths_path, dtype=np.uint32)[:self.rows] \
+            if os.path.exists(self.lengths_path) else np.empty(0, dtype=np.uint32)
+        self._rewrite(self.lengths_path, self.lengths.tobytes())
+        self.segments = [(name, self._load_segment(name)) for name in meta["segments"]]
+        for name in os.listdir(directory):  # segments of an interrupted update or merge
+            if name.startswith("seg_") and name not in meta["segments"]:
+                os.remove(os.path.join(directory, name))
+        self._count_documents()
+
+    @staticmethod
+    def _rewrite(path, data):
+        if not os.path.exists(path) or os.path.getsize(path) != len(data):
+            with open(path, "wb") as f:
+                f.write(data)
+
+    def _load_segment(self, name):
+        with np.load(os.path.join(self.directory, name)) as segment:
+            return {key: segment[key] for key in ("terms", "offsets", "rows", "tfs")}
+
+    def _count_documents(self):
+        """Document frequency of every term, summed over the segments."""
+        self.df = np.zeros(len(self.vocabulary), dtype=np.int64)
+        for _, segment in self.segments:
+            np.add.at(self.df, segment["terms"], np.diff(segment["offsets"]))
+        self.average_length = float(self.lengths.mean()) if len(self.lengths) else 0.0
+
+    def _save_meta(self):
+        meta = {"rows": self.rows, "terms": len(self.vocabulary), "next_segment": self.next_segment,
+                "segments": [name for name, _ in self.segments]}
+        with open(self.meta_path + ".tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(self.meta_path + ".tmp", self.meta_path)
+
+    def _write_segment(self, term_ids, rows, tfs):
+        """Sort postings by term then row into a segment file; returns (name, arrays)."""
+        order = np.lexsort((rows, term_ids))
+        term_ids, rows, tfs = term_ids[order], rows[order], tfs[order]
+        terms, starts = np.unique(term_ids, return_index=True)
+        segment = {"terms": terms.astype(np.int32), "offsets": np.append(starts, len(term_ids)).astype(np.int64),
+                   "rows": rows.astype(np.uint32), "tfs": tfs.astype(np.uint16)}
+        name = f"seg_{self.next_segment:06d}.npz"
+        self.next_segment += 1
+        np.savez(os.path.join(self.directory, name), **segment)
+        return name, segment
+
+    def update(self, pdf_index):
+        """
+        Index the chunks added to pdf_index since the last update (all of them the first time).
+
+        Returns: number of chunks indexed.
+        """
+        if self.rows > pdf_index.rows:
+            raise ValueError(f"{self.directory} covers {self.rows} chunks but the PDF index only has "
+                             f"{pdf_index.rows}; delete the folder to rebuild it")
+        added = 0
+        new_terms = []
+        term_ids, rows, tfs, lengths = [], [], [], []
+        for batch in pdf_index.iter_chunks(self.rows):
+            for row, text in batch:
+                tokens = tokenize(text)
+                lengths.append(len(tokens))
+                for term, tf in collections.Counter(tokens).items():
+                    term_id = self.vocabulary.get(term)
+                    if term_id is None:
+                        term_id = self.vocabulary[term] = len(self.vocabulary)
+                        new_terms.append(term)
+                    term_ids.append(term_id)
+                    rows.append(row)
+                    tfs.append(min(tf, np.iinfo(np.uint16).max))
+            added += len(batch)
+        if not added:
+            return 0
+        self.segments.append(self._write_segment(np.asarray(term_ids, dtype=np.int64),
+                                                 np.asarray(rows, dtype=np.int64), np.asarray(tfs, dtype=np.int64)))
+        with open(self.vocabulary_path, "a", encoding="utf-8") as f:
+            f.write("".join(term + "\n" for term in new_terms))
+        with open(self.lengths_path, "ab") as f:
+            f.write(np.asarray(lengths, dtype=np.uint32).tobytes())
+        self.lengths = np.concatenate([self.lengths, np.asarray(lengths, dtype=np.uint32)])
+        self.rows += added
+        self._save_meta()
+        if len(self.segments) > MAX_SEGMENTS:
+            self.merge()
+        self._count_documents()
+        return added
+
+    def merge(self):
+        """Merge all segments into one, so a query looks each term up once."""
+        old = [name for name, _ in self.segments]
+        term_ids = np.concatenate([np.repeat(s["terms"], np.diff(s["offsets"])) for _, s in self.segments])
+        rows = np.concatenate([s["rows"] for _, s in self.segments])
+        tfs = np.concatenate([s["tfs"] for _, s in self.segments])
+        self.segments = [self._write_segment(term_ids, rows, tfs)]
+        self._save_meta()
+        for name in old:
+            os.remove(os.path.join(self.directory, name))
+
+    def postings(self, term):
+        """(rows, tfs) of a term across all segments, empty arrays for an unknown term."""
+        term_id = self.vocabulary.get(term)
+        rows, tfs = [], []
+        if term_id is not None:
+            for _, segment in self.segments:
+                i = np.searchsorted(segment["terms"], term_id)
+                if i < len(segment["terms"]) and segment["terms"][i] == term_id:
+                    start, end = segment["offsets"][i], segment["offsets"][i + 1]
+                    rows.append(segment["rows"][start:end])
+                    tfs.append(segment["tfs"][start:end])
+        if not rows:
+            return np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.uint16)
+        return np.concatenate(rows), np.concatenate(tfs)
+
+    def scores(self, query, rows=None, live=None):
+        """
+        BM25 scores of the chunks containing at least one query term.
+
+        Parameters:
+        rows - only score these chunk rows (e.g. PDFIndex.document_rows), all rows if None.
+        live - boolean mask of rows that may be returned (PDFIndex.live_rows), or None.
+
+        Returns: (rows, scores) as NumPy arrays, in row order.
+        """
+        matched, weights = [], []
+        for term in dict.fromkeys(tokenize(query)):
+            posting_rows, tfs = self.postings(term)
+            if rows is not None:
+                keep = np.isin(posting_rows, rows)
+                posting_rows, tfs = posting_rows[keep], tfs[keep]
+            if live is not None:
+                keep = live[posting_rows]
+                posting_rows, tfs = posting_rows[keep], tfs[keep]
+            if not len(posting_rows):
+                continue
+            df = self.df[self.vocabulary[term]]
+            idf = np.log(1 + (self.rows - df + 0.5) / (df + 0.5))
+            tfs = tfs.astype(np.float32)
+            norm = K1 * (1 - B + B * self.lengths[posting_rows] / max(self.average_length, 1e-9))
+            matched.append(posting_rows)
+            weights.append(idf * tfs * (K1 + 1) / (tfs + norm))
+        if not matched:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        unique, inverse = np.unique(np.concatenate(matched), return_inverse=True)
+        return unique.astype(np.int64), np.bincount(inverse, weights=np.concatenate(weights)).astype(np.float32)
+
+
+def top_rows(rows, scores, n):
+    """The n best-scoring rows, best first (ties in row order)."""
+    best = np.argsort(-scores, kind="stable")[:n]
+    return rows[best], scores[best]
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """
+    Fuse rankings (lists of rows, best first) into one: each row scores the sum of
+    1 / (k + rank) over the rankings it appears in (rank from 1). Ties go to the row ranked
+    higher by the earlier ranking, so listing the lexical ranking first makes retrieval lexical-first.
+
+    Returns: list of (row, fused score), best first.
+    """
+    fused = {}
+    for position, ranking in enumerate(rankings):
+        for rank, row in enumerate(ranking, start=1):
+            score, order = fused.get(row, (0.0, (position, rank)))
+            fused[row] = (score + 1.0 / (k + rank), order)
+    return [(row, score) for row, (score, _) in sorted(fused.items(), key=lambda item: (-item[1][0], item[1][1]))]
+
+
+class HybridRetriever:
+    """
+    BM25 and vector search over a PDFIndex, fused with RRF.
+
+    Parameters:
+    index - PDFIndex; its BM25 index (INDEX_DIR/bm25) is brought up to date on construction.
+    mode - "hybrid", "lexical" (BM25 only: no embedding call) or "vector" (embeddings only).
+    candidates - chunks taken from each ranking into the fusion.
+    """
+
+    def __init__(self, index, mode="hybrid", candidates=CANDIDATES):
+        if mode not in MODES:
+            raise ValueError(f"Unknown retrieval mode {mode!r}; use {', '.join(MODES)}")
+        self.index = index
+        self.mode = mode
+        self.candidates = candidates
+        self.bm25 = BM25Index(os.path.join(index.directory, "bm25"))
+        self.update()
+
+    def update(self):
+        """Index the chunks added to the PDF index since the last update; returns the number indexed."""
+        added = self.bm25.update(self.index)
+        if added:
+            print(f"BM25 index: {added} chunks added, {self.bm25.rows} chunks, {len(self.bm25.vocabulary)} terms")
+        return added
+
+    def search(self, query, k=TOP_K, doc_hashes=None, vector=None):
+        """
+        Best chunks for a query: the BM25 ranking is computed first (locally), then fused with the
+        vector ranking unless the mode is lexical. If the query cannot be embedded (e.g. offline),
+        the lexical ranking is used alone.
+
+        Parameters:
+        query - question text.
+        k - chunks to return.
+        doc_hashes - restrict the search to these documents.
+        vector - precomputed query embedding (PDFIndex.embed_queries), saves an embedder call.
+
+        Returns: list of chunk records (PDFIndex.chunks) with score (fused), lexical_rank and vector_rank.
+        """
+        rows = self.index.document_rows(doc_hashes) if doc_hashes else None
+        live = None if rows is not None else self.index.live_rows()
+        rankings = {}
+        if self.mode != "vector":
+            rankings["lexical"] = top_rows(*self.bm25.scores(query, rows, live), self.candidates)[0].tolist()
+        if self.mode != "lexical":
+            try:
+                if vector is None:
+                    vector = self.index.embed_query(query)
+                vector_rows, scores = self.index.vector_scores(vector, rows)
+                rankings["vector"] = top_rows(vector_rows, scores, self.candidates)[0].tolist()
+            except Exception as e:
+                if self.mode == "vector":
+                    raise
+                print(f"WARNING: Vector search failed, using BM25 only - {e!r}")
+        fused = reciprocal_rank_fusion(list(rankings.values()))[:k]
+        results = self.index.chunks([row for row, _ in fused])
+        ranks = {name: {row: rank for rank, row in enumerate(ranking, start=1)} for name, ranking in rankings.items()}
+        for result, (row, score) in zip(results, fused):
+            result["score"] = score
+            result["lexical_rank"] = ranks.get("lexical", {}).get(row)
+            result["vector_rank"] = ranks.get("vector", {}).get(row)
+        return results
+
+
+if __name__ == "__main__":
+    # Search an index built by pdf_ingest.py, e.g. python hybrid_search.py pdf_index "MR-Egger intercept"
+    parser = argparse.ArgumentParser(description="Hybrid BM25 + vector search over a PDF index.")
+    parser.add_argument("index", help="pdf_ingest index folder")
+    parser.add_argument("query", help="question or search terms")
+    parser.add_argument("--mode", default="hybrid", choices=MODES)
+    parser.add_argument("--k", type=int, default=TOP_K, help="chunks to return")
+    parser.add_argument("--embedder", default=None, help="embedder spec if the index does not record one")
+    args = parser.parse_args()
+
+    with PDFIndex(args.index, make_embedder(args.embedder) if args.embedder else None) as index:
+        start = time.perf_counter()
+        retriever = HybridRetriever(index, args.mode)
+        for result in retriever.search(args.query, args.k):
+            print(f"{result['score']:.4f} (bm25 #{result['lexical_rank']}, vector #{result['vector_rank']}) "
+                  f"{result['name']} p.{result['page']}: {result['text'][:200]!r}")
+        print(f"{time.perf_counter() - start:.3f}s")
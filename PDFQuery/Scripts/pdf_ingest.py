@@ -0,0 +1,494 @@
+# Full-text ingestion of PDFs into a persistent, incrementally updated vector index.
+# PDFs are parsed and chunked page by page in a process pool, chunks are embedded in batches
+# (OpenAI embeddings or a local Hugging Face model) and appended to an on-disk index:
+#   INDEX_DIR/chunks.sqlite - files (path, size, mtime -> content hash), documents and chunk texts
+#   INDEX_DIR/vectors.f32   - float32 matrix of unit-length chunk embeddings, one row per chunk
+# Documents are keyed by the sha256 of the file contents, so an unchanged (or renamed/copied)
+# PDF is never parsed or embedded again, and unchanged files are recognised by size and mtime
+# without being read. Adding one PDF to a large library only parses and embeds that PDF.
+import os
+import sys
+import time
+import hashlib
+import sqlite3
+import argparse
+import collections
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+INDEX_DIR = "pdf_index"
+CHUNK_SIZE = 1000     # characters per chunk, as in the PDFQuery notebooks
+CHUNK_OVERLAP = 200   # characters shared by neighbouring chunks
+SEPARATORS = ("\n\n", "\n", " ", "")  # split at paragraphs, then lines, then words, then anywhere
+EMBED_BATCH = 512     # chunks embedded and appended to the index at a time
+OPENAI_BATCH = 256    # inputs per embeddings API request
+TOP_K = 7             # chunks returned per query (the multipdfquery notebook's k)
+EMBEDDER = "openai:text-embedding-3-small"
+LOCAL_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+SEARCH_CHUNK_ROWS = 65536  # rows scored per matrix product in a full-index search
+
+NOTEBOOKS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Notebooks")
+
+
+def file_hash(path, block_size=1 << 20):
+    """Hex sha256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _pieces(text, chunk_size, separators):
+    """Split text at the first separator it contains, recursing into pieces still longer than chunk_size."""
+    separator = next((s for s in separators if s and s in text), "")
+    if not separator:
+        yield from (text[i:i + chunk_size] for i in range(0, len(text), chunk_size))
+        return
+    parts = text.split(separator)
+    finer = separators[separators.index(separator) + 1:]
+    for part in [part + separator for part in parts[:-1]] + [parts[-1]]:
+        if len(part) > chunk_size:
+            yield from _pieces(part, chunk_size, finer)
+        elif part:
+            yield part
+
+
+def split_text(text, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """
+    Split text into chunks of at most chunk_size characters, neighbouring chunks sharing up to
+    chunk_overlap characters, broken at paragraph, line or word boundaries where possible
+    (the scheme of the RecursiveCharacterTextSplitter used in the notebooks).
+
+    Returns: list of chunk strings.
+    """
+    chunks, window, length = [], collections.deque(), 0
+    for piece in _pieces(text, chunk_size, SEPARATORS):
+        if window and length + len(piece) > chunk_size:
+            chunk = "".join(window).strip()
+            if chunk:
+                chunks.append(chunk)
+            # Keep the tail of the window as the overlap with the next chunk
+            while window and (length > chunk_overlap or length + len(piece) > chunk_size):
+                length -= len(window.popleft())
+        window.append(piece)
+        length += len(piece)
+    chunk = "".join(window).strip()
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def parse_pdf(path, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """
+    Extract the text of a PDF page by page with PyMuPDF and chunk each page.
+    Runs in the worker processes of PDFIndex.add.
+
+    Returns: dict with pages (page count) and chunks, a list of (page number from 1, text).
+    """
+    try:
+        import pymupdf
+    except ImportError:  # PyMuPDF before 1.24 only provides the fitz name
+        import fitz as pymupdf
+    chunks = []
+    with pymupdf.open(path) as document:
+        for number, page in enumerate(document, start=1):
+            chunks.extend((number, text) for text in split_text(page.get_text("text"), chunk_size, chunk_overlap))
+        return {"pages": document.page_count, "chunks": chunks}
+
+
+def pdf_paths(paths):
+    """Expand files and folders (searched recursively) into a sorted list of PDF paths."""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                found.extend(os.path.join(root, name) for name in names if name.lower().endswith(".pdf"))
+        else:
+            found.append(path)
+    return sorted(dict.fromkeys(os.path.abspath(path) for path in found))
+
+
+def normalize_rows(matrix):
+    """L2-normalise the rows of a matrix (cosine similarity becomes a dot product); zero rows stay zero."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, np.finfo(np.float32).tiny)
+
+
+class OpenAIEmbedder:
+    """
+    OpenAI embeddings, OPENAI_BATCH texts per request.
+
+    Parameters:
+    model - embedding model.
+    api_key - API key, defaults to the UoB organisation key (else OPENAI_API_KEY) from the environment.
+    base_url - optional OpenAI-compatible endpoint.
+    """
+
+    def __init__(self, model="text-embedding-3-small", api_key=None, base_url=None):
+        self.model = model
+        self.name = f"openai:{model}"
+        self.api_key = api_key
+        self.base_url = base_url
+        self._client = None
+
+    def __call__(self, texts):
+        if self._client is None:
+            from openai import OpenAI
+            from dotenv import load_dotenv
+            load_dotenv()
+            api_key = self.api_key or os.getenv('openaiuob_api_key') or os.getenv('OPENAI_API_KEY')
+            self._client = OpenAI(api_key=api_key, base_url=self.base_url)
+        vectors = []
+        for start in range(0, len(texts), OPENAI_BATCH):
+            response = self._client.embeddings.create(model=self.model, input=texts[start:start + OPENAI_BATCH])
+            vectors.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+        return np.asarray(vectors, dtype=np.float32)
+
+
+class LocalEmbedder:
+    """
+    Local Hugging Face model run by Notebooks/screeningfunctions.embed_texts (batched,
+    mean-pooled, no network after the model download).
+
+    Parameters:
+    model - model name, e.g. sentence-transformers/all-MiniLM-L6-v2 or dmis-lab/biobert-v1.1.
+    """
+
+    def __init__(self, model=LOCAL_MODEL, batch_size=32):
+        self.model = model
+        self.name = f"local:{model}"
+        self.batch_size = batch_size
+
+    def __call__(self, texts):
+        if NOTEBOOKS_DIR not in sys.path:
+            sys.path.insert(0, NOTEBOOKS_DIR)
+        from screeningfunctions import embed_texts
+        # Chunks are cached by the index itself, so the text-level embedding cache is skipped
+        return embed_texts(texts, self.model, batch_size=self.batch_size, cache_path=None)
+
+
+def make_embedder(spec=EMBEDDER):
+    """Build an embedder from "openai:MODEL" or "local:MODEL" (a bare "local" uses LOCAL_MODEL)."""
+    kind, _, model = spec.partition(":")
+    if kind == "openai":
+        return OpenAIEmbedder(model or "text-embedding-3-small")
+    if kind == "local":
+        return LocalEmbedder(model or LOCAL_MODEL)
+    raise ValueError(f"Unknown embedder {spec!r}; use openai:MODEL or local:MODEL")
+
+
+class PDFIndex:
+    """
+    Persistent vector index of PDF chunks in a folder; see the top of this file for the layout.
+
+    Parameters:
+    directory - index folder, created if missing.
+    embedder - OpenAIEmbedder, LocalEmbedder or any callable mapping a list of texts to a
+               float32 matrix with a name attribute; defaults to the embedder the index was
+               built with (EMBEDDER for a new index). An index only holds one embedder's vectors.
+    """
+
+    def __init__(self, directory=INDEX_DIR, embedder=None):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self._conn = sqlite3.connect(os.path.join(directory, "chunks.sqlite"))
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                doc_hash TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS documents (
+                doc_hash TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                pages INTEGER NOT NULL,
+                first_row INTEGER NOT NULL,
+                n_chunks INTEGER NOT NULL,
+                error TEXT,
+                added REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS chunks (
+                row INTEGER PRIMARY KEY,
+                doc_hash TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                text TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS queries (text TEXT PRIMARY KEY, vector BLOB NOT NULL);
+        """)
+        self._conn.commit()
+        meta = dict(self._conn.execute("SELECT key, value FROM meta"))
+        self.dim = int(meta["dim"]) if "dim" in meta else None
+        self.embedder_name = meta.get("embedder")
+        if embedder is None:
+            embedder = make_embedder(self.embedder_name or EMBEDDER)
+        elif self.embedder_name is not None and embedder.name != self.embedder_name:
+            raise ValueError(f"Index {directory} holds {self.embedder_name} vectors, not {embedder.name}")
+        self.embedder = embedder
+        self.rows = self._conn.execute("SELECT COALESCE(MAX(first_row + n_chunks), 0) FROM documents").fetchone()[0]
+        # Vectors appended by an add that died before its commit are dropped
+        if self.dim is not None and os.path.exists(self.vectors_path):
+            if os.path.getsize(self.vectors_path) > self.rows * self.dim * 4:
+                with open(self.vectors_path, "r+b") as f:
+                    f.truncate(self.rows * self.dim * 4)
+        self._matrix = None
+        self._live = None
+
+    def add(self, paths, workers=None, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, batch_size=EMBED_BATCH):
+        """
+        Add PDFs to the index: only files whose contents are not indexed yet (or failed to parse) are
+        parsed and embedded.
+
+        Parameters:
+        paths - PDF files and/or folders of PDFs.
+        workers - parser processes (default: one per CPU); a single new PDF is parsed in this process.
+        batch_size - chunks embedded and committed to the index at a time.
+
+        Returns: counts of added, unchanged and failed files and of chunks embedded.
+        """
+        counts = {"added": 0, "unchanged": 0, "failed": 0, "chunks": 0}
+        todo = {}  # content hash -> path of the PDFs to parse
+        for path in pdf_paths(paths):
+            doc_hash = self.hash_file(path)
+            # A document whose parse failed has no chunks; it is parsed again and its row replaced
+            if doc_hash in todo or self._conn.execute("SELECT 1 FROM documents WHERE doc_hash = ? AND error IS NULL",
+                                                      (doc_hash,)).fetchone():
+                counts["unchanged"] += 1
+            else:
+                todo[doc_hash] = path
+        # Files deleted or moved since the last add no longer keep their document searchable
+        gone = [(path,) for path, in self._conn.execute("SELECT path FROM files") if not os.path.exists(path)]
+        if gone:
+            self._conn.executemany("DELETE FROM files WHERE path = ?", gone)
+            self._live = None
+        self._conn.commit()
+
+        pending = []
+        for doc_hash, path, parsed, error in self._parse(todo, workers, chunk_size, chunk_overlap):
+            counts["failed" if error else "added"] += 1
+            if error:
+                print(f"ERROR: Could not parse {path} - {error}")
+            pending.append((doc_hash, path, parsed, error))
+            if sum(len(item[2]["chunks"]) for item in pending) >= batch_size:
+                counts["chunks"] += self._commit(pending)
+                pending = []
+        counts["chunks"] += self._commit(pending)
+        return counts
+
+    def hash_file(self, path):
+        """Content hash of a file; recomputed only when its size or mtime changed since it was last seen."""
+        stat = os.stat(path)
+        row = self._conn.execute("SELECT size, mtime, doc_hash FROM files WHERE path = ?", (path,)).fetchone()
+        if row is not None and row[:2] == (stat.st_size, stat.st_mtime):
+            return row[2]
+        doc_hash = file_hash(path)
+        self._conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", (path, stat.st_size, stat.st_mtime, doc_hash))
+        self._live = None  # the path may now point at a different document
+        return doc_hash
+
+    def _parse(self, todo, workers, chunk_size, chunk_overlap):
+        """Yield (doc_hash, path, parsed, error) for every PDF in todo, parsed in a process pool."""
+        if len(todo) <= 1 or workers == 1:
+            for doc_hash, path in todo.items():
+                try:
+                    yield doc_hash, path, parse_pdf(path, chunk_size, chunk_overlap), None
+                except Exception as e:
+                    yield doc_hash, path, {"pages": 0, "chunks": []}, repr(e)
+            return
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(parse_pdf, path, chunk_size, chunk_overlap): (doc_hash, path)
+                       for doc_hash, path in todo.items()}
+            for future in as_completed(futures):
+                doc_hash, path = futures[future]
+                try:
+                    yield doc_hash, path, future.result(), None
+                except Exception as e:
+                    yield doc_hash, path, {"pages": 0, "chunks": []}, repr(e)
+
+    def _commit(self, documents):
+        """Embed the chunks of parsed documents, append their vectors and record them; returns the chunk count."""
+        if not documents:
+            return 0
+        texts = [text for _, _, parsed, _ in documents for _, text in parsed["chunks"]]
+        if texts:
+            vectors = normalize_rows(self.embedder(texts))
+            if self.dim is None:
+                self.dim, self.embedder_name = vectors.shape[1], self.embedder.name
+                self._conn.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                                       [("dim", str(self.dim)), ("embedder", self.embedder_name)])
+            # Vectors first: rows without a committed document are truncated on the next open
+            with open(self.vectors_path, "ab") as f:
+                f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        row = self.rows
+        now = time.time()
+        for doc_hash, path, parsed, error in documents:
+            chunks = parsed["chunks"]
+            self._conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)",
+                                   [(row + i, doc_hash, page, text) for i, (page, text) in enumerate(chunks)])
+            self._conn.execute("INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               (doc_hash, os.path.basename(path), parsed["pages"], row, len(chunks), error, now))
+            row += len(chunks)
+        self._conn.commit()
+        self.rows = row
+        self._matrix = self._live = None
+        return len(texts)
+
+    def matrix(self):
+        """Read-only memmap of all chunk vectors, shape (rows, dim)."""
+        if self._matrix is None:
+            if not self.rows:
+                return np.empty((0, self.dim or 0), dtype=np.float32)
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self.rows, self.dim))
+        return self._matrix
+
+    def live_rows(self):
+        """Boolean mask of rows belonging to a document that an indexed file path still points at."""
+        if self._live is None:
+            self._live = np.zeros(self.rows, dtype=bool)
+            for first_row, n_chunks in self._conn.execute(
+                    "SELECT first_row, n_chunks FROM documents WHERE doc_hash IN (SELECT doc_hash FROM files)"):
+                self._live[first_row:first_row + n_chunks] = True
+        return self._live
+
+    def documents(self, live=False):
+        """
+        Indexed documents as (doc_hash, name, pages, chunks, error) tuples, newest first.
+        live=True keeps only documents an indexed file path still points at (as live_rows does).
+        """
+        where = "WHERE doc_hash IN (SELECT doc_hash FROM files) " if live else ""
+        return self._conn.execute("SELECT doc_hash, name, pages, n_chunks, error FROM documents "
+                                  f"{where}ORDER BY added DESC, name").fetchall()
+
+    def document_rows(self, doc_hashes):
+        """Vector rows of the chunks of the given documents."""
+        ranges = []
+        for doc_hash in doc_hashes:
+            found = self._conn.execute("SELECT first_row, n_chunks FROM documents WHERE doc_hash = ?",
+                                       (doc_hash,)).fetchone()
+            if found is not None:
+                ranges.append(np.arange(found[0], found[0] + found[1]))
+        return np.concatenate(ranges) if ranges else np.empty(0, dtype=np.int64)
+
+    def embed_queries(self, texts):
+        """
+        Unit-length embeddings of queries, for search(). Query vectors are kept in the index, so
+        asking a question again needs no embedder call (and no network).
+
+        Returns: float32 matrix, one row per text.
+        """
+        vectors = {}
+        for text in dict.fromkeys(texts):
+            found = self._conn.execute("SELECT vector FROM queries WHERE text = ?", (text,)).fetchone()
+            if found is not None:
+                vectors[text] = np.frombuffer(found[0], dtype=np.float32)
+        missing = [text for text in dict.fromkeys(texts) if text not in vectors]
+        if missing:
+            for text, vector in zip(missing, normalize_rows(self.embedder(missing))):
+                vectors[text] = vector
+                self._conn.execute("INSERT OR REPLACE INTO queries VALUES (?, ?)", (text, vector.tobytes()))
+            self._conn.commit()
+        return np.stack([vectors[text] for text in texts])
+
+    def embed_query(self, text):
+        """Unit-length embedding of one query (see embed_queries)."""
+        return self.embed_queries([text])[0]
+
+    def iter_chunks(self, start_row=0, batch_size=EMBED_BATCH * 16):
+        """Yield lists of (row, text) for the chunks from start_row on, in row order, batch_size at a time."""
+        while True:
+            batch = self._conn.execute("SELECT row, text FROM chunks WHERE row >= ? ORDER BY row LIMIT ?",
+                                       (start_row, batch_size)).fetchall()
+            if not batch:
+                return
+            yield batch
+            start_row = batch[-1][0] + 1
+
+    def vector_scores(self, query, rows=None):
+        """
+        Cosine similarity of a query (text or embed_query vector) to chunks.
+
+        Parameters:
+        rows - vector rows to score (e.g. document_rows), all live rows if None.
+
+        Returns: (rows, scores) as NumPy arrays.
+        """
+        vector = self.embed_query(query) if isinstance(query, str) else normalize_rows(query)
+        matrix = self.matrix()
+        if rows is not None:
+            rows = np.asarray(rows, dtype=np.int64)
+            return rows, np.asarray(matrix[rows]) @ vector
+        scores = np.empty(len(matrix), dtype=np.float32)
+        for start in range(0, len(matrix), SEARCH_CHUNK_ROWS):
+            block = np.asarray(matrix[start:start + SEARCH_CHUNK_ROWS])
+            scores[start:start + len(block)] = block @ vector
+        live = self.live_rows()
+        return np.flatnonzero(live), scores[live]
+
+    def chunks(self, rows):
+        """Chunk records (row, doc_hash, name, page, text) for vector rows, in the order given."""
+        rows = [int(row) for row in rows]
+        found = {}
+        for start in range(0, len(rows), 900):
+            batch = rows[start:start + 900]
+            for record in self._conn.execute(
+                    "SELECT c.row, c.doc_hash, d.name, c.page, c.text FROM chunks c JOIN documents d USING (doc_hash) "
+                    f"WHERE c.row IN ({','.join('?' * len(batch))})", batch):
+                found[record[0]] = dict(zip(("row", "doc_hash", "name", "page", "text"), record))
+        return [found[row] for row in rows if row in found]
+
+    def search(self, query, k=TOP_K, doc_hashes=None):
+        """
+        Nearest chunks to a query.
+
+        Parameters:
+        query - question text, or a vector from embed_query (embed a question once, search many documents).
+        k - chunks to return.
+        doc_hashes - restrict the search to these documents.
+
+        Returns: list of chunk records (see chunks) with a score, best first.
+        """
+        rows, scores = self.vector_scores(query, self.document_rows(doc_hashes) if doc_hashes else None)
+        if k < len(scores):
+            best = np.argpartition(-scores, k)[:k]
+        else:
+            best = np.arange(len(scores))
+        best = best[np.argsort(-scores[best], kind="stable")]
+        results = self.chunks(rows[best])
+        for result, score in zip(results, scores[best]):
+            result["score"] = float(score)
+        return results
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    # Index PDFs, e.g. python pdf_ingest.py pdf_index ../Data/Raw --embedder local
+    # and query the index:  python pdf_ingest.py pdf_index --query "What is the aim of this study"
+    parser = argparse.ArgumentParser(description="Add PDFs to a persistent full-text vector index and query it.")
+    parser.add_argument("index", help="index folder")
+    parser.add_argument("pdfs", nargs="*", help="PDF files or folders to add; unchanged PDFs are skipped")
+    parser.add_argument("--embedder", default=None,
+                        help=f"openai:MODEL or local:MODEL for a new index (default {EMBEDDER}; local: {LOCAL_MODEL})")
+    parser.add_argument("--workers", type=int, default=None, help="parser processes (default: one per CPU)")
+    parser.add_argument("--query", default=None, help="question to search the index for")
+    parser.add_argument("--k", type=int, default=TOP_K, help="chunks returned by --query")
+    args = parser.parse_args()
+
+    with PDFIndex(args.index, make_embedder(args.embedder) if args.embedder else None) as index:
+        if args.pdfs:
+            start = time.perf_counter()
+            counts = index.add(args.pdfs, workers=args.workers)
+            print(f"Index update in {time.perf_counter() - start:.1f}s: {counts}; "
+                  f"{len(index.documents())} documents, {index.rows} chunks")
+        if args.query:
+            for result in index.search(args.query, args.k):
+                print(f"{result['score']:.3f} {result['name']} p.{result['page']}: {result['text'][:200]!r}")
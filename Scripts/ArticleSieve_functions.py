@@ -2,21 +2,43 @@
 '''
 Load necessary libraries
 '''
+import os
+import argparse
+import numpy as np
 import pandas as pd
-from sklearn.metrics import confusion_matrix
-import seaborn as sns
-import matplotlib.pyplot as plt
+
+from deduplication import normalize_doi, normalize_accession, normalize_title
+
+POSITIVE = "Included"
+N_BOOTSTRAP = 1000
+METRICS = ("accuracy", "precision", "recall", "specificity", "f1")
 
 
 # Create a portable function for manipulating the datasets
 
+def article_key(df):
+    '''
+    Stable join key for every row: normalised DOI, else accession number, else normalised title.
+    Columns are matched case-insensitively; missing columns are skipped.
+    '''
+    columns = {str(column).strip().lower(): column for column in df.columns}
+    key = pd.Series([None] * len(df), index=df.index, dtype=object)
+    for name, normalize, prefix in (("doi", normalize_doi, "doi:"),
+                                    ("accessionnumber", normalize_accession, "acc:"),
+                                    ("title", normalize_title, "title:")):
+        if name in columns:
+            values = df[columns[name]].map(normalize)
+            usable = key.isna() & values.notna() & (values != "")
+            key[usable] = prefix + values[usable].astype(str)
+    return key
+
 
 def data_processing(df1, df2, modelname, outputfile):
     '''
     This function takes in two datasets.
-    Reads in individual datasets and sorts each one by the title column.
-    Extracts the decision column from df2 and adds it to df1 with a user-supplied column name.
-    Returns a reference dataframe with the model decision column to be passed to a confusion matrix for visualization.
+    Joins the decision column of df2 onto df1 by article (DOI, accession number or normalised
+    title) and stores it under a user-supplied column name.
+    Returns a reference dataframe with the model decision column to be passed to evaluate.
 
     Parameters:
     df1 - Reference dataset, with human decision.
@@ -28,89 +50,184 @@ def data_processing(df1, df2, modelname, outputfile):
     human_decision = pd.read_csv(df1)
     LLM_decision = pd.read_csv(df2)
 
-    # Sort datasets by title column
-    human_decision_sorted = human_decision.sort_values(by='title')  
-    LLM_decision_sorted = LLM_decision.sort_values(by='title')  
-
-    # Add model decision column using the provided model name
-    human_decision_sorted[modelname] = LLM_decision_sorted['decision']
+    human_decision["_key"] = article_key(human_decision)
+    LLM_decision["_key"] = article_key(LLM_decision)
+    decisions = LLM_decision.dropna(subset=["_key"]).drop_duplicates("_key", keep="last")
+    merged = human_decision.merge(decisions[["_key", "decision"]].rename(columns={"decision": modelname}),
+                                  on="_key", how="left").drop(columns="_key")
 
-    # Print preview of updated dataset
-    print(human_decision_sorted.head())
+    unmatched = merged[modelname].isna().sum()
+    if unmatched:
+        print(f"WARNING: {unmatched} reference articles have no {modelname} decision")
 
     # Save the updated dataset to the specified output file
-    human_decision_sorted.to_csv(outputfile, index=False)
-
-    return human_decision_sorted  # Return the updated DataFrame
-
-
-#  Create a function to compute the confusion matrix capturing TP,TN, FP and FN and visualise using heatmap
-# def plot_confusion_matrix(human_labels, model_labels, model_name):
-#     '''
-#     A function to compute the confusion matrix comparing human labels
-#     to LLM labels.
-#     Further this function visualises the matrix using a heatmap showing
-#     TP, TN, FP and FN
-
-#     Parameters:
-#     human_labels - human decision (2nd reviewer)
-#     model_labels - LLM decision (decision by model)
-#     '''
-#     # Compute confusion matrix
-#     cm = confusion_matrix(human_labels, model_labels, labels=["Included", "Excluded"])
-    
-#     # Plotting confusion matrix heatmap
-#     plt.figure(figsize=(6, 5))
-#     sns.heatmap(cm, annot=True, fmt='d', cmap='Blues', xticklabels=["Included", "Excluded"], yticklabels=["Included", "Excluded"])
-#     plt.title(f"Confusion Matrix for {model_name}")
-#     plt.xlabel('Predicted')
-#     plt.ylabel('Actual')
-#     plt.show()
-
-
-def plot_confusion_matrix(human_labels, model_labels, model_name):
-        '''
-    A function to compute the confusion matrix comparing human labels
-    to LLM labels.
-    Further this function visualises the matrix using a heatmap showing
-    TP, TN, FP and FN
+    merged.to_csv(outputfile, index=False)
+
+    return merged  # Return the updated DataFrame
+
+
+def confusion_counts(truth, predictions):
+    '''
+    Confusion counts of every model at once.
+
+    Parameters:
+    truth - boolean array (n,), True where the human included the article.
+    predictions - boolean matrix (n, models).
+
+    Returns: dict of tp, fp, fn, tn arrays with one entry per model.
+    '''
+    truth = truth[:, None]
+    return {"tp": np.sum(predictions & truth, axis=0), "fp": np.sum(predictions & ~truth, axis=0),
+            "fn": np.sum(~predictions & truth, axis=0), "tn": np.sum(~predictions & ~truth, axis=0)}
+
+
+def metrics_from_counts(tp, fp, fn, tn):
+    '''Accuracy, precision, recall, specificity and F1 from (arrays of) confusion counts; 0 where undefined.'''
+    tp, fp, fn, tn = (np.asarray(count, dtype=np.float64) for count in (tp, fp, fn, tn))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = lambda a, b: np.where(b > 0, a / b, 0.0)
+        return {"accuracy": ratio(tp + tn, tp + fp + fn + tn),
+                "precision": ratio(tp, tp + fp),
+                "recall": ratio(tp, tp + fn),
+                "specificity": ratio(tn, tn + fp),
+                "f1": ratio(2 * tp, 2 * tp + fp + fn)}
+
+
+def bootstrap_intervals(truth, predictions, n_boot=N_BOOTSTRAP, confidence=0.95, seed=0, chunk=200):
+    '''
+    Percentile bootstrap intervals of every metric for every model.
+
+    Each resample is drawn as per-article counts, so the confusion counts of all models come
+    from one matrix product per chunk of resamples.
+
+    Returns: dict of metric -> (low, high) arrays with one entry per model.
+    '''
+    rng = np.random.default_rng(seed)
+    n = len(truth)
+    cells = np.concatenate([predictions & truth[:, None], predictions & ~truth[:, None],
+                            ~predictions & truth[:, None], ~predictions & ~truth[:, None]], axis=1)
+    cells = cells.astype(np.float32)
+    samples = {metric: [] for metric in METRICS}
+    for start in range(0, n_boot, chunk):
+        size = min(chunk, n_boot - start)
+        draws = rng.integers(0, n, size=(size, n)) + (np.arange(size) * n)[:, None]
+        weights = np.bincount(draws.ravel(), minlength=size * n).reshape(size, n).astype(np.float32)
+        tp, fp, fn, tn = np.split(weights @ cells, 4, axis=1)
+        for metric, values in metrics_from_counts(tp, fp, fn, tn).items():
+            samples[metric].append(values)
+    alpha = (1 - confidence) / 2
+    return {metric: tuple(np.quantile(np.concatenate(values), [alpha, 1 - alpha], axis=0))
+            for metric, values in samples.items()}
+
+
+def evaluate(df, human_col="Human", model_cols=None, positive=POSITIVE, n_boot=N_BOOTSTRAP, seed=0):
+    '''
+    Compare every model decision column with the human decision in one pass.
 
     Parameters:
-    human_labels - human decision (2nd reviewer)
-    model_labels - LLM decision (decision by model)
+    df - dataframe with the human decision and one decision column per model.
+    human_col - human decision column.
+    model_cols - model columns; defaults to every other column whose values are all decision labels
+                 (values of human_col or positive), so identifier and metadata columns are left out.
+    positive - decision value counted as an inclusion.
+    n_boot - bootstrap resamples for the confidence intervals, 0 to skip them.
+
+    Returns: metrics table with one row per model (counts, metrics and their intervals).
+    Articles without a human decision are dropped; a missing model decision counts as an exclusion.
     '''
-    # Compute confusion matrix
-    cm = confusion_matrix(human_labels, model_labels, labels=["Included", "Excluded"])
-    
-    # Extract TP, TN, FP, FN
-    tn, fp, fn, tp = cm.ravel()
-    
-    # Calculate metrics
-    accuracy = (tp + tn) / (tp + tn + fp + fn)
-    precision = tp / (tp + fp) if (tp + fp) > 0 else 0
-    recall = tp / (tp + fn) if (tp + fn) > 0 else 0  # sensitivity
-    specificity = tn / (tn + fp) if (tn + fp) > 0 else 0
-    f1 = f1_score(human_labels, model_labels, pos_label="Included")
-
-    # Plot confusion matrix heatmap
-    plt.figure(figsize=(6, 5))
+    if model_cols is None:
+        labels = set(df[human_col].dropna()) | {positive}
+        candidates = [column for column in df.columns if column not in ("title", "abstract", human_col)]
+        model_cols = [column for column in candidates
+                      if df[column].notna().any() and df[column].dropna().isin(labels).all()]
+        skipped = [column for column in candidates if column not in model_cols]
+        if skipped:
+            print(f"Not evaluated (values are not decision labels): {', '.join(map(str, skipped))}")
+    df = df[df[human_col].notna()]
+    truth = (df[human_col] == positive).to_numpy()
+    predictions = (df[list(model_cols)] == positive).to_numpy()
+
+    counts = confusion_counts(truth, predictions)
+    table = pd.DataFrame(counts, index=pd.Index(model_cols, name="model"))
+    table["missing"] = df[list(model_cols)].isna().sum().to_numpy()
+    for metric, values in metrics_from_counts(**counts).items():
+        table[metric] = values
+    if n_boot:
+        for metric, (low, high) in bootstrap_intervals(truth, predictions, n_boot, seed=seed).items():
+            table[f"{metric}_low"] = low
+            table[f"{metric}_high"] = high
+    return table.sort_values(["recall", "f1"], ascending=False)
+
+
+def write_report(table, outputfile):
+    '''
+    Write the metrics table to csv and a plain-text summary next to it (outputfile with .txt).
+    '''
+    table.to_csv(outputfile)
+    lines = []
+    for model, row in table.iterrows():
+        intervals = [f"{metric} {row[metric]:.2f}" + (f" ({row[f'{metric}_low']:.2f}-{row[f'{metric}_high']:.2f})"
+                                                       if f"{metric}_low" in row else "")
+                     for metric in METRICS]
+        lines.append(f"{model}: TP={row['tp']:.0f} FP={row['fp']:.0f} FN={row['fn']:.0f} TN={row['tn']:.0f}; " + ", ".join(intervals))
+    report_path = outputfile.rsplit(".", 1)[0] + ".txt"
+    with open(report_path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    return report_path
+
+
+#  Visualise the confusion matrix of one model as a heatmap, saved to file (off the evaluation path)
+def plot_confusion_matrix(row, model_name, outputfile):
+    '''
+    A function to draw the confusion matrix of one model from a row of the evaluate table,
+    showing TP, FN, FP and TN, and save it as an image.
+
+    Parameters:
+    row - row of the evaluate table (tp, fp, fn, tn).
+    model_name - name shown in the title.
+    outputfile - image path.
+    '''
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    # The counts share a row with float metrics, so they arrive as floats; heatmap fmt="d" needs ints
+    cm = np.array([[row["tp"], row["fn"]], [row["fp"], row["tn"]]]).astype(int)
+    fig = plt.figure(figsize=(6, 5))
     sns.heatmap(cm, annot=True, fmt='d', cmap='Blues', xticklabels=["Included", "Excluded"], yticklabels=["Included", "Excluded"])
     plt.title(f"Confusion Matrix for {model_name}")
     plt.xlabel('Predicted')
     plt.ylabel('Actual')
-    plt.show()
-
-    # Print metrics
-    print(f"Metrics for {model_name}:")
-    print(f"Accuracy: {accuracy:.2f}")
-    print(f"Precision: {precision:.2f}")
-    print(f"Recall (Sensitivity): {recall:.2f}")
-    print(f"Specificity: {specificity:.2f}")
-    print(f"F1 Score: {f1:.2f}")
-    print("-" * 50)
-
-# Compare each model with Human labels and plot the confusion matrix
-for model in df.columns[3:]:  # Skip the first three columns (title, abstract, and human decision)
-    plot_confusion_matrix(df['Human'], df[model], model)
-    
-
+    fig.savefig(outputfile, bbox_inches="tight")
+    plt.close(fig)
+
+
+# Compare each model with Human labels, e.g. python ArticleSieve_functions.py human_LLM_zero_shot.csv metrics.csv
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare model screening decisions with human decisions.")
+    parser.add_argument("decisions", nargs="+", help="csv files with title, the human column and model decision columns")
+    parser.add_argument("--output", default="model_metrics.csv", help="metrics table (a .txt report is written beside it)")
+    parser.add_argument("--human", default="Human", help="human decision column")
+    parser.add_argument("--bootstrap", type=int, default=N_BOOTSTRAP, help="bootstrap resamples, 0 to skip intervals")
+    parser.add_argument("--models", nargs="+", default=None, metavar="COLUMN",
+                        help="model decision columns (default: every column holding only decision labels)")
+    parser.add_argument("--plots", default=None, metavar="DIR", help="save a confusion matrix image per model here")
+    args = parser.parse_args()
+
+    # Join the model columns of every file onto the first by article key
+    combined = pd.read_csv(args.decisions[0])
+    combined["_key"] = article_key(combined)
+    for path in args.decisions[1:]:
+        other = pd.read_csv(path)
+        other["_key"] = article_key(other)
+        new_columns = [column for column in other.columns if column not in combined.columns]
+        combined = combined.merge(other.drop_duplicates("_key", keep="last")[["_key", *new_columns]], on="_key", how="left")
+    table = evaluate(combined.drop(columns="_key"), human_col=args.human, model_cols=args.models, n_boot=args.bootstrap)
+    print(table[["tp", "fp", "fn", "tn", *METRICS]].round(3).to_string())
+    print(f"Metrics written to {args.output} and {write_report(table, args.output)}")
+    if args.plots:
+        # Images only, no window: the non-interactive backend is chosen here, not in the library function
+        import matplotlib
+        matplotlib.use("Agg")
+        os.makedirs(args.plots, exist_ok=True)
+        for model, row in table.iterrows():
+            plot_confusion_matrix(row, model, os.path.join(args.plots, f"confusion_{model}.png"))
+        print(f"Confusion matrices saved in {args.plots}")
@@ -2,12 +2,92 @@
 # Build a streamlit webapp
 
 import streamlit as st
-import time
-import os
 import pandas as pd
-import json
-import plotly.express as px
-from utils import test_utils, clean_abstract, construct_prompt, query_openai, process_articles,process_json_files,scorecard_modified
+from scoring import score, score_labels, flag_matrix, LABEL_COLUMNS
+from job_manager import JobManager, ACTIVE, RESUMABLE
+from ingest import read_preview
+from results_store import ResultsView, RESULTS_PATH
+from results_explorer import (label_summary, score_histogram, filter_articles, page, label_counts_figure,
+                              histogram_figure, articles_figure, PAGE_SIZES)
+
+
+# Streamlit re-runs this script on every interaction; anything expensive to build is cached
+@st.cache_resource
+def get_job_manager():
+    """One screening job queue per server process, shared by every session; jobs outlive reruns and refreshes."""
+    return JobManager()
+
+
+@st.cache_resource
+def get_results_view(path):
+    """Results of a store held in memory for all sessions; each rerun parses only the records added since the last."""
+    return ResultsView(path)
+
+
+# Everything derived from the results is memoised per result version (path, version): typing in a
+# box or switching tabs reuses it, and only new results trigger a recompute. Frames and figures are
+# shared by all sessions (cache_resource, not copied per rerun), so they are never modified in place.
+@st.cache_resource(max_entries=8)
+def scored_results(_results, path, version):
+    """Results with their total SCORES."""
+    scored = _results.assign(SCORES=score(_results))
+    # Rename the first column
+    return scored.rename(columns={"document_info.title": "title"})
+
+
+@st.cache_resource(max_entries=8)
+def plot_data(_scored, path, version):
+    """Flags and tick/cross labels with scores of every article, highest score first."""
+    # Missing or malformed flags (NaN, absent columns) count as False
+    data = _scored.reindex(columns=["title", *LABEL_COLUMNS, 'SCORES'])
+    data[list(LABEL_COLUMNS)] = flag_matrix(_scored, LABEL_COLUMNS)
+    data['short_title'] = data['title'].str[:50]
+    data = data.sort_values(by="SCORES", ascending=False, kind="stable")
+    # Create tick/cross label for each row, with the score appended
+    data["label"], data['label_SCORES'] = score_labels(data, data['SCORES'].to_numpy())
+    return data
+
+
+@st.cache_resource(max_entries=8)
+def overview_figures(_data, path, version):
+    """Label-combination counts and score histogram; their size depends on the labels and scores, not the articles."""
+    summary = label_summary(_data)
+    return summary, label_counts_figure(summary), histogram_figure(score_histogram(_data))
+
+
+@st.cache_resource(max_entries=16)
+def filtered_articles(_data, path, version, labels, score_range, search):
+    """Articles matching the explorer filters, kept while the user pages through them."""
+    return filter_articles(_data, labels, score_range, search)
+
+
+@st.fragment(run_every=2)
+def job_status(job_id):
+    """Progress, controls and latest results of a job, polled every 2 s without rerunning the page."""
+    jobs = get_job_manager()
+    job = jobs.get(job_id)
+    progress = job.progress()
+    total = progress["total"] if progress["total"] is not None else "?"
+    st.progress(progress["fraction"], text=f"Job {job.job_id} ({job.name}): {job.status}, {progress['done']}/{total} results")
+    if job.status in ACTIVE:
+        if st.button("⏹️ Cancel screening", key=f"cancel-{job_id}"):
+            jobs.cancel(job_id)
+    elif job.status in RESUMABLE:
+        if job.error:
+            st.error(f"❌ {job.error}")
+        if st.button("🔁 Resume screening", key=f"resume-{job_id}"):
+            jobs.resume(job_id)
+    else:
+        st.success("🎉 Hooray! Articles have been processed.")
+    if progress["done"]:
+        st.write("Latest results")
+        st.write(get_results_view(job.results_path).refresh()[0].tail(5))
+    # Once the job stops, rerun the whole page so the tabs below show its final results
+    active = job.status in ACTIVE
+    if st.session_state.get(f"active-{job_id}") and not active:
+        st.session_state[f"active-{job_id}"] = False
+        st.rerun()
+    st.session_state[f"active-{job_id}"] = active
 
 
 st.set_page_config(page_title="ArticleSieve",
@@ -29,41 +109,58 @@ with st.sidebar:
         Pandas to view the header of the `.csv` file.     
                     
         **3. Run Screening**     
-        Click "▶️ Run GPT Query" to let OpenAI analyze the articles and returns `.json` format file for each article.
+        Click "▶️ Run GPT Query" to let OpenAI analyze the articles in a background job; results appear as they arrive.
+        The job keeps running if you refresh the page (its ID is kept in the page address) and can be cancelled or resumed.
         
         **4. Data Preprocessing tab**      
-        Enter a desired `.csv` file name to be used to write out all `.json` files.  
+        Enter a desired `.csv` file name to be used to write out all screening results.  
         Calculate the average scores across the terms and store the dataframe.   
                     
         **5.Data 📊 visualisation tab**     
-        Use plotly to plot a scatter plot of the label and scores vs a short title of articles under investigation.
+        Counts per tick/cross combination and the score distribution, then the article list: filter it by
+        combination, score or title and page through it, with a scatter plot of the label and score of each article on the page.
         """)
 
 # Main section
 # st.title("🧠 Article Screening App")
 
+# The job on show is kept in the address (?job=<id>), so a refresh re-attaches to it
+jobs = get_job_manager()
+job = jobs.get(st.query_params.get("job", ""))
+session_jobs = st.session_state.setdefault("job_ids", [])
+if job is not None and job.job_id not in session_jobs:
+    session_jobs.append(job.job_id)
+
 st.markdown("<div style='margin-bottom: -30px;color:blue; font-weight:bold;'>🧾Upload your file</div>", unsafe_allow_html=True)
 uploaded_file = st.file_uploader("", type=["csv"])
 if uploaded_file:
-    uploaded_file.seek(0)
     try:
-        data = pd.read_csv(uploaded_file)
+        # Only the first rows are parsed for the preview; screening streams the file in chunks
+        data = read_preview(uploaded_file)
         st.success("✅ File uploaded successfully!")
-        st.write(data.head()) # Check the content of the file
+        st.write(data) # Check the content of the file
 
         # "Run" button to process articles
         if st.button("▶️ Run GPT Query"):
-            with st.spinner("Querying GPT model... please wait",show_time=True):
-                uploaded_file.seek(0)  # reset before reading again
-                time.sleep(20)
-                #process_articles(uploaded_file)  # This function takes the abstract and queries the GPT using the prompt
-            st.success("🎉 Hooray! Articles have been processed.")
+            # Screening runs in a background job, so the page stays responsive while it works
+            job = jobs.get(jobs.submit(uploaded_file, name=uploaded_file.name))
+            session_jobs.append(job.job_id)
+            st.query_params["job"] = job.job_id
 
     except pd.errors.EmptyDataError:
         st.error("❌ The uploaded file is empty or unreadable.")
 else:
     st.info("📥 Please upload a CSV file to get started.")
 
+if len(session_jobs) > 1:
+    with st.sidebar.expander("🗂️ Your screening jobs"):
+        for listed in jobs.list_jobs(session_jobs):
+            if st.button(f"{listed.name} ({listed.status})", key=f"show-{listed.job_id}"):
+                st.query_params["job"] = listed.job_id
+                st.rerun()
+if job is not None:
+    job_status(job.job_id)
+
 
 tab1,tab2 =st.tabs(["Data preprocessing", "visualisation"])
 with tab1:
@@ -72,67 +169,49 @@ with tab1:
     output_file = st.text_input("Enter the name for the full output CSV (e.g., all_data.csv): ")
     st.write(output_file)
 
-    # May consider future modifications to be asking user the path to where the json files were written to
-    json_to_df = process_json_files(directory="./",full_output_file=output_file,table_keyword='article')
+    # Results of the job on show (partial while it runs), else the shared append-only store;
+    # a rerun parses only the results added since the previous one
+    results_path = job.results_path if job is not None else RESULTS_PATH
+    json_to_df, version = get_results_view(results_path).refresh()
+    if json_to_df.empty:
+        st.info("No screening results yet.")
+        st.stop()
+    if output_file:
+        full_output_file = output_file if output_file.endswith(".csv") else output_file + ".csv"
+        # Written once per file name and result version, not on every rerun
+        if st.session_state.get("written_csv") != (full_output_file, results_path, version):
+            json_to_df.to_csv(full_output_file, index=False)
+            st.session_state["written_csv"] = (full_output_file, results_path, version)
+        st.write(f"Full data written to {full_output_file}")
     st.write(json_to_df.head())
 
     st.subheader('Calculate the total scores and display the dataframe')
 
- 
-    json_to_df['SCORES'] = json_to_df.apply(scorecard_modified,axis=1)
-    # Rename the first column
-    json_to_df.rename(columns={"document_info.title": "title"}, inplace=True)
-    st.write(json_to_df.head())
-    columns = ("term_analysis.bmi_adiposity.present", "term_analysis.bmi_adiposity.is_main_exposure",
-            "term_analysis.blood_pressure.present", "term_analysis.blood_pressure.is_main_outcome",
-            "term_analysis.mendelian_randomisation.present", "term_analysis.mendelian_randomisation.is_main_method",
-            "term_analysis.european_ancestry.present",'term_analysis.european_ancestry.is_ancestry_European')
-
-    data= json_to_df[["title","term_analysis.bmi_adiposity.present", "term_analysis.bmi_adiposity.is_main_exposure",
-            "term_analysis.blood_pressure.present", "term_analysis.blood_pressure.is_main_outcome",
-            "term_analysis.mendelian_randomisation.present", "term_analysis.mendelian_randomisation.is_main_method",
-            "term_analysis.european_ancestry.present",'term_analysis.european_ancestry.is_ancestry_European', 'SCORES']]
-
-    data['short_title'] = data['title'].str[:50]
-    data = data.sort_values(by="SCORES", ascending=True)       
+    scored = scored_results(json_to_df, results_path, version)
+    st.write(scored.head())
+    data = plot_data(scored, results_path, version)
 
-# Actual visualisation
+# Actual visualisation: aggregates of every article plus one page of the filtered article list;
+# only these are sent to the browser, however many articles have been screened
 with tab2:
     st.subheader("Data visualisation")
-    #st.write('Actual visualisation using scatter plot')
-    # Create tick/cross label for each row
-    tick_cross_map = {True: "✓", False: "✗"}
-    data["label"] = data.apply(lambda row: ''.join([tick_cross_map[row[col]] for col in columns]), axis=1)
-    # Update the label
-    data['label_SCORES'] = data['label']+"_"+data['SCORES'].astype(str)
-    print(data["label_SCORES"])
-    # Assign a unique position on x-axis
-    data["x"] = data["label_SCORES"].astype("category").cat.codes
-    #st.write(data.head())
-    #st.write(len(data))
-    # Use Plotly to create interactive scatter plot
-    fig = px.scatter(
-        data_frame=data,
-        x="x",
-        y="short_title",
-        color="label_SCORES",
-        hover_data=["SCORES"],
-        labels={"x": "Variable Combination", "SCORE": "SCORES"},
-        title="All articles with (✓/✗) with Scores"
-    )
-
-    # Replace x-tick labels with tick/cross combinations
-    fig.update_layout(
-        xaxis=dict(
-            tickmode='array',
-            tickvals=data["x"],
-            ticktext=data["label_SCORES"],
-            tickangle=90
-        ),
-        height=1000,
-        width=500,
-        showlegend=False
-    )
-
-    #fig.show()
-    st.plotly_chart(fig,use_container_width=True)
\ No newline at end of file
+    summary, label_fig, histogram_fig = overview_figures(data, results_path, version)
+    left, right = st.columns(2)
+    left.plotly_chart(label_fig, use_container_width=True)
+    right.plotly_chart(histogram_fig, use_container_width=True)
+
+    st.subheader("Articles")
+    label_col, score_col, search_col = st.columns(3)
+    labels = label_col.multiselect("Tick/cross combinations", summary["label"].tolist())
+    low, high = int(data["SCORES"].min()), int(data["SCORES"].max())
+    score_range = score_col.slider("Score", low, high, (low, high)) if low < high else None
+    search = search_col.text_input("Title contains")
+    articles = filtered_articles(data, results_path, version, tuple(labels), score_range, search.strip())
+
+    size_col, page_col = st.columns(2)
+    size = size_col.selectbox("Articles per page", PAGE_SIZES)
+    number = page_col.number_input("Page", min_value=1, value=1, step=1)
+    rows, number, pages = page(articles, number, size)
+    st.caption(f"{len(articles)} of {len(data)} articles, page {number} of {pages}")
+    st.dataframe(rows[["title", "label", "SCORES"]], hide_index=True, use_container_width=True)
+    st.plotly_chart(articles_figure(rows, (number - 1) * size), use_container_width=True)
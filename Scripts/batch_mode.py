@@ -0,0 +1,312 @@
+# Batch-API screening for large offline runs.
+# Every construct_prompt output is written to JSON Lines batch request files (sized to the
+# Batch API limits), submitted, polled until finished, and the replies are streamed back
+# into the same results store the interactive screening engine writes to.
+import os
+import json
+import time
+import argparse
+
+from prompt_registry import get_prompt, PROMPTS, DEFAULT_PROMPT
+from ingest import iter_articles
+from deduplication import DeduplicationIndex
+from prefilter import Prefilter
+from response_cache import ResponseCache, CACHE_PATH
+from results_store import ResultsStore, RESULTS_PATH
+from screening_engine import results_path_for
+from response_schema import get_validator, request_options, reply_text, parse_reply
+
+# Batch API limits per input file
+MAX_BATCH_REQUESTS = 50000
+MAX_BATCH_BYTES = 190 * 1024 * 1024  # stay under the 200 MB file limit
+POLL_INTERVAL = 60  # seconds between status checks
+BATCH_ENDPOINT = "/v1/chat/completions"
+FINAL_STATES = ("completed", "failed", "expired", "cancelled")
+
+
+def make_client(api_key=None, base_url=None):
+    """Build a synchronous client; base_url can point at a local stub of the batch endpoints."""
+    from openai import OpenAI
+    if api_key is None:
+        from dotenv import load_dotenv
+        load_dotenv()
+        api_key = os.getenv('openaiuob_api_key')  # API key via UoB organisation
+    return OpenAI(api_key=api_key, base_url=base_url)
+
+
+def batch_request(idx, prompt, version=None):
+    """Build one Batch API request line for an article; version is the prompt version it was rendered with."""
+    version = get_prompt(version)
+    return {"custom_id": f"article-{idx}",
+            "method": "POST",
+            "url": BATCH_ENDPOINT,
+            "body": {"model": version.model,
+                     "messages": [{"role": "system", "content": version.system_message},
+                                  {"role": "user", "content": prompt}],
+                     "temperature": version.temperature,
+                     **request_options(version.schema, version.model)}}
+
+
+def write_batch_files(records, batch_dir, cache=None, store=None, dedup_index=None, prefilter=None,
+                      max_requests=MAX_BATCH_REQUESTS, max_bytes=MAX_BATCH_BYTES, prompt=None):
+    """
+    Render the prompts of every article into batch request files.
+
+    Parameters:
+    records - iterable of article records (ingest.iter_articles).
+    batch_dir - directory the request files are written to.
+    cache - optional ResponseCache; cached articles go straight to the store instead of a batch.
+    store - ResultsStore receiving cached results.
+    dedup_index - optional DeduplicationIndex; only canonical records are submitted.
+    prefilter - optional prefilter.Prefilter; excluded articles go straight to the store.
+    max_requests, max_bytes - size limits of a single batch file.
+    prompt - prompt version name in prompt_registry (or a PromptVersion), default prompt if None.
+
+    Returns: list of request file paths.
+    """
+    version = get_prompt(prompt)
+    os.makedirs(batch_dir, exist_ok=True)
+    paths = []
+    handle = None
+    count = size = 0
+    if dedup_index is not None:
+        records = (record for record in records
+                   if dedup_index.add(record["idx"], record["title"], record.get("doi"),
+                                      record.get("accession")) == record["idx"])
+    # The pre-filter screens the stream in chunks with its vectorised screen_texts
+    screened = prefilter.screen_stream(records) if prefilter is not None else ((record, None) for record in records)
+    for record, found in screened:
+        idx = record["idx"]
+        if found is not None:
+            store.append(idx, prefilter.build_result(record, found, version.schema))
+            continue
+        rendered = version.render(record["title"], record["abstract"])
+        if cache is not None:
+            cached = cache.get(version.cache_key(rendered))
+            if cached is not None:
+                store.append(idx, cached)
+                continue
+        line = (json.dumps(batch_request(idx, rendered, version), ensure_ascii=False) + "\n").encode("utf-8")
+        if handle is None or count >= max_requests or size + len(line) > max_bytes:
+            if handle is not None:
+                handle.close()
+            paths.append(os.path.join(batch_dir, f"batch_requests_{len(paths):03d}.jsonl"))
+            handle = open(paths[-1], "wb")
+            count = size = 0
+        handle.write(line)
+        count += 1
+        size += len(line)
+    if handle is not None:
+        handle.close()
+    return paths
+
+
+def submit_batch(client, path):
+    """Upload a request file and create a batch for it; returns the batch ID."""
+    with open(path, "rb") as f:
+        input_file = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(input_file_id=input_file.id, endpoint=BATCH_ENDPOINT,
+                                  completion_window="24h")
+    print(f"Submitted {path} as batch {batch.id}")
+    return batch.id
+
+
+def wait_for_batch(client, batch_id, poll_interval=POLL_INTERVAL):
+    """Poll a batch until it reaches a final state and return it."""
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        progress = f"{counts.completed}/{counts.total}" if counts is not None else "?"
+        print(f"Batch {batch_id}: {batch.status} ({progress})")
+        if batch.status in FINAL_STATES:
+            return batch
+        time.sleep(poll_interval)
+
+
+def _request_cache_keys(request_path, prompt=None):
+    """Map custom_id -> response cache key for every request in a batch file."""
+    version = get_prompt(prompt)
+    keys = {}
+    with open(request_path, "rb") as f:
+        for line in f:
+            request = json.loads(line)
+            body = request["body"]
+            keys[request["custom_id"]] = version.cache_key(body["messages"][-1]["content"])
+    return keys
+
+
+def _request_ids(request_path):
+    """custom_id of every request in a batch file."""
+    with open(request_path, "rb") as f:
+        return [json.loads(line)["custom_id"] for line in f if line.strip()]
+
+
+def _article_idx(custom_id):
+    return int(custom_id.split("-", 1)[1])
+
+
+def collect_batch(client, batch, store, request_path=None, cache=None, prompt=None):
+    """
+    Stream the output file of a finished batch into the results store.
+
+    Parameters:
+    client - OpenAI client.
+    batch - batch object returned by wait_for_batch.
+    store - ResultsStore to append parsed results to.
+    request_path - request file of the batch, needed to fill the cache and to find the requests
+                   a failed, expired or cancelled batch never answered.
+    cache - optional ResponseCache that is filled with the parsed results.
+    prompt - prompt version the requests were rendered with, default prompt if None.
+
+    Returns: list of article indices that failed (API error, invalid JSON, a reply that does
+    not match the response schema, or no reply at all from a batch that did not complete).
+    """
+    version = get_prompt(prompt)
+    validator = get_validator(version.schema)
+    keys = _request_cache_keys(request_path, version) if cache is not None and request_path else {}
+    failed = []
+    answered = set()
+    if batch.output_file_id:
+        for line in client.files.content(batch.output_file_id).iter_lines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            answered.add(item["custom_id"])
+            idx = _article_idx(item["custom_id"])
+            response = item.get("response") or {}
+            if item.get("error") or response.get("status_code") != 200:
+                failed.append(idx)
+                continue
+            try:
+                result = parse_reply(reply_text(response["body"]["choices"][0]["message"]))
+            except (KeyError, IndexError):
+                result = None
+            errors = validator.check(result)
+            if errors:
+                print(f"ERROR: Batch returned invalid JSON for article {idx}: {errors[:3]}")
+                failed.append(idx)
+                continue
+            store.append(idx, result)
+            if item["custom_id"] in keys:
+                cache.put(keys[item["custom_id"]], result)
+    if batch.error_file_id:
+        for line in client.files.content(batch.error_file_id).iter_lines():
+            if line.strip():
+                custom_id = json.loads(line)["custom_id"]
+                answered.add(custom_id)
+                failed.append(_article_idx(custom_id))
+    if batch.status != "completed":
+        # A failed, expired or cancelled batch may leave requests with neither a reply nor an error line
+        if request_path is None:
+            print(f"WARNING: Batch {batch.id} ended {batch.status}; without its request file unanswered articles cannot be listed")
+        else:
+            unanswered = [_article_idx(custom_id) for custom_id in _request_ids(request_path) if custom_id not in answered]
+            print(f"WARNING: Batch {batch.id} ended {batch.status} with {len(unanswered)} unanswered article(s)")
+            failed.extend(unanswered)
+    return failed
+
+
+def _save_state(state_path, state):
+    with open(state_path + ".tmp", "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(state_path + ".tmp", state_path)
+
+
+def run_batch_screen(csv_file, batch_dir="batches", results_path=RESULTS_PATH, cache_path=CACHE_PATH,
+                     deduplicate=True, poll_interval=POLL_INTERVAL, client=None, resume=False, prefilter=None,
+                     prompt=None):
+    """
+    Screen a whole export through the Batch API.
+
+    Parameters:
+    csv_file - export with title and abstract columns.
+    batch_dir - directory for the request files and batch_state.json.
+    results_path - results store the replies are written to.
+    cache_path - response cache consulted before submitting and filled afterwards, None to disable.
+    deduplicate - submit one record per duplicate cluster and copy its result to the others.
+    poll_interval - seconds between status checks.
+    client - optional OpenAI client (e.g. pointed at a local stub).
+    resume - pick up the batches recorded in batch_state.json instead of submitting new ones.
+    prefilter - None to submit every article, or "any"/"all" to store the keyword pre-filter's
+                exclusion for articles matching none/not all of the required term categories.
+    prompt - prompt version name in prompt_registry, default prompt if None; its results go to
+             screening_engine.results_path_for(results_path, prompt). A resumed run keeps the
+             version it was started with.
+
+    Returns: list of article indices that failed; re-screen them with screening_engine.
+    """
+    client = client or make_client()
+    state_path = os.path.join(batch_dir, "batch_state.json")
+    state = None
+    if resume and os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+        prompt = state.get("prompt", DEFAULT_PROMPT)
+        print(f"Resuming {len(state['batches'])} batch(es) from {state_path} (prompt {prompt})")
+    version = get_prompt(prompt)
+    cache = ResponseCache(cache_path) if cache_path else None
+    try:
+        with ResultsStore(results_path_for(results_path, version)) as store:
+            if state is None:
+                dedup_index = DeduplicationIndex() if deduplicate else None
+                prefilter = Prefilter(require=prefilter) if prefilter else None
+                paths = write_batch_files(iter_articles(csv_file), batch_dir, cache, store, dedup_index, prefilter,
+                                          prompt=version)
+                if prefilter is not None:
+                    print(f"Pre-filter summary: {prefilter.report()}")
+                duplicates = {} if dedup_index is None else {
+                    str(idx): canonical for idx, canonical in dedup_index.canonical_of.items() if idx != canonical}
+                state = {"batches": [{"path": path, "id": None, "collected": False, "failed": []} for path in paths],
+                         "duplicates": duplicates, "prompt": version.name}
+                _save_state(state_path, state)
+
+            for entry in state["batches"]:
+                if entry["id"] is None:
+                    entry["id"] = submit_batch(client, entry["path"])
+                    _save_state(state_path, state)
+
+            for entry in state["batches"]:
+                if entry["collected"]:
+                    continue
+                batch = wait_for_batch(client, entry["id"], poll_interval)
+                entry["failed"] = collect_batch(client, batch, store, entry["path"], cache, version)
+                entry["collected"] = True
+                _save_state(state_path, state)
+
+            # Fan the canonical results out to every duplicate
+            duplicates = {int(idx): canonical for idx, canonical in state["duplicates"].items()}
+            canonical_results = store.get_many(set(duplicates.values()))
+            for idx, canonical in duplicates.items():
+                if canonical in canonical_results:
+                    store.append(idx, canonical_results[canonical])
+
+        failed = sorted({idx for entry in state["batches"] for idx in entry["failed"]})
+        print(f"Batch screening finished: {len(failed)} failed article(s)")
+        return failed
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Screen articles through the OpenAI Batch API.")
+    parser.add_argument("csv_file", help="csv file with title and abstract columns")
+    parser.add_argument("--batch-dir", default="batches", help="directory for request files and batch state")
+    parser.add_argument("--results", default=RESULTS_PATH, help="JSON Lines results store to append to")
+    parser.add_argument("--cache", default=CACHE_PATH, help="SQLite response cache shared between runs")
+    parser.add_argument("--no-cache", action="store_true", help="submit every article")
+    parser.add_argument("--no-dedup", action="store_true", help="submit every record, including duplicates")
+    parser.add_argument("--prefilter", nargs="?", const="any", default=None, choices=("any", "all"),
+                        help="store a pre-filter exclusion for articles matching none (any, the default) or "
+                             "not all (all) of the required terms")
+    parser.add_argument("--prompt", default=DEFAULT_PROMPT, choices=sorted(PROMPTS), metavar="NAME",
+                        help=f"prompt version to screen with: {', '.join(sorted(PROMPTS))}")
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL, help="seconds between status checks")
+    parser.add_argument("--base-url", default=None, help="OpenAI-compatible endpoint, e.g. a local batch stub")
+    parser.add_argument("--resume", action="store_true", help="continue the batches recorded in the batch directory")
+    args = parser.parse_args()
+
+    run_batch_screen(args.csv_file, batch_dir=args.batch_dir, results_path=args.results,
+                     cache_path=None if args.no_cache else args.cache, deduplicate=not args.no_dedup,
+                     poll_interval=args.poll_interval, client=make_client(base_url=args.base_url),
+                     resume=args.resume, prefilter=args.prefilter, prompt=args.prompt)
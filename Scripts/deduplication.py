@@ -0,0 +1,217 @@
+# Cross-source deduplication ahead of screening.
+# The combined Embase/Medline/Cochrane export holds several copies of the same paper with
+# different DOI formats, accession numbers or slightly different titles. Each record is
+# matched against an incremental index (DOI, accession number, normalised title, then
+# MinHash/LSH on title shingles) so only one canonical record per cluster is screened.
+import re
+import zlib
+import unicodedata
+import numpy as np
+
+NUM_PERM = 64        # MinHash signature length
+BANDS = 16           # LSH bands of NUM_PERM // BANDS rows each
+THRESHOLD = 0.8      # minimum Jaccard similarity of title shingles to call two records duplicates
+ID_THRESHOLD = 0.5   # looser title check for records sharing a DOI or accession number
+SHINGLE_SIZE = 4     # character shingles
+MIN_FUZZY_WORDS = 4  # shorter titles are only matched exactly
+
+_MERSENNE_PRIME = np.uint64((1 << 31) - 1)  # a * x stays below 2^63 for 32-bit shingle hashes
+_DOI_PATTERN = re.compile(r"10\.\d{4,9}/\S+")
+_NON_ALNUM = re.compile(r"[\W_]+")
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and np.isnan(value)) or str(value).strip() == ""
+
+
+def normalize_doi(doi):
+    """
+    Reduce a DOI to its bare lower-case form, e.g. https://dx.doi.org/10.1152/X -> 10.1152/x.
+
+    Returns: normalised DOI, or None if there is no DOI in the value.
+    """
+    if _is_missing(doi):
+        return None
+    match = _DOI_PATTERN.search(str(doi).strip().lower())
+    if match is None:
+        return None
+    return match.group(0).rstrip(".,;")
+
+
+def normalize_accession(accession):
+    """Upper-case and strip an accession number; None when missing."""
+    if _is_missing(accession):
+        return None
+    return str(accession).strip().upper()
+
+
+def normalize_title(title):
+    """
+    Normalise a title for matching: strip accents, lower-case and collapse punctuation to spaces.
+    Exports replace hyphens with underscores, so underscores count as punctuation too.
+    """
+    if _is_missing(title):
+        return ""
+    title = unicodedata.normalize("NFKD", str(title)).encode("ascii", "ignore").decode("ascii")
+    return _NON_ALNUM.sub(" ", title.lower()).strip()
+
+
+def title_shingles(normalized_title, size=SHINGLE_SIZE):
+    """Return the set of hashed character shingles of a normalised title."""
+    text = normalized_title.replace(" ", "")
+    if not text:
+        return set()
+    if len(text) <= size:
+        return {zlib.crc32(text.encode())}
+    return {zlib.crc32(text[i:i + size].encode()) for i in range(len(text) - size + 1)}
+
+
+def jaccard(a, b):
+    """Jaccard similarity of two shingle sets."""
+    return len(a & b) / len(a | b)
+
+
+class DeduplicationIndex:
+    """
+    Incremental duplicate detector. add() returns the canonical idx for each record, so it can
+    sit in a streaming pipeline; memory and time grow linearly with the number of records.
+
+    Identifiers alone are not trusted: conference supplements share one DOI across many
+    abstracts, so a DOI or accession match still needs a similar title, and two records
+    with different DOIs are never merged on title similarity.
+    """
+
+    def __init__(self, threshold=THRESHOLD, num_perm=NUM_PERM, bands=BANDS, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.by_doi = {}
+        self.by_accession = {}
+        self.by_title = {}
+        self.buckets = {}     # (band, band signature) -> canonical idxs
+        self.canonical = {}   # canonical idx -> (doi, title shingles), for verifying matches
+        self.canonical_of = {}
+
+    def _signature(self, shingles):
+        x = np.fromiter(shingles, dtype=np.uint64, count=len(shingles))[:, None]
+        # One universal hash (a * x + b) mod p per permutation, minimised over the shingles
+        return ((self._a * x + self._b) % _MERSENNE_PRIME).min(axis=0)
+
+    def _band_keys(self, signature):
+        return [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+                for band in range(self.bands)]
+
+    def _compatible(self, candidate, doi, shingles, threshold):
+        """Check a candidate canonical record against the DOI and title of a new record."""
+        candidate_doi, candidate_shingles = self.canonical[candidate]
+        if doi is not None and candidate_doi is not None and doi != candidate_doi:
+            return False
+        if not shingles or not candidate_shingles:
+            return True
+        return jaccard(shingles, candidate_shingles) >= threshold
+
+    def _fuzzy_match(self, doi, shingles, band_keys):
+        candidates = set()
+        for key in band_keys:
+            candidates.update(self.buckets.get(key, ()))
+        best, best_score = None, self.threshold
+        for candidate in candidates:
+            if not self._compatible(candidate, doi, shingles, self.threshold):
+                continue
+            score = jaccard(shingles, self.canonical[candidate][1])
+            if score >= best_score:
+                best, best_score = candidate, score
+        return best
+
+    def add(self, idx, title, doi=None, accession=None):
+        """
+        Register a record and find the cluster it belongs to.
+
+        Parameters:
+        idx - row index of the record.
+        title, doi, accession - raw values from the export.
+
+        Returns: idx of the canonical record of its cluster (idx itself for a new paper).
+        """
+        doi = normalize_doi(doi)
+        accession = normalize_accession(accession)
+        norm_title = normalize_title(title)
+
+        shingles = title_shingles(norm_title)
+
+        canonical = None
+        for lookup, key in ((self.by_doi, doi), (self.by_accession, accession), (self.by_title, norm_title)):
+            candidate = lookup.get(key) if key else None
+            if candidate is not None and self._compatible(candidate, doi, shingles, ID_THRESHOLD):
+                canonical = candidate
+                break
+
+        band_keys = None
+        if canonical is None and len(norm_title.split()) >= MIN_FUZZY_WORDS:
+            band_keys = self._band_keys(self._signature(shingles))
+            canonical = self._fuzzy_match(doi, shingles, band_keys)
+
+        if canonical is None:
+            canonical = idx
+            self.canonical[idx] = (doi, shingles)
+            for key in band_keys or ():
+                self.buckets.setdefault(key, []).append(idx)
+
+        # Every identifier seen points at the canonical record, so later copies match exactly
+        if doi is not None:
+            self.by_doi.setdefault(doi, canonical)
+        if accession is not None:
+            self.by_accession.setdefault(accession, canonical)
+        if norm_title:
+            self.by_title.setdefault(norm_title, canonical)
+        self.canonical_of[idx] = canonical
+        return canonical
+
+    def report(self):
+        """Count records, unique papers and duplicates seen so far."""
+        records = len(self.canonical_of)
+        unique = sum(1 for idx, canonical in self.canonical_of.items() if idx == canonical)
+        return {"records": records, "unique": unique, "duplicates": records - unique}
+
+
+def deduplicate(df, title_col="title", doi_col="DOI", accession_col="Accessionnumber", index=None):
+    """
+    Assign every row of an export to a duplicate cluster.
+
+    Parameters:
+    df - DataFrame of articles.
+    title_col, doi_col, accession_col - column names; missing columns are ignored.
+    index - optional DeduplicationIndex to extend.
+
+    Returns: copy of df with canonical_idx and is_duplicate columns.
+    """
+    import pandas as pd
+    index = index or DeduplicationIndex()
+    titles = df[title_col] if title_col in df else pd.Series(None, index=df.index)
+    dois = df[doi_col] if doi_col in df else pd.Series(None, index=df.index)
+    accessions = df[accession_col] if accession_col in df else pd.Series(None, index=df.index)
+    canonical = [index.add(idx, title, doi, accession)
+                 for idx, title, doi, accession in zip(df.index, titles, dois, accessions)]
+    out = df.copy()
+    out["canonical_idx"] = canonical
+    out["is_duplicate"] = out["canonical_idx"] != out.index
+    print(f"Deduplication: {index.report()}")
+    return out
+
+
+def fan_out(results, canonical_of):
+    """
+    Copy each canonical record's screening result to every duplicate in its cluster.
+
+    Parameters:
+    results - dict of idx -> screening result for the canonical records.
+    canonical_of - dict of idx -> canonical idx (DeduplicationIndex.canonical_of).
+
+    Returns: dict of idx -> result for every record.
+    """
+    return {idx: results.get(canonical) for idx, canonical in canonical_of.items()}
@@ -0,0 +1,93 @@
+# Import-time benchmark for the pipeline modules and command line tools.
+# Each module is imported in a fresh interpreter with python -X importtime; its cumulative
+# import time is checked against a budget, and heavy packages that are only needed once work
+# starts (pandas, openai, pyarrow, ...) must not be loaded by the import itself.
+# Run from anywhere: python Scripts/import_benchmark.py; exits 1 on a regression.
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPEATS = 3
+
+# Module -> budget in seconds for its cumulative import time (interpreter start-up excluded).
+# numpy, loaded by most modules, accounts for about 0.1 s of these and asyncio for 0.05 s.
+BUDGETS = {
+    "response_cache": 0.1,
+    "response_schema": 0.1,
+    "llm_backends": 0.2,
+    "rate_limiter": 0.2,
+    "prompt_registry": 0.4,
+    "utils": 0.4,
+    "ingest": 0.4,
+    "deduplication": 0.4,
+    "results_store": 0.4,
+    "run_manifest": 0.4,
+    "packing": 0.4,
+    "prefilter": 0.4,
+    "batch_mode": 0.5,
+    "screening_engine": 0.5,
+    "job_manager": 0.5,
+    "results_explorer": 0.4,
+}
+
+# Packages imported inside the functions that use them, never at module import
+DEFERRED = ("pandas", "openai", "pyarrow", "tiktoken", "dotenv", "httpx", "plotly", "matplotlib",
+            "sklearn", "torch", "transformers", "sentence_transformers", "faiss")
+
+
+def measure(module):
+    """
+    Import module in a fresh interpreter.
+
+    Returns: (cumulative import time in seconds, deferred packages it loaded).
+    """
+    code = (f"import {module}, sys, json; "
+            f"print(json.dumps([name for name in {DEFERRED!r} if name in sys.modules]))")
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=SCRIPTS_DIR,
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr.strip().splitlines()[-1]}")
+    # -X importtime lines are "import time: self [us] | cumulative | imported package"
+    cumulative = 0
+    for line in proc.stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == module:
+            cumulative = int(fields[1])
+    return cumulative / 1e6, json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def run_benchmark(modules=BUDGETS, repeats=REPEATS):
+    """
+    Time the import of every module (best of repeats) and compare it with its budget.
+
+    Returns: list of (module, seconds, budget, deferred packages loaded) rows.
+    """
+    rows = []
+    for module in modules:
+        seconds, loaded = measure(module)
+        for _ in range(repeats - 1):
+            seconds = min(seconds, measure(module)[0])
+        rows.append((module, seconds, BUDGETS.get(module), loaded))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the import time of the pipeline modules.")
+    parser.add_argument("modules", nargs="*", help="modules to check, default every module in BUDGETS")
+    parser.add_argument("--repeat", type=int, default=REPEATS, help="imports per module, the fastest counts")
+    args = parser.parse_args()
+
+    failures = 0
+    print(f"{'module':<20} {'import s':>9} {'budget s':>9}  eager heavy imports")
+    for module, seconds, budget, loaded in run_benchmark(args.modules or BUDGETS, args.repeat):
+        failed = bool(loaded) or (budget is not None and seconds > budget)
+        failures += failed
+        print(f"{module:<20} {seconds:>9.3f} {budget if budget is not None else '-':>9}  "
+              f"{', '.join(loaded) or '-'}{'  <- FAIL' if failed else ''}")
+    if failures:
+        print(f"{failures} module(s) over budget or importing heavy packages eagerly")
+        sys.exit(1)
+    print("All imports within budget")
@@ -0,0 +1,124 @@
+# Streaming ingestion of database exports.
+# Exports run to hundreds of MB with long abstracts, so articles are read in fixed-size
+# chunks and yielded one record at a time; only the columns the pipeline uses are parsed.
+from utils import clean_abstract
+
+CHUNK_SIZE = 1000
+
+# Pipeline field -> accepted column headers, compared case-insensitively
+# (the raw export uses Title/DOI/Accessionnumber, the app was written for title/abstract)
+COLUMN_ALIASES = {
+    "title": ("title",),
+    "abstract": ("abstract",),
+    "doi": ("doi",),
+    "accession": ("accessionnumber", "accession number", "accession"),
+}
+
+
+def _normalize_header(name):
+    return str(name).strip().lstrip("\ufeff").lower()
+
+
+def resolve_columns(columns):
+    """
+    Map the columns of an export onto pipeline fields, ignoring case and stray whitespace.
+
+    Parameters:
+    columns - column headers as read from the file.
+
+    Returns: dict of original header -> pipeline field.
+    """
+    lookup = {alias: field for field, aliases in COLUMN_ALIASES.items() for alias in aliases}
+    mapping = {}
+    for column in columns:
+        field = lookup.get(_normalize_header(column))
+        if field is not None and field not in mapping.values():
+            mapping[column] = field
+    return mapping
+
+
+def _rewind(source):
+    if hasattr(source, "seek"):
+        source.seek(0)
+
+
+def read_preview(source, nrows=5):
+    """Read the first few rows of an export for display, without loading the whole file."""
+    import pandas as pd
+    _rewind(source)
+    preview = pd.read_csv(source, nrows=nrows, encoding="utf-8-sig")
+    _rewind(source)
+    return preview
+
+
+def iter_article_chunks(source, chunksize=CHUNK_SIZE):
+    """
+    Read an export in chunks of at most chunksize rows.
+
+    Parameters:
+    source - path or file-like object (e.g. a Streamlit upload).
+    chunksize - rows per chunk; peak memory is bounded by the size of one chunk.
+
+    Returns: generator of DataFrames with columns renamed to title, abstract, doi and accession.
+    The index keeps the original row numbers.
+    """
+    import pandas as pd
+    wanted = {alias for aliases in COLUMN_ALIASES.values() for alias in aliases}
+    _rewind(source)
+    reader = pd.read_csv(source, chunksize=chunksize, encoding="utf-8-sig",
+                         usecols=lambda column: _normalize_header(column) in wanted)
+    with reader:
+        for chunk in reader:
+            mapping = resolve_columns(chunk.columns)
+            if "title" not in mapping.values():
+                raise ValueError(f"No title column found in the export (columns: {list(chunk.columns)})")
+            chunk = chunk[list(mapping)].rename(columns=mapping)
+            yield chunk.reindex(columns=list(COLUMN_ALIASES))
+
+
+def count_articles(source, chunksize=CHUNK_SIZE):
+    """Number of articles in an export (e.g. the total of a progress bar), read chunk by chunk."""
+    return sum(len(chunk) for chunk in iter_article_chunks(source, chunksize))
+
+
+def iter_articles(source, chunksize=CHUNK_SIZE):
+    """
+    Yield one record per article from an export, reading it chunk by chunk.
+
+    Parameters:
+    source - path or file-like object.
+    chunksize - rows parsed at a time.
+
+    Returns: generator of dicts with idx, title, abstract, doi and accession, in file order.
+    """
+    for chunk in iter_article_chunks(source, chunksize):
+        for idx, title, abstract, doi, accession in chunk.itertuples(name=None):
+            yield {"idx": idx,
+                   "title": title,
+                   "abstract": clean_abstract(abstract),
+                   "doi": doi,
+                   "accession": accession}
+
+
+def iter_articles_ranked(source, ranked_ids, limit=None, chunksize=CHUNK_SIZE):
+    """
+    Yield articles in priority order, e.g. a relevance ranking from Notebooks/ranking.py.
+
+    Parameters:
+    source - path or file-like object.
+    ranked_ids - article indices, most relevant first; articles not listed are skipped.
+    limit - screen only the first limit ranked articles (stop early).
+
+    Returns: generator of records as yielded by iter_articles. The export is read once and
+    only the ranked articles are held in memory.
+    """
+    ranked_ids = list(ranked_ids)[:limit]
+    position = {int(idx): i for i, idx in enumerate(ranked_ids)}
+    found = [None] * len(ranked_ids)
+    for record in iter_articles(source, chunksize):
+        i = position.get(record["idx"])
+        if i is not None:
+            found[i] = record
+    for record in found:
+        if record is not None:
+            yield record
@@ -0,0 +1,249 @@
+# Background screening jobs for the Streamlit app.
+# Streamlit runs the page script on a fresh thread for every interaction and stops it on a
+# rerun, so a screening run cannot live inside the page. Jobs go to one JobManager per server
+# process instead: a small thread pool works through them in submission order, each job in its
+# own directory (JOBS_DIR/<job_id>) with a copy of the export, its results store and its run
+# manifest. The page polls a job's progress and reads its partial results while it runs; jobs
+# outlive the browser session, can be cancelled and are resumed from their manifest.
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from ingest import count_articles
+from llm_backends import make_backend
+from rate_limiter import RateLimitScheduler, REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE
+from results_store import ResultsStore, RESULTS_PATH
+from run_manifest import MANIFEST_PATH
+from screening_engine import process_articles, results_path_for
+
+JOBS_DIR = "screening_jobs"
+MAX_JOBS = 2  # jobs screened at once; later submissions wait in the queue
+QUEUED, RUNNING, COMPLETED, FAILED, CANCELLED, INTERRUPTED = (
+    "queued", "running", "completed", "failed", "cancelled", "interrupted")
+ACTIVE = (QUEUED, RUNNING)
+RESUMABLE = (FAILED, CANCELLED, INTERRUPTED)
+
+
+class Job:
+    """
+    State of one screening job, saved to job.json in its directory whenever it changes.
+
+    Parameters:
+    job_id - short unique ID, also the name of the job directory.
+    directory - folder holding the job's input, results and manifest.
+    name - original name of the uploaded export, for display.
+    options - process_articles arguments (prompts, pack_size, prefilter, ...) plus backend and model.
+    """
+
+    def __init__(self, job_id, directory, name=None, options=None):
+        self.job_id = job_id
+        self.directory = directory
+        self.name = name
+        self.options = options or {}
+        self.status = QUEUED
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.total = None
+        self.error = None
+        self.cancel_event = threading.Event()
+        self.future = None
+
+    @property
+    def input_path(self):
+        return os.path.join(self.directory, "input.csv")
+
+    @property
+    def results_path(self):
+        return os.path.join(self.directory, RESULTS_PATH)
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.directory, MANIFEST_PATH)
+
+    def results_paths(self):
+        """Results store of every prompt version the job screens with."""
+        return [results_path_for(self.results_path, prompt) for prompt in self.options.get("prompts") or [None]]
+
+    def progress(self):
+        """
+        Articles with a stored result so far, read from the results stores without opening them for writing.
+
+        Returns: dict of done, total (None until the export has been counted) and fraction.
+        """
+        paths = self.results_paths()
+        done = sum(len(ResultsStore(path, readonly=True)) for path in paths)
+        total = self.total * len(paths) if self.total is not None else None
+        fraction = min(1.0, done / total) if total else (1.0 if self.status == COMPLETED else 0.0)
+        return {"done": done, "total": total, "fraction": fraction}
+
+    def to_dict(self):
+        return {"job_id": self.job_id, "name": self.name, "options": self.options, "status": self.status,
+                "created": self.created, "started": self.started, "finished": self.finished,
+                "total": self.total, "error": self.error}
+
+    @classmethod
+    def from_dict(cls, data, directory):
+        job = cls(data["job_id"], directory, data.get("name"), data.get("options"))
+        for field in ("status", "created", "started", "finished", "total", "error"):
+            setattr(job, field, data.get(field))
+        return job
+
+    def save(self):
+        path = os.path.join(self.directory, "job.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(path + ".tmp", path)
+
+
+class JobManager:
+    """
+    Queue of screening jobs run by a pool of max_jobs worker threads, shared by every session
+    of the app. Each running job gets its own backend and an equal share of the account's rate
+    limits, so concurrent jobs stay under the limits together; all jobs share the response cache.
+
+    Parameters:
+    jobs_dir - folder of the job directories; jobs found there are listed again after a restart,
+               the ones that were queued or running as interrupted (resume them with resume()).
+    max_jobs - jobs screened at the same time.
+    requests_per_minute, tokens_per_minute - account limits, split evenly between the running jobs.
+    """
+
+    def __init__(self, jobs_dir=JOBS_DIR, max_jobs=MAX_JOBS, requests_per_minute=REQUESTS_PER_MINUTE,
+                 tokens_per_minute=TOKENS_PER_MINUTE):
+        self.jobs_dir = jobs_dir
+        self.max_jobs = max_jobs
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="screening-job")
+        os.makedirs(jobs_dir, exist_ok=True)
+        for job_id in os.listdir(jobs_dir):
+            path = os.path.join(jobs_dir, job_id, "job.json")
+            if not os.path.exists(path):
+                continue
+            with open(path) as f:
+                job = Job.from_dict(json.load(f), os.path.dirname(path))
+            if job.status in ACTIVE:
+                job.status = INTERRUPTED  # the server stopped while it ran
+                job.save()
+            self.jobs[job.job_id] = job
+
+    def submit(self, source, name=None, backend="openai", model=None, **options):
+        """
+        Queue a screening job.
+
+        Parameters:
+        source - the export: a path, a file-like object (e.g. a Streamlit upload) or its bytes;
+                 it is copied into the job directory, so the upload can go away.
+        name - display name, e.g. the uploaded file name.
+        backend, model - llm_backends.make_backend settings for the job's backend.
+        options - further process_articles arguments (prompts, pack_size, prefilter, deduplicate, ...).
+
+        Returns: job ID.
+        """
+        job_id = uuid.uuid4().hex[:12]
+        directory = os.path.join(self.jobs_dir, job_id)
+        os.makedirs(directory)
+        job = Job(job_id, directory, name, {"backend": backend, "model": model, **options})
+        if isinstance(source, (bytes, bytearray)):
+            with open(job.input_path, "wb") as f:
+                f.write(source)
+        elif hasattr(source, "read"):
+            source.seek(0)
+            with open(job.input_path, "wb") as f:
+                shutil.copyfileobj(source, f)
+            source.seek(0)
+        else:
+            shutil.copyfile(source, job.input_path)
+        job.save()
+        with self._lock:
+            self.jobs[job_id] = job
+            job.future = self._executor.submit(self._run, job)
+        print(f"Queued job {job_id} ({name or source})")
+        return job_id
+
+    def resume(self, job_id):
+        """Queue a cancelled, failed or interrupted job again; the articles it finished are skipped."""
+        job = self.jobs[job_id]
+        with self._lock:
+            if job.status not in RESUMABLE:
+                raise ValueError(f"Job {job_id} is {job.status}; only {', '.join(RESUMABLE)} jobs can be resumed")
+            job.status, job.error, job.finished = QUEUED, None, None
+            job.cancel_event = threading.Event()
+            job.save()
+            job.future = self._executor.submit(self._run, job)
+        return job_id
+
+    def cancel(self, job_id):
+        """Stop a job: a queued job never starts, a running one stops after its requests in flight."""
+        job = self.jobs[job_id]
+        job.cancel_event.set()
+        if job.future is not None and job.future.cancel():
+            job.status, job.finished = CANCELLED, time.time()
+            job.save()
+
+    def get(self, job_id):
+        """The Job with this ID, or None."""
+        return self.jobs.get(job_id)
+
+    def list_jobs(self, job_ids=None):
+        """Jobs (all, or those in job_ids), newest first."""
+        jobs = [job for job_id, job in self.jobs.items() if job_ids is None or job_id in job_ids]
+        return sorted(jobs, key=lambda job: job.created, reverse=True)
+
+    def load_results(self, job_id, prompt=None, columns=None):
+        """Results of a job so far as a DataFrame (see ResultsStore.load), safe to call while it runs."""
+        job = self.jobs[job_id]
+        return ResultsStore(results_path_for(job.results_path, prompt), readonly=True).load(columns)
+
+    def _run(self, job):
+        if job.cancel_event.is_set():
+            job.status, job.finished = CANCELLED, time.time()
+            job.save()
+            return
+        job.status, job.started = RUNNING, time.time()
+        job.save()
+        options = dict(job.options)
+        backend = make_backend(options.pop("backend", "openai"), options.pop("model", None))
+        # Each running job gets its share of the limits; its scheduler belongs to its own event loop
+        scheduler = RateLimitScheduler(requests_per_minute=max(1, self.requests_per_minute // self.max_jobs),
+                                       tokens_per_minute=max(1, self.tokens_per_minute // self.max_jobs))
+        try:
+            if job.total is None:
+                job.total = count_articles(job.input_path)
+                job.save()
+            process_articles(job.input_path, results_path=job.results_path, client=backend, scheduler=scheduler,
+                             manifest_path=job.manifest_path, resume="latest", cancel=job.cancel_event, **options)
+            job.status = CANCELLED if job.cancel_event.is_set() else COMPLETED
+        except Exception as e:
+            print(f"ERROR: Job {job.job_id} failed - {e!r}")
+            job.status, job.error = FAILED, repr(e)
+        finally:
+            job.finished = time.time()
+            job.save()
+
+    def shutdown(self, cancel=True):
+        """Stop the worker threads, cancelling the jobs that are still queued or running."""
+        if cancel:
+            for job in self.jobs.values():
+                if job.status in ACTIVE:
+                    self.cancel(job.job_id)
+        self._executor.shutdown(wait=True)
+
+
+if __name__ == "__main__":
+    # List the jobs in a jobs folder, e.g. python job_manager.py screening_jobs
+    jobs_dir = sys.argv[1] if len(sys.argv) > 1 else JOBS_DIR
+    for name in sorted(os.listdir(jobs_dir)) if os.path.isdir(jobs_dir) else []:
+        path = os.path.join(jobs_dir, name, "job.json")
+        if os.path.exists(path):
+            with open(path) as f:
+                job = json.load(f)
+            print(job["job_id"], job["status"], job["name"], job["total"], job["error"] or "")
@@ -0,0 +1,261 @@
+# Provider-agnostic LLM backends, configured per screening run.
+# A backend owns one async client whose keep-alive connection pool is shared by every worker,
+# the model it serves (or None to use the prompt version's model) and its token prices, and it
+# tracks calls, tokens, latency and cost. Hosted OpenAI, a local OpenAI-compatible server
+# (llama.cpp, vLLM, Ollama; fully offline) and a recorded-response replay for benchmarks all
+# expose the same create() used by screening_engine. The openai package and the client are
+# only loaded on the first request, so building a backend (or caching one in the app) is cheap.
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+
+MAX_CONNECTIONS = 64           # open connections per backend, shared by all workers
+MAX_KEEPALIVE_CONNECTIONS = 32  # idle connections kept alive between calls
+KEEPALIVE_EXPIRY = 60          # seconds an idle connection is kept
+LOCAL_BASE_URL = "http://127.0.0.1:8080/v1"  # llama.cpp server default; vLLM serves on :8000/v1
+LOCAL_MODEL = "local-model"
+RECORDING_PATH = "recorded_responses.jsonl"
+
+# USD per million (input, output) tokens; models not listed are costed at 0
+PRICES = {
+    "gpt-4-turbo": (10.0, 30.0),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-4.1": (2.0, 8.0),
+    "gpt-4.1-mini": (0.4, 1.6),
+}
+
+
+class LLMBackend:
+    """
+    Base class: times every create() call and adds its usage to the counters.
+    Subclasses implement _create(**request) returning a ChatCompletion.
+
+    Parameters:
+    model - model requested from this backend, None to use the prompt version's model.
+    prices - (input, output) USD per million tokens, looked up in PRICES by model if None.
+    structured_output - "json_schema", "tools" or None to choose by model (response_schema.request_options).
+    """
+    name = "backend"
+
+    def __init__(self, model=None, prices=None, structured_output=None):
+        self.model = model
+        self.prices = prices
+        self.structured_output = structured_output
+        self.counters = {"calls": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                         "latency_s": 0.0, "cost_usd": 0.0}
+
+    async def create(self, **request):
+        """Send one chat completion request (the arguments of chat.completions.create)."""
+        start = time.perf_counter()
+        try:
+            response = await self._create(**request)
+        except Exception:
+            self.counters["errors"] += 1
+            raise
+        self._record(request.get("model"), response, time.perf_counter() - start)
+        return response
+
+    async def _create(self, **request):
+        raise NotImplementedError
+
+    def _record(self, model, response, latency):
+        usage = getattr(response, "usage", None)
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        input_price, output_price = self.prices if self.prices is not None else PRICES.get(model, (0.0, 0.0))
+        self.counters["calls"] += 1
+        self.counters["prompt_tokens"] += prompt_tokens
+        self.counters["completion_tokens"] += completion_tokens
+        self.counters["latency_s"] += latency
+        self.counters["cost_usd"] += (prompt_tokens * input_price + completion_tokens * output_price) / 1e6
+
+    def report(self):
+        """Counters plus mean latency per call, for the end-of-run summary."""
+        calls = self.counters["calls"]
+        report = {"backend": self.name, "model": self.model, **self.counters}
+        report["latency_s"] = round(report["latency_s"], 3)
+        report["mean_latency_s"] = round(self.counters["latency_s"] / calls, 3) if calls else 0.0
+        report["cost_usd"] = round(report["cost_usd"], 4)
+        return report
+
+    async def aclose(self):
+        pass
+
+
+def pooled_http_client(max_connections=MAX_CONNECTIONS, max_keepalive=MAX_KEEPALIVE_CONNECTIONS, timeout=None):
+    """Async HTTP client with a keep-alive pool sized for the worker pool, or None without httpx."""
+    try:
+        import httpx
+    except ImportError:  # the openai client's own default connection pool is used
+        return None
+    return httpx.AsyncClient(limits=httpx.Limits(max_connections=max_connections,
+                                                 max_keepalive_connections=max_keepalive,
+                                                 keepalive_expiry=KEEPALIVE_EXPIRY),
+                             timeout=timeout if timeout is not None else httpx.Timeout(600.0, connect=10.0))
+
+
+class OpenAIBackend(LLMBackend):
+    """
+    Hosted OpenAI, or any OpenAI-compatible endpoint given by base_url.
+
+    Parameters:
+    model - model name, None to use the prompt version's model.
+    api_key - API key, defaults to the UoB organisation key from the environment.
+    base_url - optional OpenAI-compatible endpoint.
+    client - an existing AsyncOpenAI client to wrap instead of building one.
+    max_connections - size of the shared connection pool.
+
+    Without client, the AsyncOpenAI client is built on the first request and rebuilt when a
+    later asyncio.run uses the backend, since its connection pool belongs to one event loop;
+    the replaced client is closed by the next aclose(). A client passed in is never closed here.
+    """
+    name = "openai"
+
+    def __init__(self, model=None, api_key=None, base_url=None, client=None, max_connections=MAX_CONNECTIONS,
+                 prices=None, structured_output=None):
+        super().__init__(model, prices, structured_output)
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self._client = client
+        self._owns_client = client is None
+        self._loop = None
+        self._stale = []  # clients built for earlier event loops, closed by aclose()
+
+    @property
+    def client(self):
+        """The AsyncOpenAI client, built for the running event loop if there is none yet."""
+        loop = asyncio.get_running_loop()
+        if self._owns_client and (self._client is None or self._loop is not loop):
+            from openai import AsyncOpenAI
+            if self._client is not None:
+                self._stale.append(self._client)
+            api_key = self.api_key
+            if api_key is None:
+                from dotenv import load_dotenv
+                load_dotenv()
+                api_key = os.getenv('openaiuob_api_key')  # API key via UoB organisation
+            http_client = pooled_http_client(self.max_connections,
+                                             min(self.max_connections, MAX_KEEPALIVE_CONNECTIONS))
+            options = {"http_client": http_client} if http_client is not None else {}
+            # Retries are disabled here, RateLimitScheduler handles them
+            self._client = AsyncOpenAI(api_key=api_key, base_url=self.base_url, max_retries=0, **options)
+            self._loop = loop
+        return self._client
+
+    async def _create(self, **request):
+        return await self.client.chat.completions.create(**request)
+
+    async def aclose(self):
+        """Close the clients this backend built; it builds a fresh one if it is used again."""
+        stale, self._stale = self._stale, []
+        for client in stale:
+            try:
+                await client.close()
+            except Exception as e:  # its connections belong to an event loop that has gone
+                print(f"WARNING: Could not close a client of an earlier event loop - {e!r}")
+        if self._owns_client and self._client is not None:
+            await self._client.close()
+            self._client = None
+
+
+class LocalBackend(OpenAIBackend):
+    """
+    Local OpenAI-compatible inference server (llama.cpp server, vLLM, Ollama) running on this
+    machine; no API key, no network beyond localhost and no cost. Replies are constrained with
+    a json_schema response format, which these servers turn into a grammar.
+
+    Parameters:
+    model - model name the server was started with (LOCAL_LLM_MODEL in the environment by default).
+    base_url - server endpoint (LOCAL_LLM_URL in the environment, else LOCAL_BASE_URL).
+    """
+    name = "local"
+
+    def __init__(self, model=None, base_url=None, max_connections=MAX_CONNECTIONS):
+        from dotenv import load_dotenv
+        load_dotenv()
+        super().__init__(model or os.getenv("LOCAL_LLM_MODEL", LOCAL_MODEL), api_key="local",
+                         base_url=base_url or os.getenv("LOCAL_LLM_URL", LOCAL_BASE_URL),
+                         max_connections=max_connections, prices=(0.0, 0.0), structured_output="json_schema")
+
+
+def request_key(request):
+    """Hash of a chat completion request, the key recorded responses are stored under."""
+    return hashlib.sha256(json.dumps(request, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class RecordedBackend(LLMBackend):
+    """
+    Replays responses recorded in a JSON Lines file, for offline benchmarks and tests.
+
+    Parameters:
+    path - recording file; one {"key": request_key, "response": ChatCompletion dict} per line.
+    source - optional backend to call (and record from) when a request has no recording;
+             without it an unrecorded request raises KeyError.
+    latency - optional seconds to sleep per replayed call, to imitate a real endpoint.
+    """
+    name = "recorded"
+
+    def __init__(self, path=RECORDING_PATH, source=None, latency=0.0):
+        super().__init__(source.model if source is not None else None, prices=(0.0, 0.0),
+                         structured_output=source.structured_output if source is not None else None)
+        self.path = path
+        self.source = source
+        self.latency = latency
+        self._lock = threading.Lock()
+        self.responses = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        item = json.loads(line)
+                        self.responses[item["key"]] = item["response"]
+
+    async def _create(self, **request):
+        key = request_key(request)
+        if key in self.responses:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            from openai.types.chat import ChatCompletion
+            return ChatCompletion.model_validate(self.responses[key])
+        if self.source is None:
+            raise KeyError(f"No recorded response for request {key[:12]} in {self.path}")
+        response = await self.source.create(**request)
+        self.responses[key] = response.model_dump()
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"key": key, "response": self.responses[key]}, ensure_ascii=False) + "\n")
+        return response
+
+    async def aclose(self):
+        if self.source is not None:
+            await self.source.aclose()
+
+
+def as_backend(client):
+    """Wrap a bare AsyncOpenAI client in an OpenAIBackend; backends are returned unchanged."""
+    return client if isinstance(client, LLMBackend) else OpenAIBackend(client=client)
+
+
+def make_backend(kind="openai", model=None, base_url=None, recording=RECORDING_PATH, api_key=None):
+    """
+    Build a backend from run settings (e.g. the screening_engine command line).
+
+    Parameters:
+    kind - "openai" (hosted, or any OpenAI-compatible base_url), "local" or "recorded".
+    model - model to request, None for the prompt version's model (local: LOCAL_LLM_MODEL).
+    base_url - endpoint override.
+    recording - recording file of the "recorded" backend; base_url or model given with it
+                record missing responses from that endpoint.
+    """
+    if kind == "openai":
+        return OpenAIBackend(model, api_key=api_key, base_url=base_url)
+    if kind == "local":
+        return LocalBackend(model, base_url)
+    if kind == "recorded":
+        source = OpenAIBackend(model, api_key=api_key, base_url=base_url) if base_url or model else None
+        return RecordedBackend(recording, source)
+    raise ValueError(f"Unknown backend {kind!r}; use openai, local or recorded")
@@ -0,0 +1,135 @@
+# Multi-article packing: screen several abstracts per LLM call.
+# The screening instructions and JSON schema are ~1.5k tokens and identical for every article,
+# so packing N articles into one request pays for them once instead of N times. Each article
+# carries a stable ID and the reply is a JSON array keyed by those IDs.
+import sys
+import json
+
+from utils import construct_prompt
+from prompt_registry import get_prompt, MODEL
+from rate_limiter import estimate_tokens
+from ingest import iter_articles
+
+PACK_SIZE = 8
+CONTEXT_WINDOW = 128000         # gpt-4-turbo
+MAX_OUTPUT_TOKENS = 4096        # gpt-4-turbo completion limit, shared by every article in a pack
+OUTPUT_TOKENS_PER_ARTICLE = 450  # typical size of one article's JSON result
+
+
+def article_id(idx):
+    """Stable ID an article is referred to by inside a packed prompt."""
+    return f"A{idx}"
+
+
+def construct_packed_prompt(records, prompt=None):
+    """
+    Create one prompt screening several articles.
+
+    Parameters:
+    records - list of article records with idx, title and abstract.
+    prompt - PromptVersion (or registry name) whose instructions and schema are used; default prompt if None.
+
+    Returns a formatted prompt whose reply is {"results": [...]} with one entry per article ID.
+    """
+    articles = "\n".join(f'Article ID: "{article_id(record["idx"])}"\n'
+                         f'Title: "{record["title"]}"\n'
+                         f'Abstract: "{record["abstract"]}"\n'
+                         for record in records)
+    prompt = get_prompt(prompt)
+    return f"""{prompt.instructions}Screen each of the following {len(records)} articles independently, applying all of the rules above to each one.
+
+{articles}
+Output MUST strictly follow this JSON structure, with exactly one entry in "results" per Article ID:
+{{
+  "results": [
+    {{
+  "id": "the Article ID exactly as given",
+  "document_info": {{
+    "title": "the article title",
+    "abstract_preview": "first 50 characters of the abstract..."
+  }},
+{prompt.term_schema}
+    }}
+  ]
+}}
+
+Respond **ONLY** with the JSON output and nothing else.
+
+"""
+
+
+def pack_records(records, max_pack=PACK_SIZE, context_window=CONTEXT_WINDOW,
+                 max_output_tokens=MAX_OUTPUT_TOKENS, model=MODEL, prompt=None):
+    """
+    Group articles into packs that fit the model's context window and completion limit.
+
+    Parameters:
+    records - iterable of article records.
+    max_pack - upper bound on articles per call.
+    context_window - model context size in tokens (prompt plus reply).
+    max_output_tokens - completion limit; caps how many JSON results fit in one reply.
+    model - model the packs are sent to, which picks the token encoding.
+    prompt - PromptVersion (or registry name) the packs are rendered with; default prompt if None.
+
+    Returns: generator of lists of records.
+    """
+    preamble = estimate_tokens(construct_packed_prompt([], prompt), model)
+    limit = max(1, min(max_pack, max_output_tokens // OUTPUT_TOKENS_PER_ARTICLE))
+    pack, tokens = [], preamble
+    for record in records:
+        article_tokens = estimate_tokens(f'{record["title"]} {record["abstract"]}', model) + 20
+        output_tokens = OUTPUT_TOKENS_PER_ARTICLE * (len(pack) + 1)
+        if pack and (len(pack) >= limit or tokens + article_tokens + output_tokens > context_window):
+            yield pack
+            pack, tokens = [], preamble
+        pack.append(record)
+        tokens += article_tokens
+    if pack:
+        yield pack
+
+
+def completion_budget(records):
+    """Completion tokens to allow for a packed reply."""
+    return min(MAX_OUTPUT_TOKENS, OUTPUT_TOKENS_PER_ARTICLE * len(records) + 200)
+
+
+def parse_packed_response(data, records):
+    """
+    Match the entries of a packed reply back to their articles.
+
+    Parameters:
+    data - parsed JSON reply ({"results": [...]} or a bare list).
+    records - the records that were packed into the prompt.
+
+    Returns: dict of idx -> result for every article with a well-formed entry.
+    Articles missing from the dict should be re-screened on their own.
+    """
+    entries = data.get("results") if isinstance(data, dict) else data
+    if not isinstance(entries, list):
+        return {}
+    by_id = {}
+    for entry in entries:
+        if isinstance(entry, dict) and isinstance(entry.get("term_analysis"), dict):
+            by_id[str(entry.get("id"))] = entry
+    parsed = {}
+    for record in records:
+        entry = by_id.get(article_id(record["idx"]))
+        if entry is not None:
+            parsed[record["idx"]] = {key: value for key, value in entry.items() if key != "id"}
+    return parsed
+
+
+def packing_report(articles, calls):
+    """Summarise how many calls packing saved."""
+    return {"articles": articles, "calls": calls,
+            "articles_per_call": round(articles / calls, 2) if calls else 0.0}
+
+
+if __name__ == "__main__":
+    # Show the token saving of packing on a sample export, e.g. python packing.py export.csv
+    records = list(iter_articles(sys.argv[1]))
+    single = sum(estimate_tokens(construct_prompt(r["title"], r["abstract"])) for r in records)
+    packs = list(pack_records(records))
+    packed = sum(estimate_tokens(construct_packed_prompt(pack)) for pack in packs)
+    print(json.dumps({"single_prompt_tokens": single, "packed_prompt_tokens": packed,
+                      **packing_report(len(records), len(packs))}, indent=2))
@@ -0,0 +1,268 @@
+# Local deterministic pre-filter ahead of LLM screening.
+# Most records in the combined export never mention Mendelian randomisation, BMI/adiposity or
+# blood pressure. A single compiled regex over the term categories of construct_prompt finds
+# them locally; records matching none of the required categories are excluded without an API
+# call and get a result in the usual JSON schema, flagged with "prefilter": true.
+import sys
+import json
+import time
+import re
+import numpy as np
+
+from ingest import iter_article_chunks
+from utils import clean_abstract
+from response_schema import SCHEMAS, SCREENING_SCHEMA
+
+# Term category -> regex alternatives, matched against lower-cased text.
+# Patterns are deliberately broad: a false match only costs an LLM call, a miss loses a paper.
+CATEGORY_PATTERNS = {
+    "bmi_adiposity": [
+        r"body[\s-]*mass[\s-]*ind(?:ex|ices)", r"\bbmi\b", r"adipos\w*", r"obes\w*", r"overweight",
+        r"waist[\s-]*(?:circumference|(?:to|-)[\s-]*hip)", r"\bwhr\b", r"body[\s-]*fat\w*", r"anthropometr\w*",
+    ],
+    "mendelian_randomisation": [
+        r"mendelian[\s-]*randomi[sz]\w*", r"mendelian", r"\bmr\b", r"instrumental[\s-]*variables?",
+        r"genetic(?:ally)?[\s-]*(?:instruments?|predicted|proxied|determined)",
+    ],
+    "blood_pressure": [
+        r"hypertensi\w*", r"blood[\s-]*pressure", r"systolic", r"diastolic", r"\b[sd]?bp\b",
+        r"antihypertensi\w*",
+    ],
+    "european_ancestry": [
+        r"europe\w*", r"\bwhite\b", r"caucasian\w*", r"uk[\s-]*biobank", r"\b(?:united kingdom|british|england|"
+        r"scotland|wales|ireland|iceland|norw\w+|swed\w+|finn\w*|denmark|danish|german\w*|france|french|"
+        r"netherlands|dutch|belgi\w+|spain|spanish|portug\w+|ital\w+|greece|greek|austria\w*|switzerland|swiss|"
+        r"poland|polish|estonia\w*|hungar\w+|czech\w*)\b",
+    ],
+    "reviews": [
+        r"(?:umbrella|scoping|systematic|narrative|literature)[\s-]*reviews?", r"meta[\s-]*analy[sz]\w*",
+    ],
+}
+# Literal prefixes of the required categories' patterns: every match starts with one of them,
+# so bulk screening finds the anchors with plain substring search and only tries the regex there.
+CATEGORY_ANCHORS = {
+    "bmi_adiposity": (b"body", b"bmi", b"adipos", b"obes", b"overweight", b"waist", b"whr", b"anthropometr"),
+    "mendelian_randomisation": (b"mendelian", b"mr", b"instrumental", b"genetic"),
+    "blood_pressure": (b"hypertensi", b"blood", b"systolic", b"diastolic", b"bp", b"sbp", b"dbp"),
+}
+# Negated ancestry terms ("non-European", "nonwhite") are consumed first so they never count
+NEGATION_PATTERN = r"non[\s-]*(?:european|white|caucasian)\w*"
+# Rarest first: bulk screening narrows the candidates one category at a time
+REQUIRED_CATEGORIES = ("mendelian_randomisation", "bmi_adiposity", "blood_pressure")
+RECORD_SEPARATOR = "\x1e"
+SCREEN_CHUNK = 1000  # records joined per screen_texts call when screening a stream
+FIELD_SEPARATOR = "\x1f"  # keeps matches from running from the title into the abstract
+
+
+def compile_matcher(patterns=CATEGORY_PATTERNS, negation=NEGATION_PATTERN):
+    """Compile every category into one regex with a named group per category."""
+    groups = [f"(?P<negated>{negation})"]
+    groups += [f"(?P<{category}>{'|'.join(alternatives)})" for category, alternatives in patterns.items()]
+    return re.compile("|".join(groups))
+
+
+def _text(value):
+    return "" if value is None or (isinstance(value, float) and np.isnan(value)) else str(value)
+
+
+def _empty(schema):
+    """Value of a response schema node with every field false or empty, in schema order."""
+    kind = schema.get("type")
+    if kind == "object":
+        return {key: _empty(field) for key, field in schema.get("properties", {}).items()}
+    return {"boolean": False, "array": [], "string": ""}.get(kind)
+
+
+class Prefilter:
+    """
+    Keyword pre-screen deciding which records need the LLM at all.
+
+    require="any" (the default) only excludes records matching none of the required categories;
+    require="all" also excludes records missing any one of them, which the screening rules need together.
+    """
+
+    def __init__(self, required=REQUIRED_CATEGORIES, require="any", patterns=CATEGORY_PATTERNS):
+        if require not in ("any", "all"):
+            raise ValueError(f"require must be 'any' or 'all', not {require!r}")
+        self.required = tuple(required)
+        self.require = require
+        self.categories = tuple(patterns)
+        self.matcher = compile_matcher(patterns)
+        self.category_matchers = {category: re.compile("|".join(patterns[category]).encode())
+                                  for category in self.required}
+        self.counters = {"records": 0, "excluded": 0}
+
+    def match(self, title, abstract):
+        """
+        Find the term categories in one article.
+
+        Returns: dict of category -> list of (exact phrase, location) tuples.
+        """
+        title, abstract = _text(title), _text(abstract)
+        found = {}
+        for location, text in (("title", title), ("abstract", abstract)):
+            lowered = text.lower()
+            if len(lowered) != len(text):  # case folding changed offsets; quote the lower-cased text
+                text = lowered
+            for match in self.matcher.finditer(lowered):
+                if match.lastgroup != "negated":
+                    found.setdefault(match.lastgroup, []).append((text[match.start():match.end()], location))
+        return found
+
+    def excludes(self, found):
+        """Decide from match() output whether the record can skip the LLM."""
+        hits = [category in found for category in self.required]
+        return not any(hits) if self.require == "any" else not all(hits)
+
+    def screen(self, record, schema=SCREENING_SCHEMA):
+        """
+        Pre-screen one record (ingest.iter_articles).
+
+        Returns: a result in the given response schema (response_schema.SCHEMAS) if the record
+        is excluded, None if it should go to the LLM.
+        """
+        self.counters["records"] += 1
+        found = self.match(record["title"], record["abstract"])
+        if not self.excludes(found):
+            return None
+        self.counters["excluded"] += 1
+        return self.build_result(record, found, schema)
+
+    def build_result(self, record, found, schema=SCREENING_SCHEMA):
+        """
+        Build the JSON an excluded record is stored with, marking it as decided by the pre-filter.
+
+        Parameters:
+        record - the excluded record; found - its match() output.
+        schema - response schema name of the prompt version the result is stored under; every field
+                 the pre-filter cannot judge (main flags, notes, the study aim) is false or empty.
+        """
+        properties = SCHEMAS[schema]["properties"]
+        term_analysis = {}
+        for category, term in properties["term_analysis"]["properties"].items():
+            matches = found.get(category, [])
+            entry = _empty(term)
+            entry["present"] = bool(matches)
+            entry["locations"] = sorted({location for _, location in matches})
+            if "variations_found" in entry:
+                entry["variations_found"] = list(dict.fromkeys(phrase for phrase, _ in matches))
+            term_analysis[category] = entry
+        missing = [category for category in self.required if category not in found]
+        present = [f"{category}: {', '.join(dict.fromkeys(phrase for phrase, _ in found[category]))}"
+                   for category in self.categories if category in found]
+        justification = (f"Excluded by keyword pre-filter. Missing: {', '.join(missing)}. "
+                         f"Found: {'; '.join(present) or 'none'}.")
+        reason = _empty(properties["Reason"])
+        reason["justify"] = justification
+        if "inclusion_decision" in reason:
+            reason["inclusion_decision"] = "EXCLUDE"
+        if "reasoning" in reason:
+            reason["reasoning"] = justification
+        abstract = _text(record["abstract"])
+        return {"document_info": {"title": _text(record["title"]), "abstract_preview": abstract[:50] + "..."},
+                "term_analysis": term_analysis,
+                "Reason": reason,
+                "prefilter": True}
+
+    def _matches_in(self, data, category, start, end):
+        """Positions between start and end where a category's pattern matches at one of its anchors."""
+        pattern = self.category_matchers[category]
+        for anchor in CATEGORY_ANCHORS[category]:
+            position = data.find(anchor, start, end)
+            while position >= 0:
+                if pattern.match(data, position, end) is not None:
+                    yield position
+                position = data.find(anchor, position + 1, end)
+
+    def _category_rows(self, data, starts, ends, category, rows=None):
+        """Rows of the joined text matching a category; rows restricts the search to earlier candidates."""
+        if rows is None:
+            positions = list(self._matches_in(data, category, 0, len(data)))
+            return np.unique(np.searchsorted(starts, positions, side="right") - 1).tolist()
+        return [row for row in rows if next(self._matches_in(data, category, starts[row], ends[row]), None) is not None]
+
+    def screen_texts(self, titles, abstracts):
+        """
+        Pre-screen many records at once; same decisions as screen(), much faster.
+
+        The texts are joined into one lower-cased byte string and scanned for the literal
+        anchors of each required category; a category's regex is only tried at its anchors.
+
+        Parameters:
+        titles, abstracts - sequences of equal length.
+
+        Returns: boolean NumPy array, True where the record is excluded.
+        """
+        texts = map(FIELD_SEPARATOR.join, zip(map(_text, titles), map(_text, abstracts)))
+        data = RECORD_SEPARATOR.join(texts).encode().lower()
+        ends = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == ord(RECORD_SEPARATOR))
+        if len(ends) != len(titles) - 1:  # a separator inside the text itself
+            texts = (f"{_text(title)}{FIELD_SEPARATOR}{_text(abstract)}".replace(RECORD_SEPARATOR, " ")
+                     for title, abstract in zip(titles, abstracts))
+            data = RECORD_SEPARATOR.join(texts).encode().lower()
+            ends = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == ord(RECORD_SEPARATOR))
+        starts = np.concatenate([[0], ends + 1]).tolist()
+        ends = ends.tolist() + [len(data)]
+
+        excluded = np.ones(len(starts), dtype=bool)
+        if self.require == "all":
+            # Every required category has to show up; narrow the candidates category by category
+            candidates = None
+            for category in self.required:
+                candidates = self._category_rows(data, starts, ends, category, candidates)
+            excluded[candidates] = False
+        else:
+            for category in self.required:
+                excluded[self._category_rows(data, starts, ends, category)] = False
+        self.counters["records"] += len(excluded)
+        self.counters["excluded"] += int(excluded.sum())
+        return excluded
+
+    def screen_stream(self, records, chunk_size=SCREEN_CHUNK):
+        """
+        Pre-screen a stream of records chunk by chunk with screen_texts; same decisions as screen().
+
+        Only the excluded records are matched again one by one, for build_result.
+
+        Parameters:
+        records - iterable of article records (ingest.iter_articles).
+        chunk_size - records screened per screen_texts call.
+
+        Returns: generator of (record, found) pairs in input order; found is the match() output of
+        an excluded record (pass it to build_result with the schema of each run storing it), None
+        if the record should go to the LLM.
+        """
+        chunk = []
+        for record in records:
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                yield from self._screen_chunk(chunk)
+                chunk = []
+        if chunk:
+            yield from self._screen_chunk(chunk)
+
+    def _screen_chunk(self, records):
+        excluded = self.screen_texts([record["title"] for record in records],
+                                     [record["abstract"] for record in records])
+        for record, skip in zip(records, excluded):
+            yield record, self.match(record["title"], record["abstract"]) if skip else None
+
+    def report(self):
+        """Summarise how many LLM calls the pre-filter saved."""
+        records, excluded = self.counters["records"], self.counters["excluded"]
+        return {"records": records, "excluded": excluded, "sent_to_llm": records - excluded,
+                "call_reduction": round(excluded / records, 3) if records else 0.0}
+
+
+if __name__ == "__main__":
+    # Report the call-volume drop and throughput on an export, e.g. python prefilter.py export.csv [any|all]
+    prefilter = Prefilter(require=sys.argv[2] if len(sys.argv) > 2 else "any")
+    elapsed = 0.0
+    for chunk in iter_article_chunks(sys.argv[1]):
+        abstracts = [clean_abstract(abstract) for abstract in chunk["abstract"]]
+        start = time.perf_counter()
+        prefilter.screen_texts(chunk["title"].tolist(), abstracts)
+        elapsed += time.perf_counter() - start
+    report = prefilter.report()
+    report["records_per_second"] = round(report["records"] / elapsed) if elapsed else None
+    print(json.dumps(report, indent=2))
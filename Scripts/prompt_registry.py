@@ -0,0 +1,351 @@
+# Versioned registry of the screening prompts.
+# Each PromptVersion bundles a prompt template with its response schema, scoring weights and
+# model settings. The static text around the title and abstract is split into fragments once at
+# registration, so rendering an article is a single join, and a content hash of everything that
+# shapes the reply goes into cache keys and run manifests. The score scripts in
+# LLM_promptengineering/score are thin wrappers that pick one of these versions.
+import json
+import hashlib
+
+from response_schema import SCREENING_SCHEMA, NOTES_SCHEMA, AIM_SCHEMA
+from response_cache import cache_key
+from scoring import SCORE_WEIGHTS
+
+# Model settings shared by every prompt version unless it overrides them
+MODEL = "gpt-4-turbo"
+TEMPERATURE = 0.2
+SYSTEM_MESSAGE = "You are an expert in biomedical text analysis. Return valid JSON ONLY."
+DEFAULT_PROMPT = "screening"
+
+# The notes schemas have no main exposure/outcome/method flags; only term presence scores
+NOTES_WEIGHTS = {column: weight for column, weight in SCORE_WEIGHTS.items() if column.endswith(".present")}
+
+# Scripts/utils.py prompt: main exposure/outcome/method flags
+SCREENING_INSTRUCTIONS = """
+    You are a researcher rigorously screening titles and abstracts of scientific papers for inclusion and exclusion in a review paper.
+Extract key terms from the following title and abstract and provide analysis in the specified JSON format.
+
+Terms to extract:
+1. Adulthood body mass index OR BMI OR adiposity
+2. Mendelian randomisation (including alternate spelling "Mendelian randomization")
+3. Blood pressure terms: hypertension, high blood pressure, systolic blood pressure, diastolic blood pressure (note: multiple blood pressure terms count as just one match for category #3)
+4. European ancestry terms such as European OR white OR caucasian population/ancestry OR mentions European country
+5. Review terms such as umbrella review OR scoping review OR systematic review
+
+
+For each term category, extract the EXACT phrasing as it appears in the document.
+
+IMPORTANT RULES:
+- For category #4, terms like "nonwhite," "non-white," "non-European," or similar negations should NOT be counted as matches for European/white/caucasian ancestry/mentions European country.
+- Only count exact matches and do not include negated terms (terms with "non-" prefix or similar negations).
+- For country names, first extract ALL country names mentioned, then identify which ones are European countries
+- If no relevant terms are found, state "No European ancestry or country terms found"
+- For each match, provide the exact quote with minimal surrounding context
+- CHECK ancestry is European
+- Extract only information related to adult body mass index (BMI), obesity in adults, or adiposity measurements in adult populations. DO NOT include any findings related to childhood obesity or BMI in subjects under 18 years of age.
+- For BMI/adiposity terms: Check if BMI is being studied as an exposure/predictor of blood pressure, NOT just as a covariate or mediator or outcome.
+- For Blood pressure terms: Check if Blood pressure term is studied as an outcome, NOT an exposure or covariate. 
+- MUST EXCLUDE any PREGNANCY RELATED  terms.
+- CHECK blood pressure term is Main outcome
+- Mendelian randomisation MUST be the method used to study the causal relationship
+- Check Main method in use is Mendelian randomisation
+
+
+"""
+
+TERM_ANALYSIS_SCHEMA = """  "term_analysis": {
+    "bmi_adiposity": {
+      "present": true/false,
+      "locations": ["title", "abstract"],
+      "variations_found": ["exact phrases as they appear in the text"],
+      "is_main_exposure": true/false
+    },
+    "mendelian_randomisation": {
+      "present": true/false,
+      "locations": ["title", "abstract"],
+      "variations_found": ["exact phrases as they appear in the text"],
+      "is_main_method": true/false
+    },
+    "blood_pressure": {
+      "present": true/false,
+      "locations": ["title", "abstract"],
+      "variations_found": ["exact phrases as they appear in the text"],
+      "is_main_outcome": true/false
+      
+    },
+    "european_ancestry": {
+      "present": true/false,
+      "locations": ["title", "abstract"],
+      "variations_found": ["exact phrases as they appear in the text"],
+      "is_ancestry_European": true/false
+    },
+    "reviews": {
+      "present": true/false,
+      "locations": ["title", "abstract"],
+      "variations_found": ["exact phrases as they appear in the text"]
+    }
+  },
+  "Reason": {
+    "justify": "Brief string of all the EXACT terms present in the title and abstract AND record those that are missing."
+  }"""
+
+
+# LLM_promptengineering/score/score.py: as above, with the maternal blood pressure exclusion
+SCORE_INSTRUCTIONS = """
+    You are a researcher rigorously screening titles and abstracts of scientific papers for inclusion and exclusion in a review paper.
+Extract key terms from the following title and abstract and provide analysis in the specified JSON format.
+
+Terms to extract:
+1. Adulthood body mass index OR BMI OR adiposity
+2. Mendelian randomisation (including alternate spelling "Mendelian randomization")
+3. Blood pressure terms: hypertension, high blood pressure, systolic blood pressure, diastolic blood pressure (note: multiple blood pressure terms count as just one match for category #3)
+4. European ancestry terms such as European OR white OR caucasian population/ancestry OR mentions European country
+5. Review terms such as umbrella review OR scoping review OR systematic review
+
+
+For each term category, extract the EXACT phrasing as it appears in the document.
+
+IMPORTANT RULES:
+- For category #4, terms like "nonwhite," "non-white," "non-European," or similar negations should NOT be counted as matches for European/white/caucasian ancestry/mentions European country.
+- Only count exact matches and do not include negated terms (terms with "non-" prefix or similar negations).
+- For country names, first extract ALL country names mentioned, then identify which ones are European countries
+- If no relevant terms are found, state "No European ancestry or country terms found"
+- For each match, provide the exact quote with minimal surrounding context
+- CHECK ancestry is European
+
+- Extract only information related to adult body mass index (BMI), obesity in adults, or adiposity measurements in adult populations. DO NOT include any findings related to childhood obesity or BMI in subjects under 18 years of age.
+- For BMI/adiposity terms: Check if BMI is being studied as an exposure/predictor of blood pressure, NOT just as a covariate or mediator or outcome.
+
+- For Blood pressure terms: Check if Blood pressure term is studied as an outcome, NOT an exposure or covariate. 
+- MUST EXCLUDE any pregnancy and maternal related Blood pressure terms.
+- CHECK blood pressure term is Main outcome
+
+- Mendelian randomisation MUST be the method used to study the causal relationship
+- Check Main method in use is Mendelian randomisation
+
+
+"""
+
+
+# LLM_promptengineering/score/score_05_05_2025.py: notes per term and an inclusion decision
+SCORE_05_05_2025_INSTRUCTIONS = """
+    You are a researcher rigorously screening titles and abstracts of scientific papers for inclusion in a review focused on Mendelian randomization studies examining the causal relationship between adult BMI/adiposity and blood pressure outcomes in European populations.
+Extract key terms from the following title and abstract and provide analysis in the specified JSON format and analyse whether the article meets the inclusion criteria.
+
+## Term Categories to extract:
+1. **Adulthood body mass index OR BMI OR adiposity**: BMI, body mass index, adiposity, obesity, overweight (in adults).
+2. **Mendelian randomisation** Terms: Mendelian randomization, MR, genetic instruemnt(s).
+3. **Blood pressure outcome terms**:hypertension, high blood pressure, systolic blood pressure, diastolic blood pressure,SBP, DBP (note: multiple blood pressure terms count as just one match for category #3)
+4. **European ancestry terms**: European OR white OR caucasian population/ancestry OR mentions European country
+5. Review terms such as umbrella review OR scoping review OR systematic review
+
+
+For each term category, extract the EXACT phrasing as it appears in the document with minimal context.
+
+IMPORTANT RULES:
+- For category #4, terms like "nonwhite," "non-white," "non-European," or similar negations should NOT be counted as matches for European/white/caucasian ancestry/mentions European country.
+- Only count exact matches and do not include negated terms (terms with "non-" prefix or similar negations).
+- For country names, first extract ALL country names mentioned, then identify which ones are European countries
+- If no relevant terms are found, state "No European ancestry or country terms found"
+- For each match, provide the exact quote with minimal surrounding context
+- Extract only information related to adult body mass index (BMI), obesity in adults, or adiposity measurements in adult populations. DO NOT include any findings related to childhood obesity or BMI in subjects under 18 years of age.
+- For BMI/adiposity terms: Check if BMI is being studied as an exposure/predictor of blood pressure, NOT just as a covariate or mediator or outcome.
+- For Blood pressure terms: Check if Blood pressure term is studied as an outcome, NOT an exposure or covariate. 
+- MUST EXCLUDE any pregnancy and maternal related Blood pressure terms.
+- Mendelian randomisation MUST be the method used to study the causal relationship
+
+
+
+"""
+
+SCORE_05_05_2025_TERM_SCHEMA = """  "term_analysis": {
+    "bmi_adiposity": {
+      "present": true/false,
+      "locations": ["title", "abstract"],
+      "variations_found": ["exact phrases as they appear in the text with minimal context"],
+      "notes": "Brief explanation of body mass index role in the study"
+    },
+    "mendelian_randomisation": {
+      "present": true/false,
+      "locations": ["title", "abstract"],
+      "variations_found": ["eexact phrases as they appear in the text with minimal context"],
+      "notes": "Brief explanation of how MR is used"
+    },
+    "blood_pressure": {
+      "present": true/false,
+      "locations": ["title", "abstract"],
+      "variations_found": ["exact phrases as they appear in the text with minimal context"],
+      "notes": "Brief explanation of blood pressure role in the study "
+      
+    },
+    "european_ancestry": {
+      "present": true/false,
+      "locations": ["title", "abstract"],
+      "variations_found": ["exact phrases as they appear in the text with minimal context"],
+      "notes": "Brief explanation of population characteristics"
+    },
+    "reviews": {
+      "present": true/false,
+      "locations": ["title", "abstract"],
+      "variations_found": ["exact phrases as they appear in the text with minimal context"],
+      "notes": "Brief explanation of paper type"
+    }
+  },
+  "Reason": {
+    "justify": "Brief string of all the EXACT terms present in the title and abstract AND record those that are missing.",
+    "inclusion_decision": "INCLUDE/EXCLUDE",
+    "reasoning": "Concise explanation of decision based on criteria"
+  }"""
+
+
+# LLM_promptengineering/score/score_aimextraction.py: as above, plus the extracted study aim
+AIM_EXTRACTION_INSTRUCTIONS = """
+    You are a researcher rigorously screening titles and abstracts of scientific papers for inclusion in a review focused on Mendelian randomization studies examining the causal relationship between **adult BMI/adiposity** and blood pressure outcomes in European populations.
+Extract key terms from the following title and abstract and provide analysis in the specified JSON format and analyse whether the article meets the inclusion criteria.
+
+## Term Categories to extract:
+1. **Adulthood body mass index OR BMI OR adiposity**: BMI, body mass index, adiposity, obesity, overweight (in adults).
+2. **Mendelian randomisation** Terms: Mendelian randomization, MR, genetic instruemnt(s).
+3. **Blood pressure outcome terms**:hypertension, high blood pressure, systolic blood pressure, diastolic blood pressure,SBP, DBP (note: multiple blood pressure terms count as just one match for category #3)
+4. **European ancestry terms**: European OR white OR caucasian population/ancestry OR mentions European country
+5. Review terms such as umbrella review OR scoping review OR systematic review
+
+For each term category, extract the EXACT phrasing as it appears in the document with minimal context.
+
+## Study Aim Extraction:
+6. **Study aim/objective**: Extract the main research aim, objective, or purpose as stated in the title or abstract. Look for phrases like "aim to," "objective," "purpose," "we investigated," "to examine," "to assess," etc.
+
+IMPORTANT RULES:
+- For category #4, terms like "nonwhite," "non-white," "non-European," or similar negations should NOT be counted as matches for European/white/caucasian ancestry/mentions European country.
+- Only count exact matches and do not include negated terms (terms with "non-" prefix or similar negations).
+- For country names, first extract ALL country names mentioned, then identify which ones are European countries
+- If no relevant terms are found, state "No European ancestry or country terms found"
+- For each match, provide the exact quote with minimal surrounding context
+- Extract only information related to adult body mass index (BMI), obesity in adults, or adiposity measurements in adult populations. DO NOT include any findings related to childhood obesity or BMI in subjects under 18 years of age.
+- For BMI/adiposity terms: Check if BMI is being studied as an exposure/predictor of blood pressure, NOT just as a covariate or mediator or outcome.
+- For Blood pressure terms: Check if Blood pressure term is studied as an outcome, NOT an exposure or covariate. 
+- MUST EXCLUDE any pregnancy and maternal related Blood pressure terms.
+- Mendelian randomisation MUST be the method used to study the causal relationship
+
+"""
+
+AIM_EXTRACTION_TERM_SCHEMA = """  "term_analysis": {
+    "bmi_adiposity": {
+      "present": true/false,
+      "locations": ["title", "abstract"],
+      "variations_found": ["exact phrases as they appear in the text with minimal context"],
+      "notes": "Brief explanation of body mass index role in the study"
+    },
+    "mendelian_randomisation": {
+      "present": true/false,
+      "locations": ["title", "abstract"],
+      "variations_found": ["exact phrases as they appear in the text with minimal context"],
+      "notes": "Brief explanation of how MR is used"
+    },
+    "blood_pressure": {
+      "present": true/false,
+      "locations": ["title", "abstract"],
+      "variations_found": ["exact phrases as they appear in the text with minimal context"],
+      "notes": "Brief explanation of blood pressure role in the study"
+    },
+    "european_ancestry": {
+      "present": true/false,
+      "locations": ["title", "abstract"],
+      "variations_found": ["exact phrases as they appear in the text with minimal context"],
+      "notes": "Brief explanation of population characteristics"
+    },
+    "reviews": {
+      "present": true/false,
+      "locations": ["title", "abstract"],
+      "variations_found": ["exact phrases as they appear in the text with minimal context"],
+      "notes": "Brief explanation of paper type"
+    },
+    "study_aim": {
+      "present": true/false,
+      "locations": ["title", "abstract"],
+      "extracted_aim": "The main research aim/objective as stated in the document",
+      "supporting_phrases": ["exact phrases that indicate the study aim"],
+      "notes": "Brief explanation of how the aim relates to the research question"
+    }
+  },
+  "Reason": {
+    "justify": "Brief string of all the EXACT terms present in the title and abstract AND record those that are missing.",
+    "inclusion_decision": "INCLUDE/EXCLUDE",
+    "reasoning": "Concise explanation of decision based on criteria"
+  }"""
+
+
+class PromptVersion:
+    """
+    One versioned screening prompt.
+
+    Parameters:
+    name - registry name, e.g. "screening".
+    instructions - static instruction preamble placed before the title and abstract.
+    term_schema - the "term_analysis"/"Reason" part of the JSON structure the model is shown.
+    schema - name of the response schema (response_schema.SCHEMAS) replies are constrained to.
+    weights - result column -> points used to score the replies (scoring.score).
+    model, temperature, system_message - model settings.
+    """
+
+    def __init__(self, name, instructions, term_schema, schema, weights=SCORE_WEIGHTS, model=MODEL,
+                 temperature=TEMPERATURE, system_message=SYSTEM_MESSAGE):
+        self.name = name
+        self.instructions = instructions
+        self.term_schema = term_schema
+        self.schema = schema
+        self.weights = weights
+        self.model = model
+        self.temperature = temperature
+        self.system_message = system_message
+        # Static text between the per-article values, joined once here instead of per article
+        self._fragments = (instructions + 'Title: "',
+                           '"\nAbstract: "',
+                           '"\n\nOutput MUST strictly follow this JSON structure:\n{\n  "document_info": {\n    "title": "',
+                           '",\n    "abstract_preview": "',
+                           '..."\n  },\n' + term_schema + '\n}\n\nRespond **ONLY** with the JSON output and nothing else.\n\n')
+        payload = json.dumps([model, float(temperature), system_message, schema, instructions, term_schema])
+        self.content_hash = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def render(self, title, abstract):
+        """Prompt for one article (abstract already cleaned with utils.clean_abstract)."""
+        head, after_title, after_abstract, after_info_title, tail = self._fragments
+        # Missing titles arrive as NaN; render them the way the f-string prompt did ("nan")
+        title, abstract = str(title), str(abstract)
+        return "".join((head, title, after_title, abstract, after_abstract, title, after_info_title, abstract[:50], tail))
+
+    def cache_key(self, prompt, model=None):
+        """Response cache key of a rendered prompt under this version; model overrides the version's model."""
+        return cache_key(prompt, self.system_message, model or self.model, self.temperature, self.content_hash)
+
+    def __repr__(self):
+        return f"PromptVersion({self.name!r}, {self.content_hash[:12]})"
+
+
+PROMPTS = {}
+
+
+def register(prompt):
+    """Add a PromptVersion to the registry; names must be unique."""
+    if prompt.name in PROMPTS:
+        raise ValueError(f"Prompt version {prompt.name!r} is already registered")
+    PROMPTS[prompt.name] = prompt
+    return prompt
+
+
+def get_prompt(name=None):
+    """Registered PromptVersion by name (default: DEFAULT_PROMPT); a PromptVersion is passed through."""
+    if isinstance(name, PromptVersion):
+        return name
+    name = name or DEFAULT_PROMPT
+    if name not in PROMPTS:
+        raise ValueError(f"Unknown prompt version {name!r}; registered: {', '.join(PROMPTS)}")
+    return PROMPTS[name]
+
+
+register(PromptVersion("screening", SCREENING_INSTRUCTIONS, TERM_ANALYSIS_SCHEMA, SCREENING_SCHEMA))
+register(PromptVersion("score", SCORE_INSTRUCTIONS, TERM_ANALYSIS_SCHEMA, SCREENING_SCHEMA))
+register(PromptVersion("score_05_05_2025", SCORE_05_05_2025_INSTRUCTIONS, SCORE_05_05_2025_TERM_SCHEMA,
+                       NOTES_SCHEMA, NOTES_WEIGHTS))
+register(PromptVersion("aim_extraction", AIM_EXTRACTION_INSTRUCTIONS, AIM_EXTRACTION_TERM_SCHEMA,
+                       AIM_SCHEMA, NOTES_WEIGHTS))
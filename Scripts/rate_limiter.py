@@ -0,0 +1,203 @@
+# Request- and token-rate-aware scheduler for the screening engine.
+# Every API call goes through RateLimitScheduler.run so that the run stays under the
+# account's requests-per-minute (RPM) and tokens-per-minute (TPM) limits, and so that
+# HTTP 429s are retried with backoff instead of silently dropping the article.
+import time
+import random
+import asyncio
+import email.utils
+import datetime
+import functools
+
+# Defaults for gpt-4-turbo on a tier 1 account; override per run
+REQUESTS_PER_MINUTE = 500
+TOKENS_PER_MINUTE = 30000
+COMPLETION_TOKENS = 450  # typical size of the JSON reply, reserved up front
+MAX_RETRIES = 6
+BASE_DELAY = 1.0
+MAX_DELAY = 60.0
+
+
+
+def retryable_errors():
+    """Errors worth retrying; anything else (bad request, auth) fails straight away."""
+    # Imported here so that importing the scheduler does not load the openai package
+    from openai import RateLimitError, APITimeoutError, APIConnectionError, InternalServerError
+    return (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError, asyncio.TimeoutError)
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at rate_per_minute, holding at most capacity tokens.
+    Waiters are served in arrival order. The bucket may be reused by later asyncio.run calls;
+    its lock is created for the running event loop, as an asyncio.Lock belongs to one loop.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = None
+        self._loop = None
+
+    @property
+    def lock(self):
+        """Lock serving the waiters, built for the running event loop if there is none yet."""
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._loop is not loop:
+            self._lock = asyncio.Lock()
+            self._loop = loop
+        return self._lock
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        """Wait until amount tokens are available and take them."""
+        amount = min(amount, self.capacity)  # an oversized request must still be able to run
+        async with self.lock:
+            self._refill()
+            while self.tokens < amount:
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= amount
+
+    def drain(self):
+        """Empty the bucket, e.g. after the server reports the limit was hit."""
+        self._refill()
+        self.tokens = min(self.tokens, 0)
+
+
+def estimate_tokens(text, model="gpt-4-turbo"):
+    """
+    Estimate the number of tokens in a prompt.
+
+    Parameters:
+    text - rendered prompt, e.g. the output of construct_prompt.
+    model - model name used to pick the tiktoken encoding.
+
+    Returns: token count (exact with tiktoken, otherwise roughly four characters per token).
+    """
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding(model):
+    # tiktoken and its encoding tables are loaded on the first estimate, not at import
+    try:
+        import tiktoken
+    except ImportError:  # fall back to a character-based estimate
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def retry_after_seconds(error):
+    """Read the Retry-After (or retry-after-ms) header of a failed response, if there is one."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        retry_date = email.utils.parsedate_to_datetime(value)  # HTTP-date form
+    except (TypeError, ValueError):  # malformed header: fall back to the backoff
+        return None
+    if retry_date.tzinfo is None:  # HTTP dates are GMT; a naive date must not be read as local time
+        retry_date = retry_date.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, retry_date.timestamp() - time.time())
+
+
+class RateLimitScheduler:
+    """
+    Gate API calls behind RPM and TPM token buckets and retry transient failures
+    with exponential backoff and full jitter.
+
+    Counters (see stats): requests sent, throttled (HTTP 429), retried, failed permanently
+    and requeued (articles given another pass by the screening engine).
+    """
+
+    def __init__(self, requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE,
+                 completion_tokens=COMPLETION_TOKENS, max_retries=MAX_RETRIES,
+                 base_delay=BASE_DELAY, max_delay=MAX_DELAY, model="gpt-4-turbo"):
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.completion_tokens = completion_tokens
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.model = model
+        self.blocked_until = 0.0  # shared pause after a 429, so every worker backs off together
+        self.counters = {"requests": 0, "throttled": 0, "retried": 0, "failed": 0, "requeued": 0}
+
+    def backoff(self, attempt):
+        """Full-jitter exponential backoff for the given attempt number."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def run(self, request_fn, prompt, completion_tokens=None):
+        """
+        Send one request under the rate limits, retrying transient failures.
+
+        Parameters:
+        request_fn - zero-argument coroutine function performing the API call.
+        prompt - rendered prompt, used to estimate the tokens the call will consume.
+        completion_tokens - tokens to reserve for the reply, defaults to the scheduler's setting.
+
+        Returns: whatever request_fn returns. Re-raises the last error once retries are exhausted.
+        """
+        if completion_tokens is None:
+            completion_tokens = self.completion_tokens
+        tokens = estimate_tokens(prompt, self.model) + completion_tokens
+        for attempt in range(self.max_retries + 1):
+            pause = self.blocked_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            await self.request_bucket.acquire(1)
+            await self.token_bucket.acquire(tokens)
+            self.counters["requests"] += 1
+            try:
+                return await request_fn()
+            except retryable_errors() as e:
+                if type(e).__name__ == "RateLimitError":
+                    self.counters["throttled"] += 1
+                    delay = retry_after_seconds(e)
+                    if delay is None:
+                        delay = self.backoff(attempt)
+                    # The server says we are over the limit: stop everyone, not just this worker
+                    self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+                    self.request_bucket.drain()
+                    self.token_bucket.drain()
+                else:
+                    delay = self.backoff(attempt)
+                if attempt == self.max_retries:
+                    self.counters["failed"] += 1
+                    raise
+                self.counters["retried"] += 1
+                print(f"WARNING: {type(e).__name__}, retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})")
+                await asyncio.sleep(delay)
+            except Exception:
+                self.counters["failed"] += 1
+                raise
+
+    def stats(self):
+        """Return a copy of the throttled/retried/failed counters."""
+        return dict(self.counters)
@@ -0,0 +1,115 @@
+# Persistent, content-addressed cache of LLM responses.
+# The key is a hash of everything that determines the reply (rendered prompt, system message,
+# model name, temperature and the prompt version's content hash), so re-screening an unchanged article never calls the API again.
+import sys
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+
+CACHE_PATH = "screening_cache.sqlite"
+MAX_CACHE_BYTES = 512 * 1024 * 1024  # evict least recently used responses beyond this size
+
+
+def cache_key(prompt, system_message, model, temperature, prompt_hash=None):
+    """
+    Hash the inputs that determine an LLM response.
+
+    Parameters:
+    prompt - rendered user prompt.
+    system_message - system message sent with it.
+    model - model name.
+    temperature - sampling temperature.
+    prompt_hash - content hash of the prompt version (prompt_registry.PromptVersion), which also
+                  covers the response schema the reply is constrained to.
+
+    Returns: hex sha256 digest.
+    """
+    inputs = [model, float(temperature), system_message, prompt]
+    if prompt_hash is not None:
+        inputs.append(prompt_hash)
+    payload = json.dumps(inputs, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    SQLite-backed response cache with size-based LRU eviction and a hit/miss report.
+    Safe to share between the asyncio workers and Streamlit threads of one process.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_bytes=MAX_CACHE_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+                                  key TEXT PRIMARY KEY,
+                                  response TEXT NOT NULL,
+                                  size INTEGER NOT NULL,
+                                  last_used REAL NOT NULL)""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)")
+        self._conn.commit()
+        self.total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key):
+        """Return the cached response for key (parsed JSON), or None on a miss."""
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, key, response):
+        """Store a parsed JSON response under key and evict old entries if the cache is over size."""
+        text = json.dumps(response, ensure_ascii=False)
+        size = len(text.encode("utf-8"))
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute("INSERT OR REPLACE INTO responses (key, response, size, last_used) VALUES (?, ?, ?, ?)",
+                               (key, text, size, time.time()))
+            self.total_bytes += size - (old[0] if old else 0)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes (lock held by caller)."""
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY last_used ASC")
+        stale = []
+        for key, size in rows:
+            if self.total_bytes <= self.max_bytes:
+                break
+            stale.append((key,))
+            self.total_bytes -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+    def report(self):
+        """Summarise hits, misses and size of the cache."""
+        lookups = self.hits + self.misses
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+                "size_mb": round(self.total_bytes / 1024 ** 2, 2)}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+if __name__ == "__main__":
+    # Print the size of an existing cache, e.g. python response_cache.py screening_cache.sqlite
+    cache = ResponseCache(sys.argv[1] if len(sys.argv) > 1 else CACHE_PATH)
+    print(cache.report())
+    cache.close()
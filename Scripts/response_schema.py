@@ -0,0 +1,328 @@
+# Typed response schemas for the screening prompts, a compiled validator and targeted repair.
+# Each prompt version has a JSON Schema that is sent with the request (as a strict json_schema
+# response format where the model supports it, otherwise as a forced function call). Replies
+# are validated by checks compiled once per schema; fixable type slips are coerced locally,
+# and only the fields that are still malformed are sent back in a short repair call.
+import re
+import json
+import functools
+
+SCREENING_SCHEMA = "screening"
+NOTES_SCHEMA = "screening_notes"
+AIM_SCHEMA = "screening_aim"
+
+# Models accepting response_format={"type": "json_schema", ...}; the rest get a function-calling spec
+JSON_SCHEMA_MODELS = ("gpt-4o", "gpt-4.1", "gpt-5", "o1", "o3", "o4")
+FUNCTION_NAME = "record_screening"
+REPAIR_MAX_TOKENS = 300
+
+
+def _object(properties):
+    # Strict schemas need every property listed as required and no extra keys
+    return {"type": "object", "properties": properties, "required": list(properties),
+            "additionalProperties": False}
+
+
+def _term(flag=None, notes=False):
+    properties = {"present": {"type": "boolean"},
+                  "locations": {"type": "array", "items": {"type": "string", "enum": ["title", "abstract"]}},
+                  "variations_found": {"type": "array", "items": {"type": "string"}}}
+    if flag:
+        properties[flag] = {"type": "boolean"}
+    if notes:
+        properties["notes"] = {"type": "string"}
+    return _object(properties)
+
+
+_DOCUMENT_INFO = _object({"title": {"type": "string"}, "abstract_preview": {"type": "string"}})
+
+SCHEMAS = {
+    # utils.construct_prompt: main exposure/outcome/method flags
+    SCREENING_SCHEMA: _object({
+        "document_info": _DOCUMENT_INFO,
+        "term_analysis": _object({
+            "bmi_adiposity": _term("is_main_exposure"),
+            "mendelian_randomisation": _term("is_main_method"),
+            "blood_pressure": _term("is_main_outcome"),
+            "european_ancestry": _term("is_ancestry_European"),
+            "reviews": _term(),
+        }),
+        "Reason": _object({"justify": {"type": "string"}}),
+    }),
+    # score_05_05_2025.py: free-text notes per term and an explicit decision
+    NOTES_SCHEMA: _object({
+        "document_info": _DOCUMENT_INFO,
+        "term_analysis": _object({name: _term(notes=True) for name in
+                                  ("bmi_adiposity", "mendelian_randomisation", "blood_pressure",
+                                   "european_ancestry", "reviews")}),
+        "Reason": _object({"justify": {"type": "string"},
+                           "inclusion_decision": {"type": "string", "enum": ["INCLUDE", "EXCLUDE"]},
+                           "reasoning": {"type": "string"}}),
+    }),
+}
+# score_aimextraction.py: the notes schema plus the extracted study aim
+SCHEMAS[AIM_SCHEMA] = json.loads(json.dumps(SCHEMAS[NOTES_SCHEMA]))
+SCHEMAS[AIM_SCHEMA]["properties"]["term_analysis"]["properties"]["study_aim"] = _object({
+    "present": {"type": "boolean"},
+    "locations": {"type": "array", "items": {"type": "string", "enum": ["title", "abstract"]}},
+    "extracted_aim": {"type": "string"},
+    "supporting_phrases": {"type": "array", "items": {"type": "string"}},
+    "notes": {"type": "string"},
+})
+SCHEMAS[AIM_SCHEMA]["properties"]["term_analysis"]["required"].append("study_aim")
+
+
+def request_options(schema_name, model, mode=None):
+    """
+    Extra chat.completions.create arguments that constrain the reply to a schema.
+
+    Parameters:
+    mode - "json_schema" or "tools"; chosen by model name if None (local servers use "json_schema").
+
+    Returns: dict with response_format (json_schema) or tools/tool_choice (function calling).
+    """
+    schema = SCHEMAS[schema_name]
+    if mode is None:
+        mode = "json_schema" if model.startswith(JSON_SCHEMA_MODELS) else "tools"
+    if mode == "json_schema":
+        return {"response_format": {"type": "json_schema",
+                                    "json_schema": {"name": schema_name, "strict": True, "schema": schema}}}
+    return {"tools": [{"type": "function",
+                       "function": {"name": FUNCTION_NAME, "description": "Record the screening analysis of one article.",
+                                    "parameters": schema}}],
+            "tool_choice": {"type": "function", "function": {"name": FUNCTION_NAME}}}
+
+
+def reply_text(message):
+    """The JSON text of a reply: forced function-call arguments, or the message content."""
+    tool_calls = getattr(message, "tool_calls", None) if not isinstance(message, dict) else message.get("tool_calls")
+    if tool_calls:
+        call = tool_calls[0]
+        function = call["function"] if isinstance(call, dict) else call.function
+        return function["arguments"] if isinstance(function, dict) else function.arguments
+    content = message.get("content") if isinstance(message, dict) else message.content
+    return content or ""
+
+
+_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+
+def parse_reply(text):
+    """
+    Parse a reply, cleaning up the usual syntax slips locally first: code fences, text around
+    the JSON object and trailing commas.
+
+    Returns: parsed object, or None if it is not JSON at all.
+    """
+    text = text.strip()
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    text = _FENCE.sub("", text)
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end < start:
+        return None
+    text = _TRAILING_COMMA.sub(r"\1", text[start:end + 1])
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return None
+
+
+# Separators of several enum values in one string, e.g. "title and abstract"
+_ENUM_SEPARATOR = re.compile(r"\s*(?:,|/|&|\band\b)\s*")
+
+
+@functools.lru_cache(maxsize=None)
+def _compiled(schema_name):
+    """Compiled check of a schema, built once per process and shared by every validator."""
+    return _compile(SCHEMAS[schema_name], "")
+
+
+def _enum_value(value, allowed):
+    """
+    The allowed value(s) a harmless variant stands for: case and whitespace are ignored, and a
+    string naming several values ("Title and Abstract") stands for each of them.
+
+    Returns: list of allowed values, or None if value is not such a variant.
+    """
+    if not isinstance(value, str):
+        return None
+    canonical = {option.lower(): option for option in allowed}
+    parts = [canonical.get(part) for part in _ENUM_SEPARATOR.split(value.strip().lower())]
+    return parts if parts and None not in parts else None
+
+
+def _compile(schema, path):
+    """Build a check(value, errors) closure for one schema node."""
+    kind = schema.get("type")
+    if kind == "object":
+        properties = {key: _compile(sub, f"{path}.{key}" if path else key)
+                      for key, sub in schema.get("properties", {}).items()}
+        required = schema.get("required", ())
+
+        def check(value, errors):
+            if not isinstance(value, dict):
+                errors.append((path, "object"))
+                return
+            for key in required:
+                if key not in value:
+                    errors.append((f"{path}.{key}" if path else key, "missing"))
+            for key, check_property in properties.items():
+                if key in value:
+                    check_property(value[key], errors)
+        return check
+    if kind == "array":
+        check_item = _compile(schema.get("items", {}), f"{path}[]")
+
+        def check(value, errors):
+            if not isinstance(value, list):
+                errors.append((path, "array"))
+                return
+            for item in value:
+                check_item(item, errors)
+        return check
+    enum = set(schema["enum"]) if "enum" in schema else None
+    python_type = {"string": str, "boolean": bool, "number": (int, float), "integer": int}.get(kind)
+
+    def check(value, errors):
+        if python_type is not None and (not isinstance(value, python_type)
+                                        or (kind in ("number", "integer") and isinstance(value, bool))):
+            errors.append((path, kind))
+        elif enum is not None and value not in enum:
+            errors.append((path, "enum"))
+    return check
+
+
+class ResponseValidator:
+    """
+    Validator of a schema with counters of how the replies of one run fared; the compiled
+    checks are shared, so a validator per run (or job) is cheap.
+    Errors are (dotted path, expected) pairs, e.g. ("term_analysis.blood_pressure.present", "boolean").
+    """
+
+    def __init__(self, schema_name=SCREENING_SCHEMA):
+        self.schema_name = schema_name
+        self.schema = SCHEMAS[schema_name]
+        self._check = _compiled(schema_name)
+        self.counters = {"valid": 0, "coerced": 0, "repaired": 0, "invalid": 0}
+
+    def errors(self, data):
+        errors = []
+        self._check(data, errors)
+        return errors
+
+    def coerce(self, data):
+        """
+        Fix type slips in place without a model call ("true" -> true, "x" -> ["x"], "Title" -> "title",
+        ["title and abstract"] -> ["title", "abstract"]); returns the remaining errors.
+        """
+        errors = self.errors(data)
+        fixed = False
+        for path, expected in errors:
+            parent, key = _locate(data, path)
+            if parent is None or key not in parent:
+                continue
+            value = parent[key]
+            if expected == "boolean" and isinstance(value, str) and value.strip().lower() in ("true", "false"):
+                parent[key] = value.strip().lower() == "true"
+                fixed = True
+            elif expected == "array" and isinstance(value, str):
+                parent[key] = [value] if value else []
+                fixed = True
+            elif expected == "array" and value is None:
+                parent[key] = []
+                fixed = True
+            elif expected == "enum":
+                field = _field_schema(self.schema, path)
+                if path.endswith("[]") and isinstance(value, list):
+                    allowed = field.get("items", {}).get("enum", ())
+                    values = [_enum_value(item, allowed) or [item] for item in value]
+                    coerced = list(dict.fromkeys(item for items in values for item in items))
+                else:
+                    coerced = _enum_value(value, field.get("enum", ()))
+                    coerced = coerced[0] if coerced is not None and len(coerced) == 1 else value
+                if coerced != value:
+                    parent[key] = coerced
+                    fixed = True
+        return self.errors(data) if fixed else errors
+
+    def check(self, data):
+        """Validate a parsed reply, coercing what can be fixed locally; returns the remaining errors."""
+        if not isinstance(data, dict):
+            self.counters["invalid"] += 1
+            return [("", "object")]
+        errors = self.errors(data)
+        if errors:
+            errors = self.coerce(data)
+            if not errors:
+                self.counters["coerced"] += 1
+        else:
+            self.counters["valid"] += 1
+        return errors
+
+    def repaired(self, data, patch):
+        """Merge a repair reply into data; returns the errors left, empty if the repair worked."""
+        apply_repair(data, patch)
+        errors = self.coerce(data)
+        self.counters["invalid" if errors else "repaired"] += 1
+        return errors
+
+
+def get_validator(schema_name=SCREENING_SCHEMA):
+    """New validator of a schema with its own counters; the schema is compiled on first use only."""
+    return ResponseValidator(schema_name)
+
+
+def _locate(data, path):
+    """Return (parent dict, key) of a dotted path inside data, or (None, None)."""
+    parts = path.replace("[]", "").split(".")
+    parent = data
+    for part in parts[:-1]:
+        if not isinstance(parent, dict) or not isinstance(parent.get(part), dict):
+            return None, None
+        parent = parent[part]
+    return (parent, parts[-1]) if isinstance(parent, dict) else (None, None)
+
+
+def _field_schema(schema, path):
+    for part in path.replace("[]", "").split("."):
+        schema = schema.get("properties", {}).get(part, {})
+    return schema
+
+
+def repair_messages(prompt, data, errors, validator):
+    """
+    Messages for a repair call that asks only for the malformed fields of a reply.
+
+    Parameters:
+    prompt - the original screening prompt (holds the title and abstract).
+    data - the parsed reply.
+    errors - remaining validator errors.
+
+    Returns: chat messages; the reply is a JSON object mapping each dotted path to its value.
+    """
+    paths = sorted({path.replace("[]", "") for path, _ in errors})
+    fields = {path: _field_schema(validator.schema, path) for path in paths}
+    request = (f"{prompt}\n\nYour previous analysis of this article was:\n{json.dumps(data, ensure_ascii=False)}\n\n"
+               f"These fields are missing or malformed: {json.dumps(fields)}\n"
+               "Return ONLY a JSON object mapping each of these dotted field paths to its corrected value.")
+    return [{"role": "system", "content": "You fix fields of a JSON screening analysis. Return valid JSON ONLY."},
+            {"role": "user", "content": request}]
+
+
+def apply_repair(data, patch):
+    """Write the fields of a repair reply ({dotted path: value}) into data."""
+    if not isinstance(patch, dict):
+        return data
+    for path, value in patch.items():
+        parent = data
+        parts = path.split(".")
+        for part in parts[:-1]:
+            if not isinstance(parent.get(part), dict):
+                parent[part] = {}
+            parent = parent[part]
+        parent[parts[-1]] = value
+    return data
@@ -0,0 +1,105 @@
+# Aggregation, filtering and pagination behind the results explorer (the app's visualisation tab).
+# Only aggregates (one row per tick/cross label combination or per score) and a single page of
+# articles are turned into figures and tables, so what reaches the browser does not grow with
+# the number of screened articles.
+import numpy as np
+
+PAGE_SIZES = (25, 50, 100, 250, 1000, 5000)
+SCATTERGL_THRESHOLD = 500  # points above which the article scatter is drawn with WebGL (scattergl)
+ROW_HEIGHT = 20  # pixels per article in the scatter plot
+MAX_LABELLED_ROWS = 100  # titles are shown as y-axis labels up to this many articles
+
+
+def label_summary(data):
+    """
+    Articles per tick/cross label combination.
+
+    Parameters:
+    data - plot data with label and SCORES columns (articlesieve_app.plot_data).
+
+    Returns: DataFrame with label, articles and the mean, lowest and highest score, most common label first.
+    """
+    summary = data.groupby("label", observed=True)["SCORES"].agg(
+        articles="size", mean_score="mean", min_score="min", max_score="max")
+    return summary.reset_index().sort_values(["articles", "label"], ascending=[False, True], ignore_index=True)
+
+
+def score_histogram(data):
+    """Number of articles per total score, for every score from the lowest to the highest (zeros included)."""
+    import pandas as pd
+    scores = data["SCORES"].to_numpy(dtype=np.int64)
+    if not len(scores):
+        return pd.DataFrame({"score": [], "articles": []})
+    low = int(scores.min())
+    counts = np.bincount(scores - low)
+    return pd.DataFrame({"score": np.arange(low, low + len(counts)), "articles": counts})
+
+
+def filter_articles(data, labels=None, score_range=None, search=None):
+    """
+    Rows of data matching every filter given, in the order of data.
+
+    Parameters:
+    labels - tick/cross label combinations to keep; all if empty or None.
+    score_range - (low, high) inclusive score bounds, or None.
+    search - text the title must contain (case-insensitive), or None.
+    """
+    mask = np.ones(len(data), dtype=bool)
+    if labels:
+        mask &= data["label"].isin(labels).to_numpy()
+    if score_range is not None:
+        scores = data["SCORES"].to_numpy()
+        mask &= (scores >= score_range[0]) & (scores <= score_range[1])
+    if search:
+        mask &= data["title"].str.contains(search, case=False, regex=False, na=False).to_numpy()
+    return data if mask.all() else data[mask]
+
+
+def page(df, number, size):
+    """
+    One page of rows.
+
+    Parameters:
+    number - 1-based page number, clipped to the pages there are.
+    size - rows per page.
+
+    Returns: (rows of the page, page number shown, number of pages).
+    """
+    pages = max(1, -(-len(df) // size))
+    number = min(max(1, int(number)), pages)
+    return df.iloc[(number - 1) * size:number * size], number, pages
+
+
+def label_counts_figure(summary):
+    """Bar chart of the articles per label combination, coloured by mean score."""
+    import plotly.express as px
+    fig = px.bar(summary, x="label", y="articles", color="mean_score",
+                 hover_data=["min_score", "max_score"], title="Articles per (✓/✗) combination")
+    fig.update_layout(xaxis=dict(tickangle=90, type="category"))
+    return fig
+
+
+def histogram_figure(histogram):
+    """Bar chart of the articles per total score."""
+    import plotly.express as px
+    return px.bar(histogram, x="score", y="articles", title="Score distribution")
+
+
+def articles_figure(rows, start=0, threshold=SCATTERGL_THRESHOLD):
+    """
+    Scatter plot of one page of articles: label combination with score against position in
+    the list (start + 1 for the first row). One trace coloured by score, drawn with WebGL
+    (scattergl) above threshold points; short pages show the titles as y-axis labels.
+    """
+    import plotly.express as px
+    rows = rows.assign(position=np.arange(start + 1, start + len(rows) + 1))
+    fig = px.scatter(rows, x="label_SCORES", y="position", color="SCORES", hover_data=["title", "SCORES"],
+                     labels={"label_SCORES": "Variable Combination"},
+                     render_mode="webgl" if len(rows) > threshold else "svg",
+                     title="Articles with (✓/✗) and Scores")
+    yaxis = dict(autorange="reversed", title="")
+    if len(rows) <= MAX_LABELLED_ROWS:
+        yaxis.update(tickmode="array", tickvals=rows["position"], ticktext=rows["short_title"])
+    fig.update_layout(xaxis=dict(type="category", categoryorder="category ascending", tickangle=90),
+                      yaxis=yaxis, height=max(400, min(ROW_HEIGHT * len(rows), 2000)))
+    return fig
@@ -0,0 +1,358 @@
+# Append-only store for screening results.
+# One JSON Lines file holds every result, flattened to the dotted column names that
+# pd.json_normalize produced from the old article_{idx}.json files, plus a binary sidecar
+# index of (article_idx, byte offset) pairs for random access to single records.
+# A Parquet snapshot of everything up to a byte offset makes repeated loads cheap: only
+# the lines appended since the snapshot are parsed as JSON.
+# pandas and pyarrow are imported when results are read, so appending (the screening
+# workers) and importing the store stay light.
+import io
+import os
+import sys
+import json
+import functools
+import threading
+import numpy as np
+
+RESULTS_PATH = "screening_results.jsonl"
+INDEX_DTYPE = np.dtype([("article_idx", "<i8"), ("offset", "<i8")])
+SNAPSHOT_MIN_TAIL = 1000  # rewrite the Parquet snapshot once this many new records have arrived
+
+
+@functools.lru_cache(maxsize=None)
+def _arrow():
+    """pyarrow with its json and parquet modules loaded, or None without pyarrow."""
+    try:
+        import pyarrow
+        import pyarrow.json
+        import pyarrow.parquet
+    except ImportError:  # pandas' JSON reader is used and no snapshot is kept
+        return None
+    return pyarrow
+
+
+def _complete_size(f):
+    """Bytes of an open results file up to the end of its last complete line."""
+    size = f.seek(0, os.SEEK_END)
+    if not size:
+        return 0
+    f.seek(size - 1)
+    if f.read(1) == b"\n":
+        return size
+    # Walk back to the last complete line
+    data_end = size
+    while data_end > 0:
+        step = min(65536, data_end)
+        f.seek(data_end - step)
+        block = f.read(step)
+        newline = block.rfind(b"\n")
+        if newline >= 0:
+            return data_end - step + newline + 1
+        data_end -= step
+    return 0
+
+
+def flatten_result(data, prefix=""):
+    """
+    Flatten a nested screening result into dotted keys, e.g. term_analysis.bmi_adiposity.present,
+    matching the columns pd.json_normalize gives. Lists are kept as values.
+    """
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten_result(value, f"{name}."))
+        else:
+            flat[name] = value
+    return flat
+
+
+class ResultsStore:
+    """
+    Append-only JSON Lines results file with an offset index.
+
+    Each append is a single write of one complete line, so a crash can at worst leave a
+    partial last line, which is dropped the next time the store is opened.
+
+    Parameters:
+    path - JSON Lines file.
+    fsync - flush every append to disk.
+    readonly - only read the store, e.g. the partial results of a run that another thread or
+               process is still appending to; nothing is repaired, written or snapshotted, and
+               a line being written at that moment is left out.
+    """
+
+    def __init__(self, path=RESULTS_PATH, fsync=False, readonly=False):
+        self.path = path
+        self.index_path = path + ".idx"
+        self.snapshot_path = path + ".parquet"
+        self.snapshot_meta_path = path + ".parquet.json"
+        self.fsync = fsync
+        self.readonly = readonly
+        self._lock = threading.Lock()
+        if readonly:
+            return
+        self._repair()
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._index_fd = os.open(self.index_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def _repair(self):
+        """Drop a torn last line and bring the sidecar index in line with the data file."""
+        if not os.path.exists(self.path):
+            for path in (self.path, self.index_path):
+                open(path, "wb").close()
+            return
+        with open(self.path, "rb+") as f:
+            size = _complete_size(f)
+            if size != f.seek(0, os.SEEK_END):
+                f.truncate(size)
+
+        index = self.read_index()
+        valid = index[index["offset"] < size]
+        missing = []
+        with open(self.path, "rb") as f:
+            offset = 0
+            if len(valid):
+                # The last indexed line is already covered; index whatever follows it
+                offset = int(valid["offset"][-1])
+                f.seek(offset)
+                offset += len(f.readline())
+            for line in f:
+                missing.append((json.loads(line)["article_idx"], offset))
+                offset += len(line)
+        if missing or len(valid) != len(index):
+            np.concatenate([valid, np.array(missing, dtype=INDEX_DTYPE)]).tofile(self.index_path)
+
+    def read_index(self):
+        """Return the (article_idx, offset) index as a structured NumPy array."""
+        if not os.path.exists(self.index_path):
+            return np.empty(0, dtype=INDEX_DTYPE)
+        with open(self.index_path, "rb") as f:
+            data = f.read()
+        usable = len(data) - len(data) % INDEX_DTYPE.itemsize  # ignore a torn trailing entry
+        return np.frombuffer(data[:usable], dtype=INDEX_DTYPE)
+
+    def append(self, article_idx, result):
+        """
+        Append one screening result.
+
+        Parameters:
+        article_idx - row index of the article in the input export.
+        result - parsed JSON response from the model.
+        """
+        record = flatten_result(result)
+        record["article_idx"] = int(article_idx)  # also overrides the idx of a re-appended stored record
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            offset = os.lseek(self._fd, 0, os.SEEK_END)
+            os.write(self._fd, line)
+            if self.fsync:
+                os.fsync(self._fd)
+            os.write(self._index_fd, np.array([(article_idx, offset)], dtype=INDEX_DTYPE).tobytes())
+
+    def get(self, article_idx):
+        """Return the latest flattened result for one article, or None."""
+        index = self.read_index()
+        offsets = index["offset"][index["article_idx"] == article_idx]
+        if not len(offsets):
+            return None
+        with open(self.path, "rb") as f:
+            f.seek(int(offsets[-1]))
+            return json.loads(f.readline())
+
+    def get_many(self, article_idxs):
+        """Return {article_idx: latest flattened result} for several articles, reading the index once."""
+        index = self.read_index()
+        latest = dict(zip(index["article_idx"].tolist(), index["offset"].tolist()))  # later entries win
+        found = {}
+        with open(self.path, "rb") as f:
+            for article_idx in article_idxs:
+                if article_idx in latest:
+                    f.seek(latest[article_idx])
+                    found[article_idx] = json.loads(f.readline())
+        return found
+
+    def completed_ids(self):
+        """Return the set of article indices that have a stored result."""
+        return set(np.unique(self.read_index()["article_idx"]).tolist())
+
+    def __len__(self):
+        # One index entry per stored record; a torn trailing entry is not counted
+        if not os.path.exists(self.index_path):
+            return 0
+        return os.path.getsize(self.index_path) // INDEX_DTYPE.itemsize
+
+    def size(self):
+        """Bytes of complete records in the store; grows with every append, so it doubles as a version."""
+        if not self.readonly:
+            return os.path.getsize(self.path)
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, "rb") as f:
+            return _complete_size(f)
+
+    def read_range(self, start, end):
+        """
+        Parse the records stored between two byte offsets.
+
+        Returns: DataFrame of the flattened records, in append order.
+        """
+        import pandas as pd
+        if end <= start:
+            return pd.DataFrame()
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            data = f.read(end - start)
+        pyarrow = _arrow()
+        if pyarrow is not None:
+            try:
+                return pyarrow.json.read_json(io.BytesIO(data)).to_pandas()
+            except pyarrow.ArrowInvalid:
+                pass  # heterogeneous records (e.g. an empty list then a list of strings)
+        return pd.DataFrame.from_records([json.loads(line) for line in data.splitlines()])
+
+    def _read_snapshot(self, end, columns=None):
+        """Return (DataFrame, offset) of the Parquet snapshot, or (None, 0) if it is unusable."""
+        import pandas as pd
+        pyarrow = _arrow()
+        if pyarrow is None or not os.path.exists(self.snapshot_meta_path):
+            return None, 0
+        with open(self.snapshot_meta_path) as f:
+            offset = json.load(f)["offset"]
+        if offset > end or not os.path.exists(self.snapshot_path):
+            return None, 0
+        if columns is not None:
+            available = pyarrow.parquet.read_schema(self.snapshot_path).names
+            columns = [column for column in columns if column in available]
+        return pd.read_parquet(self.snapshot_path, columns=columns), offset
+
+    def _write_snapshot(self, df, offset):
+        try:
+            df.to_parquet(self.snapshot_path + ".tmp", index=False)
+        except (_arrow().ArrowException, TypeError, ValueError) as e:
+            print(f"WARNING: Could not snapshot results to Parquet - {e}")
+            return
+        os.replace(self.snapshot_path + ".tmp", self.snapshot_path)
+        with open(self.snapshot_meta_path + ".tmp", "w") as f:
+            json.dump({"offset": offset}, f)
+        os.replace(self.snapshot_meta_path + ".tmp", self.snapshot_meta_path)
+
+    def load(self, columns=None, end=None):
+        """
+        Load every result into a DataFrame, one row per article (latest result wins).
+
+        Parameters:
+        columns - optional list of flattened columns to load; skipping the list-valued
+                  variations_found/locations columns makes loading several times faster.
+        end - load the records up to this byte offset (a size() taken earlier), default all.
+
+        Returns: DataFrame with article_idx and the flattened result columns.
+        """
+        import pandas as pd
+        end = self.size() if end is None else end
+        if end == 0:
+            return pd.DataFrame()
+        if columns is not None:
+            columns = ["article_idx"] + [column for column in columns if column != "article_idx"]
+        snapshot, offset = self._read_snapshot(end, columns)
+        tail = self.read_range(offset, end)
+        if not self.readonly and len(tail) >= SNAPSHOT_MIN_TAIL:
+            if snapshot is None and _arrow() is not None:
+                self._write_snapshot(tail, end)
+            elif snapshot is not None and columns is None:
+                self._write_snapshot(pd.concat([snapshot, tail], ignore_index=True), end)
+        if columns is not None:
+            tail = tail.reindex(columns=columns)
+        df = tail if snapshot is None else pd.concat([snapshot, tail], ignore_index=True)
+        return df.drop_duplicates("article_idx", keep="last").sort_values("article_idx").reset_index(drop=True)
+
+    def to_parquet(self, parquet_path):
+        """Export the results as a Parquet file for the analysis step."""
+        self.load().to_parquet(parquet_path, index=False)
+        return parquet_path
+
+    def close(self):
+        if self.readonly:
+            return
+        with self._lock:
+            os.close(self._fd)
+            os.close(self._index_fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ResultsView:
+    """
+    In-memory copy of a results store that later refreshes bring up to date by parsing only
+    the records appended since the previous one. The byte offset read so far is the version
+    of the results, for memoising anything derived from them (scores, plots) per version.
+
+    Parameters:
+    path - results store; opened read-only, so a screening run may be appending to it.
+    columns - optional list of flattened columns to keep, as in ResultsStore.load.
+    """
+
+    def __init__(self, path=RESULTS_PATH, columns=None):
+        self.store = ResultsStore(path, readonly=True)
+        self.columns = columns
+        self.version = 0
+        self._df = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """
+        Read the records appended since the last refresh.
+
+        Returns: (DataFrame, version). The DataFrame has one row per article (latest result
+        wins), sorted by article_idx; it is shared, so copy it before changing it.
+        """
+        import pandas as pd
+        with self._lock:
+            end = self.store.size()
+            if end < self.version:  # the store was replaced; start over
+                self.version, self._df = 0, None
+            if self._df is None:
+                self._df = self.store.load(self.columns, end)  # uses the Parquet snapshot if there is one
+            elif end > self.version:
+                tail = self.store.read_range(self.version, end)
+                if self.columns is not None:
+                    tail = tail.reindex(columns=["article_idx", *[c for c in self.columns if c != "article_idx"]])
+                df = pd.concat([self._df, tail], ignore_index=True) if len(self._df) else tail
+                if df["article_idx"].duplicated().any():
+                    df = df.drop_duplicates("article_idx", keep="last")
+                self._df = df.sort_values("article_idx", kind="stable").reset_index(drop=True)
+            self.version = end
+            return self._df, end
+
+
+def import_json_files(directory, store, table_keyword="article"):
+    """
+    Move legacy article_{idx}.json outputs into a results store.
+
+    Parameters:
+    directory - folder containing the json files.
+    store - ResultsStore to append to.
+    table_keyword - filename prefix of the result files.
+
+    Returns: number of results imported.
+    """
+    count = 0
+    for filename in sorted(os.listdir(directory)):
+        stem, ext = os.path.splitext(filename)
+        if ext != ".json" or not stem.startswith(f"{table_keyword}_") or not stem.split("_")[-1].isdigit():
+            continue
+        with open(os.path.join(directory, filename)) as f:
+            store.append(int(stem.split("_")[-1]), json.load(f))
+        count += 1
+    return count
+
+
+if __name__ == "__main__":
+    # Convert a results store to Parquet, e.g. python results_store.py screening_results.jsonl results.parquet
+    store = ResultsStore(sys.argv[1])
+    print(f"Wrote {store.to_parquet(sys.argv[2])} ({len(store)} records)")
+    store.close()
@@ -0,0 +1,184 @@
+# Run manifests for resumable screening.
+# Each run records its input fingerprint and prompt version, and every article's state
+# (pending, done, failed) is committed as results arrive, so a run that dies partway
+# can be resumed without paying for the finished articles again.
+import sys
+import time
+import uuid
+import hashlib
+import sqlite3
+import threading
+
+from prompt_registry import get_prompt
+
+MANIFEST_PATH = "screening_runs.sqlite"
+PENDING, DONE, FAILED = "pending", "done", "failed"
+
+
+def fingerprint_file(source, block_size=1 << 20):
+    """
+    Hash the contents of an input export.
+
+    Parameters:
+    source - path or file-like object (rewound before and after hashing).
+
+    Returns: hex sha256 digest.
+    """
+    digest = hashlib.sha256()
+    if hasattr(source, "read"):
+        source.seek(0)
+        while True:
+            block = source.read(block_size)
+            if not block:
+                break
+            digest.update(block.encode() if isinstance(block, str) else block)
+        source.seek(0)
+    else:
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def prompt_version(prompt=None, model=None):
+    """
+    Short content hash of a prompt version (default prompt if None); changes whenever the prompt
+    or its model settings do, or when a backend serves it with a different model.
+    """
+    prompt = get_prompt(prompt)
+    if model is None or model == prompt.model:
+        return prompt.content_hash[:16]
+    return hashlib.sha256(f"{prompt.content_hash}\n{model}".encode("utf-8")).hexdigest()[:16]
+
+
+class RunManifest:
+    """SQLite record of screening runs and the completion state of every article in them."""
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self.run_id = None
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                input_fingerprint TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                results_path TEXT,
+                status TEXT NOT NULL,
+                created REAL NOT NULL,
+                updated REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS articles (
+                run_id TEXT NOT NULL,
+                article_idx INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                updated REAL NOT NULL,
+                PRIMARY KEY (run_id, article_idx));
+        """)
+        self._conn.commit()
+
+    def start(self, input_fingerprint, prompt_version, results_path=None, resume=None):
+        """
+        Open a run.
+
+        Parameters:
+        input_fingerprint - fingerprint_file of the export.
+        prompt_version - prompt_version() of the prompt in use.
+        results_path - results store the run writes to.
+        resume - run ID to resume, "latest" for the most recent matching run, or None for a new run.
+
+        Returns: run ID.
+        """
+        with self._lock:
+            row = None
+            if resume == "latest":
+                row = self._conn.execute(
+                    "SELECT run_id FROM runs WHERE input_fingerprint = ? AND prompt_version = ? "
+                    "ORDER BY created DESC LIMIT 1", (input_fingerprint, prompt_version)).fetchone()
+                if row is None:
+                    print("No earlier run of this input and prompt to resume; starting a new run.")
+            elif resume:
+                row = self._conn.execute("SELECT run_id, input_fingerprint, prompt_version FROM runs WHERE run_id = ?",
+                                         (resume,)).fetchone()
+                if row is None:
+                    raise ValueError(f"Unknown run ID {resume}")
+                if row[1:] != (input_fingerprint, prompt_version):
+                    raise ValueError(f"Run {resume} was made with a different input file or prompt version")
+
+            now = time.time()
+            if row is not None:
+                self.run_id = row[0]
+                self._conn.execute("UPDATE runs SET status = 'running', updated = ? WHERE run_id = ?",
+                                   (now, self.run_id))
+                print(f"Resuming run {self.run_id}: {self._counts_locked()}")
+            else:
+                self.run_id = uuid.uuid4().hex[:12]
+                self._conn.execute("INSERT INTO runs VALUES (?, ?, ?, ?, 'running', ?, ?)",
+                                   (self.run_id, input_fingerprint, prompt_version, results_path, now, now))
+                print(f"Started run {self.run_id}")
+            self._conn.commit()
+        return self.run_id
+
+    def completed_ids(self):
+        """Return the set of article indices already done in this run."""
+        with self._lock:
+            rows = self._conn.execute("SELECT article_idx FROM articles WHERE run_id = ? AND state = ?",
+                                      (self.run_id, DONE))
+            return {row[0] for row in rows}
+
+    def mark(self, article_idx, state, error=None):
+        """Commit the state of one article; attempts counts every move to pending."""
+        with self._lock:
+            self._conn.execute("""
+                INSERT INTO articles (run_id, article_idx, state, attempts, error, updated)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (run_id, article_idx) DO UPDATE SET
+                    state = excluded.state,
+                    attempts = articles.attempts + excluded.attempts,
+                    error = excluded.error,
+                    updated = excluded.updated""",
+                (self.run_id, int(article_idx), state, int(state == PENDING), error, time.time()))
+            self._conn.commit()
+
+    def _counts_locked(self):
+        rows = self._conn.execute("SELECT state, COUNT(*) FROM articles WHERE run_id = ? GROUP BY state",
+                                  (self.run_id,))
+        return dict(rows.fetchall())
+
+    def counts(self):
+        """Number of articles per state in this run."""
+        with self._lock:
+            return self._counts_locked()
+
+    def finish(self):
+        """Close the run as completed, or as incomplete if articles are still pending or failed."""
+        with self._lock:
+            counts = self._counts_locked()
+            status = "completed" if not counts.get(PENDING) and not counts.get(FAILED) else "incomplete"
+            self._conn.execute("UPDATE runs SET status = ?, updated = ? WHERE run_id = ?",
+                               (status, time.time(), self.run_id))
+            self._conn.commit()
+        print(f"Run {self.run_id} {status}: {counts}")
+        return status
+
+    def runs(self):
+        """List all runs, newest first."""
+        with self._lock:
+            return self._conn.execute("SELECT run_id, status, input_fingerprint, prompt_version, results_path, created "
+                                      "FROM runs ORDER BY created DESC").fetchall()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+if __name__ == "__main__":
+    # List the runs in a manifest, e.g. python run_manifest.py screening_runs.sqlite
+    manifest = RunManifest(sys.argv[1] if len(sys.argv) > 1 else MANIFEST_PATH)
+    for run in manifest.runs():
+        print(*run)
+    manifest.close()
@@ -0,0 +1,108 @@
+# Vectorised scoring of screening results.
+# The score is a weighted count of the term flags the model returned: the flags form a
+# boolean matrix (one row per article) and the score is its dot product with SCORE_WEIGHTS.
+import numpy as np
+
+# Result column -> points awarded when the flag is true.
+# Weight 0 keeps a flag out of the score (MR as main method and European ancestry used to score
+# 2 and 5 respectively before they were switched off).
+SCORE_WEIGHTS = {
+    "term_analysis.bmi_adiposity.present": 2,
+    "term_analysis.bmi_adiposity.is_main_exposure": 10,
+    "term_analysis.blood_pressure.present": 2,
+    "term_analysis.blood_pressure.is_main_outcome": 10,
+    "term_analysis.mendelian_randomisation.present": 2,
+    "term_analysis.mendelian_randomisation.is_main_method": 0,
+    "term_analysis.european_ancestry.present": 2,
+    "term_analysis.european_ancestry.is_ancestry_European": 0,
+}
+
+# Flags shown as the tick/cross label of each article, in label order
+LABEL_COLUMNS = (
+    "term_analysis.bmi_adiposity.present", "term_analysis.bmi_adiposity.is_main_exposure",
+    "term_analysis.blood_pressure.present", "term_analysis.blood_pressure.is_main_outcome",
+    "term_analysis.mendelian_randomisation.present", "term_analysis.mendelian_randomisation.is_main_method",
+    "term_analysis.european_ancestry.present", "term_analysis.european_ancestry.is_ancestry_European",
+)
+TICK, CROSS = "✓", "✗"
+
+# Values counted as true; anything else, including NaN from a missing or malformed field, is false
+TRUE_VALUES = [True, "true", "True", "TRUE", "yes", "Yes"]
+
+
+def flag_matrix(df, columns):
+    """
+    Boolean matrix of result flags, one column per entry of columns.
+
+    Missing columns, NaN (the field was absent from the model's JSON) and values other than
+    true / "true" count as false.
+    """
+    matrix = np.zeros((len(df), len(columns)), dtype=bool, order="F")  # column-major: filled and summed by column
+    for j, column in enumerate(columns):
+        if column not in df.columns:
+            continue
+        values = df[column]
+        if values.dtype == bool:
+            matrix[:, j] = values.to_numpy()
+        else:
+            matrix[:, j] = values.isin(TRUE_VALUES).to_numpy()
+    return matrix
+
+
+def score(df, weights=SCORE_WEIGHTS):
+    """
+    Score every screened article.
+
+    Parameters:
+    df - results as loaded from the results store (flattened term_analysis columns).
+    weights - column -> points.
+
+    Returns: int64 NumPy array of scores.
+    """
+    return _weighted_sum(flag_matrix(df, list(weights)), list(weights.values()))
+
+
+def _weighted_sum(matrix, weights):
+    # A float32 matrix-vector product goes through BLAS; integer weights stay exact in float32
+    product = matrix.astype(np.float32, order="F") @ np.asarray(weights, dtype=np.float32)
+    return np.rint(product).astype(np.int64)
+
+
+def _categorical(codes, render):
+    """
+    Categorical of render(code) per row for small non-negative integer codes, rendering each
+    distinct code once; categories are sorted like astype("category") would sort them.
+    """
+    import pandas as pd
+    unique = np.flatnonzero(np.bincount(codes))
+    texts = np.asarray([render(int(code)) for code in unique], dtype=object)
+    order = np.argsort(texts, kind="stable")
+    rank = np.zeros(unique[-1] + 1 if len(unique) else 0, dtype=np.int64)
+    rank[unique[order]] = np.arange(len(order))
+    return pd.Categorical.from_codes(rank[codes], categories=texts[order])
+
+
+def score_labels(df, scores=None, columns=LABEL_COLUMNS):
+    """
+    Tick/cross label of the flags of every article, e.g. ✓✓✗✓✗✗✓✗, and the label with its
+    score appended (✓✓✗✓✗✗✓✗_16) when scores are given.
+
+    Each distinct flag pattern is rendered once, so the cost of the strings does not grow
+    with the number of rows.
+
+    Returns: (labels, label_scores) as Categoricals; label_scores is None without scores.
+    """
+    patterns = _weighted_sum(flag_matrix(df, columns), 1 << np.arange(len(columns)))
+
+    def render(pattern):
+        return "".join(TICK if pattern >> j & 1 else CROSS for j in range(len(columns)))
+
+    labels = _categorical(patterns, render)
+    if scores is None:
+        return labels, None
+    scores = np.asarray(scores, dtype=np.int64)
+    offset = int(scores.min(initial=0))
+    base = int(scores.max(initial=0)) - offset + 1
+    label_scores = _categorical(patterns * base + (scores - offset),
+                                lambda code: f"{render(code // base)}_{code % base + offset}")
+    return labels, label_scores
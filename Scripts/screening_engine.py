@@ -0,0 +1,622 @@
+# Concurrent screening engine: a bounded pool of asyncio workers sharing one LLM backend
+# (llm_backends: hosted, local or recorded), used in place of the serial process_articles loop.
+import os
+import asyncio
+import argparse
+from contextlib import ExitStack
+import numpy as np
+
+from prompt_registry import get_prompt, PROMPTS, DEFAULT_PROMPT
+from llm_backends import OpenAIBackend, as_backend, make_backend, RECORDING_PATH
+from scoring import score
+from ingest import iter_articles, iter_articles_ranked
+from rate_limiter import RateLimitScheduler, estimate_tokens, REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE
+from response_cache import ResponseCache, CACHE_PATH
+from deduplication import DeduplicationIndex
+from results_store import ResultsStore, RESULTS_PATH
+from packing import construct_packed_prompt, pack_records, parse_packed_response, completion_budget, PACK_SIZE
+from prefilter import Prefilter
+from response_schema import get_validator, request_options, reply_text, parse_reply, repair_messages, REPAIR_MAX_TOKENS
+from run_manifest import RunManifest, fingerprint_file, prompt_version, MANIFEST_PATH, PENDING, DONE, FAILED
+
+# Defaults for the worker pool
+MAX_IN_FLIGHT = 8
+ARTICLE_TIMEOUT = 120  # seconds allowed for a single API call before it is retried
+REQUEUE_PASSES = 1  # extra passes over articles that still failed after all retries
+# Scores escalated to a second backend: one of BMI-as-exposure / BP-as-outcome but not both
+BORDERLINE_BAND = (10, 24)
+
+
+def make_async_client(api_key=None, base_url=None):
+    """
+    Build the hosted backend used by the screening workers.
+
+    Parameters:
+    api_key - API key, defaults to the UoB organisation key from the environment.
+    base_url - optional OpenAI-compatible endpoint, e.g. a local mock server for testing.
+
+    Returns: llm_backends.OpenAIBackend with a pooled client. Its own retries are disabled,
+    RateLimitScheduler handles them.
+    """
+    return OpenAIBackend(api_key=api_key, base_url=base_url)
+
+
+async def query_openai_async(backend, prompt, max_tokens=None, version=None, validate=True, validator=None):
+    """
+    Async counterpart of utils.query_openai.
+
+    Parameters:
+    backend - llm_backends backend (or bare AsyncOpenAI client) shared by all workers; its
+              model, if set, replaces the prompt version's model.
+    prompt - prompt rendered by a PromptVersion (or packing.construct_packed_prompt).
+    max_tokens - optional completion limit.
+    version - prompt version (prompt_registry) giving the model settings and response schema;
+              default prompt if None.
+    validate - constrain the reply to the version's schema and validate it; False for packed
+               prompts, whose entries are validated one by one by the caller.
+    validator - response_schema validator counting this run's replies; a new one for the
+                version's schema if None.
+
+    Returns: parsed JSON response, or None if the model did not return valid JSON or a
+    repair call could not fix its malformed fields.
+    """
+    version = get_prompt(version)
+    backend = as_backend(backend)
+    model = backend.model or version.model
+    options = {} if max_tokens is None else {"max_tokens": max_tokens}
+    options.update(request_options(version.schema, model, backend.structured_output) if validate
+                   else {"response_format": {"type": "json_object"}})
+    response = await backend.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": version.system_message},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=version.temperature,
+        **options
+    )
+    data = parse_reply(reply_text(response.choices[0].message))
+    if not validate:
+        if data is None:
+            print("ERROR: OpenAI returned invalid JSON.")
+        return data
+    if validator is None:
+        validator = get_validator(version.schema)
+    errors = validator.check(data)
+    if not errors:
+        return data
+    if not isinstance(data, dict):
+        print("ERROR: OpenAI returned invalid JSON.")
+        return None
+
+    # Ask again for the malformed fields only
+    repair = await backend.create(
+        model=model,
+        messages=repair_messages(prompt, data, errors, validator),
+        temperature=0,
+        max_tokens=REPAIR_MAX_TOKENS,
+        response_format={"type": "json_object"}
+    )
+    errors = validator.repaired(data, parse_reply(reply_text(repair.choices[0].message)))
+    if errors:
+        print(f"ERROR: Fields still malformed after repair {errors}")
+        return None
+    return data
+
+
+class ScreeningRun:
+    """
+    State of one prompt version within a screen_articles / screen_prompt_versions call, handed
+    to every worker. Several runs share the backend, scheduler and cache.
+    """
+
+    def __init__(self, backend, scheduler, cache, store, manifest, timeout, prompt=None):
+        self.backend = as_backend(backend)
+        self.scheduler = scheduler
+        self.cache = cache
+        self.store = store
+        self.manifest = manifest
+        self.timeout = timeout
+        self.prompt = get_prompt(prompt)
+        self.model = self.backend.model or self.prompt.model
+        self.validator = get_validator(self.prompt.schema)  # this run's own reply counters
+        self.completed = manifest.completed_ids() if manifest is not None else set()
+        self.order = []
+        self.results = {}
+        self.failed = []
+        self.pack_counters = {"packed_calls": 0, "packed_articles": 0, "rescreened_alone": 0}
+
+    def record_result(self, record, response_data):
+        """Keep, store and checkpoint the result of one article."""
+        idx = record["idx"]
+        self.results[idx] = response_data
+        if response_data is None:
+            print(f"Skipping article {idx} due to invalid OpenAI response.")
+            if self.manifest is not None:
+                self.manifest.mark(idx, FAILED, "invalid JSON response")
+            return
+        if self.store is not None:
+            self.store.append(idx, response_data)
+            print(f"Processed {record['title']} -> article {idx} ({self.prompt.name})")
+        if self.manifest is not None:
+            self.manifest.mark(idx, DONE)
+
+    async def query(self, prompt, max_tokens=None, validate=True):
+        """Send one prompt through the rate limiter with a per-call timeout."""
+        async def request():
+            return await asyncio.wait_for(query_openai_async(self.backend, prompt, max_tokens, self.prompt, validate,
+                                                             self.validator),
+                                          self.timeout)
+        return await self.scheduler.run(request, prompt, max_tokens)
+
+
+def _record_failure(run, record, message):
+    """Keep a failed article for the re-queue pass."""
+    print(f"ERROR: {message}")
+    run.failed.append(record)
+    run.results[record["idx"]] = None
+
+
+async def _screen_single(run, record, prompt, key):
+    """Screen one article with its own prompt."""
+    try:
+        response_data = await run.query(prompt)
+    except Exception as e:
+        # Retries are exhausted; keep the article for the re-queue pass
+        _record_failure(run, record, f"Failed to query OpenAI for article {record['idx']} - {e!r}")
+        return
+    if response_data is not None and run.cache is not None:
+        run.cache.put(key, response_data)
+    run.record_result(record, response_data)
+
+
+async def _screen_packed(run, items):
+    """
+    Screen several articles in one call. Returns the items whose entry was missing or
+    malformed in the reply, to be screened on their own.
+    """
+    records = [record for record, _, _ in items]
+    prompt = construct_packed_prompt(records, run.prompt)
+    try:
+        data = await run.query(prompt, completion_budget(records), validate=False)
+    except Exception as e:
+        print(f"ERROR: Packed call for {len(records)} articles failed - {e!r}")
+        data = None
+    parsed = parse_packed_response(data, records) if data is not None else {}
+    # Entries that fail the schema are screened on their own, where a repair call can fix them
+    parsed = {idx: entry for idx, entry in parsed.items() if not run.validator.check(entry)}
+    run.pack_counters["packed_calls"] += 1
+    run.pack_counters["packed_articles"] += len(parsed)
+    leftover = []
+    for record, prompt, key in items:
+        if record["idx"] in parsed:
+            if run.cache is not None:
+                run.cache.put(key, parsed[record["idx"]])
+            run.record_result(record, parsed[record["idx"]])
+        else:
+            leftover.append((record, prompt, key))
+    run.pack_counters["rescreened_alone"] += len(leftover)
+    return leftover
+
+
+async def _screen_worker(queue, runs, cancel=None):
+    """
+    Take packs of articles off the queue until the stop sentinel (None) arrives and screen
+    each pack under every prompt version that has not finished it yet. Once cancel is set,
+    the packs still queued are dropped.
+    """
+    while True:
+        pack = await queue.get()
+        try:
+            if pack is None:
+                return
+            if cancel is not None and cancel.is_set():
+                continue
+            for run in runs:
+                todo = []
+                for record in pack:
+                    if record["idx"] in run.completed:
+                        continue
+                    # A bad record fails on its own; an exception here would end the worker and
+                    # leave the producer waiting on a full queue
+                    try:
+                        prompt = run.prompt.render(record["title"], record["abstract"])
+                        key = run.prompt.cache_key(prompt, run.model)
+                        cached = run.cache.get(key) if run.cache is not None else None
+                        if cached is not None:
+                            run.record_result(record, cached)
+                        else:
+                            todo.append((record, prompt, key))
+                    except Exception as e:
+                        _record_failure(run, record, f"Could not screen article {record['idx']} - {e!r}")
+                if len(todo) > 1:
+                    try:
+                        todo = await _screen_packed(run, todo)
+                    except Exception as e:
+                        print(f"ERROR: Packed screening of {len(todo)} articles failed - {e!r}")
+                for record, prompt, key in todo:
+                    try:
+                        await _screen_single(run, record, prompt, key)
+                    except Exception as e:
+                        _record_failure(run, record, f"Could not screen article {record['idx']} - {e!r}")
+        finally:
+            queue.task_done()
+
+
+def _eligible_records(runs, records, dedup_index, prefilter=None, track_order=True):
+    """
+    Filter out articles every run finished in an earlier attempt, copies of duplicates and, with
+    a prefilter, articles the keyword pre-screen excludes (their result is recorded directly).
+    """
+    def canonical_records():
+        for record in records:
+            canonical = record["idx"]
+            if dedup_index is not None:
+                canonical = dedup_index.add(record["idx"], record["title"], record.get("doi"), record.get("accession"))
+            pending = [run for run in runs if record["idx"] not in run.completed]
+            if not pending:
+                continue  # finished in an earlier attempt of a resumed run
+            if track_order:
+                for run in pending:
+                    run.order.append(record["idx"])
+            if canonical != record["idx"]:
+                continue  # a copy of an article already queued; its decision is fanned out later
+            yield record
+
+    # The pre-filter screens the stream in chunks with its vectorised screen_texts
+    screened = (prefilter.screen_stream(canonical_records()) if prefilter is not None
+                else ((record, None) for record in canonical_records()))
+    for record, found in screened:
+        pending = [run for run in runs if record["idx"] not in run.completed]
+        if found is not None:
+            # Stored in the response schema of each run's prompt version
+            for run in pending:
+                run.record_result(record, prefilter.build_result(record, found, run.prompt.schema))
+            continue
+        for run in pending:
+            if run.manifest is not None:
+                run.manifest.mark(record["idx"], PENDING)
+        yield record
+
+
+async def _run_pass(runs, records, max_in_flight, pack_size=1, dedup_index=None, prefilter=None, track_order=True,
+                    cancel=None):
+    """
+    Push records through a fresh worker pool; the records that failed permanently are left in run.failed.
+    Setting cancel (a threading.Event) stops the pass after the calls already in flight.
+    """
+    # A bounded queue keeps memory flat: the producer waits while every worker is busy
+    queue = asyncio.Queue(maxsize=2 * max_in_flight)
+    for run in runs:
+        run.failed = []
+    workers = [asyncio.create_task(_screen_worker(queue, runs, cancel)) for _ in range(max_in_flight)]
+    eligible = _eligible_records(runs, records, dedup_index, prefilter, track_order)
+    if pack_size > 1:
+        # A pack is screened under every run's prompt version; size it for the longest preamble
+        widest = max(runs, key=lambda run: estimate_tokens(construct_packed_prompt([], run.prompt), run.model))
+        packs = pack_records(eligible, pack_size, model=widest.model, prompt=widest.prompt)
+    else:
+        packs = ([record] for record in eligible)
+    try:
+        for pack in packs:
+            if cancel is not None and cancel.is_set():
+                break
+            await queue.put(pack)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for worker in workers:
+            worker.cancel()
+
+
+async def _screen_runs(runs, records, max_in_flight, requeue_passes, dedup_index, pack_size, prefilter, cancel=None):
+    """Screen one shared article stream under every run's prompt version in a single pass."""
+    scheduler = runs[0].scheduler
+    await _run_pass(runs, records, max_in_flight, pack_size, dedup_index, prefilter, cancel=cancel)
+    cancelled = cancel is not None and cancel.is_set()
+    if cancelled:
+        # Articles not screened yet stay pending in the manifest, so the run can be resumed
+        print("Screening cancelled; finished articles are kept and the rest can be resumed.")
+    for run in runs:
+        for pass_number in range(0 if cancelled else requeue_passes):
+            if not run.failed:
+                break
+            print(f"Re-queueing {len(run.failed)} failed article(s) of {run.prompt.name}, "
+                  f"pass {pass_number + 1}/{requeue_passes}")
+            scheduler.counters["requeued"] += len(run.failed)
+            await _run_pass([run], run.failed, max_in_flight, track_order=False, cancel=cancel)
+        if run.manifest is not None:
+            for record in run.failed:
+                run.manifest.mark(record["idx"], FAILED, "retries exhausted")
+
+    if dedup_index is not None:
+        for run in runs:
+            _fan_out_duplicates(run, dedup_index)
+        print(f"Deduplication summary: {dedup_index.report()}")
+
+    if prefilter is not None:
+        print(f"Pre-filter summary: {prefilter.report()}")
+    for run in runs:
+        label = f" ({run.prompt.name})" if len(runs) > 1 else ""
+        if pack_size > 1:
+            print(f"Packing summary{label}: {run.pack_counters}")
+        print(f"Response validation summary{label}: {run.validator.counters}")
+    print(f"Rate limiter summary: {scheduler.stats()}")
+    print(f"Backend summary: {runs[0].backend.report()}")
+    if runs[0].cache is not None:
+        print(f"Response cache summary: {runs[0].cache.report()}")
+
+
+def _fan_out_duplicates(run, dedup_index):
+    """Copy the result of each canonical article to its duplicates."""
+    results, store, manifest = run.results, run.store, run.manifest
+    for idx, canonical in dedup_index.canonical_of.items():
+        if idx != canonical and idx not in run.completed:
+            result = results.get(canonical)
+            if result is None and canonical in run.completed and store is not None:
+                result = store.get(canonical)  # screened before the run was resumed
+            results[idx] = result
+            if result is None:
+                if manifest is not None:
+                    manifest.mark(idx, FAILED, f"duplicate of failed article {canonical}")
+                continue
+            if store is not None:
+                store.append(idx, result)
+            if manifest is not None:
+                manifest.mark(idx, DONE)
+
+
+async def screen_articles(records, client=None, max_in_flight=MAX_IN_FLIGHT,
+                          timeout=ARTICLE_TIMEOUT, store=None, scheduler=None,
+                          requeue_passes=REQUEUE_PASSES, cache=None, dedup_index=None, manifest=None,
+                          pack_size=1, prefilter=None, prompt=None, cancel=None):
+    """
+    Screen articles concurrently with at most max_in_flight requests open at once.
+
+    Parameters:
+    records - iterable of dicts with idx, title and abstract (e.g. ingest.iter_articles).
+    client - llm_backends backend or AsyncOpenAI client, a hosted backend (make_async_client) if not supplied.
+    max_in_flight - number of workers, i.e. the maximum number of concurrent API calls.
+    timeout - seconds allowed per API call before it is retried.
+    store - ResultsStore each result is appended to as soon as it arrives, None to keep results in memory only.
+    scheduler - RateLimitScheduler enforcing RPM/TPM limits; a default one is created if not supplied.
+    requeue_passes - how many times articles that failed every retry are queued again at the end.
+    cache - optional ResponseCache; cached responses are reused without calling the API.
+    dedup_index - optional DeduplicationIndex; only the canonical record of each duplicate
+                  cluster is screened and its result is copied to the other records.
+    manifest - optional RunManifest (already started); articles it records as done are skipped and
+               every article's state is committed as it changes.
+    pack_size - maximum number of articles screened per call (packing.pack_records shrinks packs
+                to fit the context window); 1 sends one prompt per article.
+    prefilter - optional prefilter.Prefilter; articles it excludes are stored with its result
+                (flagged "prefilter": true) and never sent to the model.
+    prompt - prompt version name in prompt_registry (or a PromptVersion), default prompt if None.
+    cancel - optional threading.Event; once set, no new articles are sent and the call returns
+             after the requests in flight (the articles left are pending in the manifest).
+
+    Returns: list of (idx, response) tuples in the original row order for the articles screened
+    in this call; response is None for failed articles. Articles skipped on resume are not listed.
+    """
+    results = await screen_prompt_versions(records, [prompt], client, max_in_flight, timeout,
+                                           stores=[store], scheduler=scheduler, requeue_passes=requeue_passes,
+                                           cache=cache, dedup_index=dedup_index, manifests=[manifest],
+                                           pack_size=pack_size, prefilter=prefilter, cancel=cancel)
+    return next(iter(results.values()))
+
+
+async def screen_prompt_versions(records, prompts, client=None, max_in_flight=MAX_IN_FLIGHT,
+                                 timeout=ARTICLE_TIMEOUT, stores=None, scheduler=None,
+                                 requeue_passes=REQUEUE_PASSES, cache=None, dedup_index=None, manifests=None,
+                                 pack_size=1, prefilter=None, cancel=None):
+    """
+    Screen one deduplicated article stream under several prompt versions side by side.
+    Each article is read, deduplicated and pre-filtered once and then screened under every
+    version; the versions share the backend, the rate limiter and the response cache (whose
+    keys include each version's content hash and the model).
+
+    Parameters:
+    prompts - prompt version names (or PromptVersions); None entries mean the default prompt.
+    stores - optional list of ResultsStores, one per prompt version.
+    manifests - optional list of started RunManifests, one per prompt version.
+    Other parameters as in screen_articles.
+
+    Returns: dict of prompt version name -> list of (idx, response) tuples as in screen_articles.
+    """
+    backend = as_backend(client if client is not None else make_async_client())
+    if scheduler is None:
+        scheduler = RateLimitScheduler()
+    stores = stores or [None] * len(prompts)
+    manifests = manifests or [None] * len(prompts)
+    runs = [ScreeningRun(backend, scheduler, cache, store, manifest, timeout, prompt)
+            for prompt, store, manifest in zip(prompts, stores, manifests)]
+    await _screen_runs(runs, records, max_in_flight, requeue_passes, dedup_index, pack_size, prefilter, cancel)
+    return {run.prompt.name: [(idx, run.results.get(idx)) for idx in run.order] for run in runs}
+
+
+def results_path_for(results_path, prompt):
+    """Results store of a prompt version: results_path itself for the default prompt, else name-suffixed."""
+    name = get_prompt(prompt).name
+    if name == DEFAULT_PROMPT:
+        return results_path
+    root, ext = os.path.splitext(results_path)
+    return f"{root}.{name}{ext}"
+
+
+def borderline_ids(results, weights, band=BORDERLINE_BAND):
+    """
+    Articles whose score (scoring.score with the prompt version's weights) falls in band
+    [low, high); pre-filtered and failed articles are never borderline.
+
+    Parameters:
+    results - list of (idx, response) tuples as returned by screen_articles.
+
+    Returns: set of article indices.
+    """
+    screened = [(idx, result) for idx, result in results if result is not None and not result.get("prefilter")]
+    if not screened:
+        return set()
+    import pandas as pd
+    scores = score(pd.json_normalize([result for _, result in screened]), weights)
+    low, high = band
+    return {idx for (idx, _), value in zip(screened, scores) if low <= value < high}
+
+
+def escalated_path(results_path):
+    """Results store of the articles re-screened by the escalation backend."""
+    root, ext = os.path.splitext(results_path)
+    return f"{root}.escalated{ext}"
+
+
+def process_articles(uploaded_file, max_in_flight=MAX_IN_FLIGHT, timeout=ARTICLE_TIMEOUT,
+                     results_path=RESULTS_PATH, client=None, scheduler=None, cache_path=CACHE_PATH, deduplicate=True,
+                     manifest_path=MANIFEST_PATH, resume=None, pack_size=1, prefilter=None,
+                     priority=None, limit=None, prompts=None, escalate_to=None, escalate_band=BORDERLINE_BAND,
+                     cancel=None):
+    """
+    Drop-in replacement for utils.process_articles that screens articles concurrently.
+
+    Parameters:
+    uploaded_file - csv file containing article title and abstract.
+    max_in_flight - maximum number of concurrent API calls.
+    timeout - seconds allowed per article.
+    results_path - JSON Lines results store the screening results are appended to.
+    client - optional llm_backends backend (hosted, local or recorded) or AsyncOpenAI client.
+    scheduler - optional RateLimitScheduler; read its stats() afterwards for the retry counters.
+    cache_path - SQLite response cache shared between runs, None to always query the API.
+    deduplicate - screen one record per cluster of cross-source duplicates.
+    manifest_path - SQLite run manifest recording the state of every article, None to disable.
+    resume - run ID to resume, or "latest" for the last run of the same input and prompt;
+             articles already done in that run are skipped.
+    pack_size - articles screened per LLM call; entries missing from a packed reply are re-screened alone.
+    prefilter - None to send every article to the model, or "any"/"all" to exclude articles
+                matching none/not all of the required term categories with the local keyword pre-filter.
+    priority - optional .npy ranking of article indices (Notebooks/ranking.py); articles are
+               screened most relevant first and unranked articles are skipped.
+    limit - with priority, screen only the first limit ranked articles.
+    prompts - prompt version names (prompt_registry) to screen with in one pass, default prompt if None.
+              Each version writes to results_path_for(results_path, name) and is its own manifest run.
+    escalate_to - optional second backend (e.g. the hosted model after a bulk pass on a local one);
+                  articles whose score falls in escalate_band are re-screened with it, written to
+                  escalated_path(...) of their results store, and its decision replaces the first one.
+                  It shares the response cache only if it serves a different model from client.
+    cancel - optional threading.Event to stop the run from another thread (job_manager.py);
+             results so far are kept and resume="latest" picks up the rest.
+
+    Returns: list of (idx, response) tuples in the original row order (ranking order with priority);
+    with several prompts, a dict of prompt name -> such a list.
+    """
+    prompts = [get_prompt(prompt) for prompt in (prompts or [DEFAULT_PROMPT])]
+    client = as_backend(client if client is not None else make_async_client())
+    if priority is not None:
+        records = iter_articles_ranked(uploaded_file, np.load(priority), limit)
+    else:
+        records = iter_articles(uploaded_file)
+    cache = ResponseCache(cache_path) if cache_path else None
+    manifests = [RunManifest(manifest_path) if manifest_path else None for _ in prompts]
+    paths = [results_path_for(results_path, prompt) for prompt in prompts]
+    try:
+        fingerprint = fingerprint_file(uploaded_file) if manifest_path else None
+        for prompt, manifest, path in zip(prompts, manifests, paths):
+            if manifest is not None:
+                manifest.start(fingerprint, prompt_version(prompt, client.model), path, resume)
+        with ExitStack() as stack:
+            stores = [stack.enter_context(ResultsStore(path)) for path in paths]
+
+            async def screen():
+                try:
+                    results = await screen_prompt_versions(records, prompts, client=client,
+                                                           max_in_flight=max_in_flight, timeout=timeout,
+                                                           stores=stores, scheduler=scheduler, cache=cache,
+                                                           dedup_index=DeduplicationIndex() if deduplicate else None,
+                                                           manifests=manifests, pack_size=pack_size,
+                                                           prefilter=Prefilter(require=prefilter) if prefilter else None,
+                                                           cancel=cancel)
+                    if escalate_to is None or (cancel is not None and cancel.is_set()):
+                        return results
+                    # Second pass: only the borderline articles go to the escalation backend
+                    for prompt, path in zip(prompts, paths):
+                        ids = borderline_ids(results[prompt.name], prompt.weights, escalate_band)
+                        if not ids:
+                            continue
+                        print(f"Escalating {len(ids)} borderline article(s) of {prompt.name} to {escalate_to.name}")
+                        # Cache keys hold the model, not the backend: with the same model the first
+                        # pass's cached decisions would come straight back, so skip the cache then
+                        same_model = (escalate_to.model or prompt.model) == (client.model or prompt.model)
+                        escalated = await screen_articles((record for record in iter_articles(uploaded_file)
+                                                           if record["idx"] in ids),
+                                                          client=escalate_to, max_in_flight=max_in_flight,
+                                                          timeout=timeout,
+                                                          store=stack.enter_context(ResultsStore(escalated_path(path))),
+                                                          cache=None if same_model else cache, prompt=prompt,
+                                                          cancel=cancel,
+                                                          dedup_index=DeduplicationIndex() if deduplicate else None)
+                        escalated = dict(escalated)
+                        results[prompt.name] = [(idx, escalated.get(idx) or result)
+                                                for idx, result in results[prompt.name]]
+                    return results
+                finally:
+                    # Close the connection pools within this event loop; a backend reused by
+                    # a later run (the app's jobs) builds fresh ones on its next request
+                    await client.aclose()
+                    if escalate_to is not None:
+                        await escalate_to.aclose()
+
+            results = asyncio.run(screen())
+        for manifest in manifests:
+            if manifest is not None:
+                manifest.finish()
+        return results if len(prompts) > 1 else results[prompts[0].name]
+    finally:
+        if cache is not None:
+            cache.close()
+        for manifest in manifests:
+            if manifest is not None:
+                manifest.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Screen articles concurrently with an OpenAI-compatible model.")
+    parser.add_argument("csv_file", help="csv file with title and abstract columns")
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT, help="maximum concurrent API calls")
+    parser.add_argument("--timeout", type=float, default=ARTICLE_TIMEOUT, help="seconds allowed per API call")
+    parser.add_argument("--rpm", type=int, default=REQUESTS_PER_MINUTE, help="account requests-per-minute limit")
+    parser.add_argument("--tpm", type=int, default=TOKENS_PER_MINUTE, help="account tokens-per-minute limit")
+    parser.add_argument("--results", default=RESULTS_PATH, help="JSON Lines results store to append to")
+    parser.add_argument("--backend", default="openai", choices=("openai", "local", "recorded"),
+                        help="LLM backend: hosted OpenAI, a local OpenAI-compatible server or recorded responses")
+    parser.add_argument("--model", default=None, help="model to request instead of the prompt version's model")
+    parser.add_argument("--base-url", default=None, help="OpenAI-compatible endpoint, e.g. a local mock server")
+    parser.add_argument("--recording", default=RECORDING_PATH, help="recorded responses of the recorded backend")
+    parser.add_argument("--escalate-to", default=None, choices=("openai", "local", "recorded"),
+                        help="re-screen borderline articles with this backend after the bulk pass")
+    parser.add_argument("--escalate-model", default=None, help="model of the escalation backend")
+    parser.add_argument("--escalate-band", type=int, nargs=2, default=BORDERLINE_BAND, metavar=("LOW", "HIGH"),
+                        help="score range [LOW, HIGH) counted as borderline (default: %(default)s)")
+    parser.add_argument("--cache", default=CACHE_PATH, help="SQLite response cache shared between runs")
+    parser.add_argument("--no-cache", action="store_true", help="always query the API")
+    parser.add_argument("--no-dedup", action="store_true", help="screen every record, including duplicates")
+    parser.add_argument("--pack", type=int, nargs="?", const=PACK_SIZE, default=1, metavar="N",
+                        help=f"screen up to N articles per call (default N: {PACK_SIZE})")
+    parser.add_argument("--prefilter", nargs="?", const="any", default=None, choices=("any", "all"),
+                        help="skip the model for articles matching none (any, the default) or not all (all) "
+                             "of the required terms")
+    parser.add_argument("--priority", default=None, metavar="RANKING_NPY",
+                        help="screen articles in the order of a relevance ranking (Notebooks/ranking.py)")
+    parser.add_argument("--limit", type=int, default=None, help="with --priority, stop after the top N articles")
+    parser.add_argument("--prompt", nargs="+", default=[DEFAULT_PROMPT], choices=sorted(PROMPTS), metavar="NAME",
+                        help=f"prompt version(s) from prompt_registry, screened side by side ({', '.join(PROMPTS)})")
+    parser.add_argument("--manifest", default=MANIFEST_PATH, help="SQLite run manifest")
+    parser.add_argument("--resume", nargs="?", const="latest", default=None, metavar="RUN_ID",
+                        help="resume a run (default: the latest run of this input and prompt)")
+    args = parser.parse_args()
+
+    process_articles(args.csv_file, max_in_flight=args.max_in_flight, timeout=args.timeout,
+                     results_path=args.results,
+                     client=make_backend(args.backend, args.model, args.base_url, args.recording),
+                     scheduler=RateLimitScheduler(requests_per_minute=args.rpm, tokens_per_minute=args.tpm),
+                     cache_path=None if args.no_cache else args.cache, deduplicate=not args.no_dedup,
+                     manifest_path=args.manifest, resume=args.resume, pack_size=args.pack,
+                     prefilter=args.prefilter, priority=args.priority, limit=args.limit, prompts=args.prompt,
+                     escalate_to=make_backend(args.escalate_to, args.escalate_model) if args.escalate_to else None,
+                     escalate_band=tuple(args.escalate_band))
@@ -2,22 +2,38 @@
 
 # Load the right libraries and set up openai API key
 import os
-import json
-import pandas as pd
-from openai import OpenAI
-from dotenv import load_dotenv
+
+from scoring import SCORE_WEIGHTS, TRUE_VALUES
+from results_store import ResultsStore, import_json_files, RESULTS_PATH
+from response_schema import get_validator, request_options, reply_text, parse_reply, repair_messages, REPAIR_MAX_TOKENS
+# Prompt texts and model settings live in the prompt registry; MODEL etc. are re-exported for existing imports
+from prompt_registry import get_prompt, MODEL, TEMPERATURE, SYSTEM_MESSAGE
 
 # Disable parallelism warnings
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
-# Load API Key
-load_dotenv()
-#api_KEY = os.getenv('OPENAI_API_KEY') - Personal access key
-
-api_KEY = os.getenv('openaiuob_api_key') # API key via UoB organisation
+# OpenAI client, created on first use by get_client() so importing utils needs no key or network.
+# pandas and openai are imported inside the functions that use them, which keeps importing
+# utils (and every command line tool built on it) fast.
+# Assign any OpenAI-compatible client here (e.g. pointed at a local server) to redirect the serial path;
+# the concurrent engine takes a backend per run instead (llm_backends.py).
+client = None
+# Environment variable holding the API key get_client() uses (set from .env if present)
+API_KEY_ENV = 'openaiuob_api_key'  # API key via UoB organisation; 'OPENAI_API_KEY' for a personal access key
+
+
+def get_client():
+    """Shared synchronous client; its keep-alive connection pool is reused by every query."""
+    global client
+    if client is None:
+        from openai import OpenAI
+        from dotenv import load_dotenv
+        # Load API Key
+        load_dotenv()
+        api_KEY = os.getenv(API_KEY_ENV)
+        client = OpenAI(api_key=api_KEY)
+    return client
 
-# Set up OpenAI client
-client = OpenAI(api_key=api_KEY)
 
 def test_utils(a):
     return (a) # Test running the script
@@ -33,197 +49,148 @@ def clean_abstract(abstract):
     Returns: N/A for missing abstract
     Final output is: abstract
     """
+    import pandas as pd
     if pd.isna(abstract) or abstract.strip() == "":
         return "N/A"
     return abstract
 
 
 
-def construct_prompt(title, abstract):
+def get_csv_file():
+    """Prompt the user for the CSV file path."""
+    file_path = input("Enter the path to the CSV file: ").strip()
+    while not os.path.exists(file_path):
+        print("File not found. Please enter a valid file path.")
+        file_path = input("Enter the path to the CSV file: ").strip()
+    return file_path
+
+
+def construct_prompt(title, abstract, prompt=None):
     """Create a structured prompt for OpenAI API based on title and abstract.
 
     Parameters:
-    user_instructions - user supplied set of instructions.
-
     title - article title.
     abstract - article abstract.
+    prompt - prompt version name in prompt_registry (or a PromptVersion), default prompt if None.
 
     Returns a formated prompt to be passed to GPT query func.
     """
-    return f"""
-    You are a researcher rigorously screening titles and abstracts of scientific papers for inclusion and exclusion in a review paper.
-Extract key terms from the following title and abstract and provide analysis in the specified JSON format.
-
-Terms to extract:
-1. Adulthood body mass index OR BMI OR adiposity
-2. Mendelian randomisation (including alternate spelling "Mendelian randomization")
-3. Blood pressure terms: hypertension, high blood pressure, systolic blood pressure, diastolic blood pressure (note: multiple blood pressure terms count as just one match for category #3)
-4. European ancestry terms such as European OR white OR caucasian population/ancestry OR mentions European country
-5. Review terms such as umbrella review OR scoping review OR systematic review
-
-
-For each term category, extract the EXACT phrasing as it appears in the document.
-
-IMPORTANT RULES:
-- For category #4, terms like "nonwhite," "non-white," "non-European," or similar negations should NOT be counted as matches for European/white/caucasian ancestry/mentions European country.
-- Only count exact matches and do not include negated terms (terms with "non-" prefix or similar negations).
-- For country names, first extract ALL country names mentioned, then identify which ones are European countries
-- If no relevant terms are found, state "No European ancestry or country terms found"
-- For each match, provide the exact quote with minimal surrounding context
-- CHECK ancestry is European
-- Extract only information related to adult body mass index (BMI), obesity in adults, or adiposity measurements in adult populations. DO NOT include any findings related to childhood obesity or BMI in subjects under 18 years of age.
-- For BMI/adiposity terms: Check if BMI is being studied as an exposure/predictor of blood pressure, NOT just as a covariate or mediator or outcome.
-- For Blood pressure terms: Check if Blood pressure term is studied as an outcome, NOT an exposure or covariate. 
-- MUST EXCLUDE any PREGNANCY RELATED  terms.
-- CHECK blood pressure term is Main outcome
-- Mendelian randomisation MUST be the method used to study the causal relationship
-- Check Main method in use is Mendelian randomisation
-
-
-Title: "{title}"
-Abstract: "{abstract}"
-
-Output MUST strictly follow this JSON structure:
-{{
-  "document_info": {{
-    "title": "{title}",
-    "abstract_preview": "{abstract[:50]}..."
-  }},
-  "term_analysis": {{
-    "bmi_adiposity": {{
-      "present": true/false,
-      "locations": ["title", "abstract"],
-      "variations_found": ["exact phrases as they appear in the text"],
-      "is_main_exposure": true/false
-    }},
-    "mendelian_randomisation": {{
-      "present": true/false,
-      "locations": ["title", "abstract"],
-      "variations_found": ["exact phrases as they appear in the text"],
-      "is_main_method": true/false
-    }},
-    "blood_pressure": {{
-      "present": true/false,
-      "locations": ["title", "abstract"],
-      "variations_found": ["exact phrases as they appear in the text"],
-      "is_main_outcome": true/false
-      
-    }},
-    "european_ancestry": {{
-      "present": true/false,
-      "locations": ["title", "abstract"],
-      "variations_found": ["exact phrases as they appear in the text"],
-      "is_ancestry_European": true/false
-    }},
-    "reviews": {{
-      "present": true/false,
-      "locations": ["title", "abstract"],
-      "variations_found": ["exact phrases as they appear in the text"]
-    }}
-  }},
-  "Reason": {{
-    "justify": "Brief string of all the EXACT terms present in the title and abstract AND record those that are missing."
-  }}
-}}
-
-Respond **ONLY** with the JSON output and nothing else.
-
-"""
-
-
-def query_openai(prompt):
+    return get_prompt(prompt).render(title, abstract)
+
+
+def query_openai(prompt, version=None):
     """
     Query OpenAI API and return a structured JSON response.
     
     Parameter:
     Prompt - a structured, precise and clear question with the json output format to pass to LLM.
+    version - prompt version the prompt was rendered with; sets the model settings and the
+              response schema the reply is constrained to. Default prompt if None.
     Return:
-    A json output to be written out by another function.
+    A json output to be written out by another function, or None if it could not be validated.
     """
+    version = get_prompt(version)
+    validator = get_validator(version.schema)
     try:
-        response = client.chat.completions.create(
-            model="gpt-4-turbo",
+        response = get_client().chat.completions.create(
+            model=version.model,
             messages=[
-                {"role": "system", "content": "You are an expert in biomedical text analysis. Return valid JSON ONLY."},
+                {"role": "system", "content": version.system_message},
                 {"role": "user", "content": prompt}
             ],
-            temperature=0.2
+            temperature=version.temperature,
+            **request_options(version.schema, version.model)
         )
 
-        response_text = response.choices[0].message.content.strip()
+        response_text = reply_text(response.choices[0].message).strip()
         
         # Debugging: print response for inspection
         print(f"DEBUG: OpenAI Response:\n{response_text}")
 
-        # Ensure the response is valid JSON
-        return json.loads(response_text)
-    
-    except json.JSONDecodeError:
-        print("ERROR: OpenAI returned invalid JSON. Skipping this article.")
-        return None
+        data = parse_reply(response_text)
+        errors = validator.check(data)
+        if not errors:
+            return data
+        if not isinstance(data, dict):
+            print("ERROR: OpenAI returned invalid JSON. Skipping this article.")
+            return None
+
+        # Ask again for the malformed fields only
+        print(f"WARNING: Repairing malformed fields {[path for path, _ in errors]}")
+        repair = get_client().chat.completions.create(
+            model=version.model,
+            messages=repair_messages(prompt, data, errors, validator),
+            temperature=0,
+            max_tokens=REPAIR_MAX_TOKENS,
+            response_format={"type": "json_object"}
+        )
+        errors = validator.repaired(data, parse_reply(reply_text(repair.choices[0].message)))
+        if errors:
+            print(f"ERROR: Fields still malformed after repair {errors}. Skipping this article.")
+            return None
+        return data
+
     except Exception as e:
         print(f"ERROR: Failed to query OpenAI - {e}")
         return None
 
-
-def process_articles(uploaded_file):
+def process_articles(uploaded_file, prompt=None, results_path=RESULTS_PATH):
     """
-    Process the csv file with title and abstract, query using GPT and return a structured json format for each article.
+    Process the csv file with title and abstract, query using GPT and store a structured json result for each article.
     Parameter:
     uploaded_file - csv file containing article title and abstract.
+    prompt - prompt version name in prompt_registry, default prompt if None.
+    results_path - JSON Lines results store; results of other prompt versions go to
+                   screening_engine.results_path_for(results_path, prompt), as in the concurrent engine.
     Return:
-    Json file - json file for each article.
-    
+    Path of the results store the articles were appended to.
+
     """
-    
-    df = pd.read_csv(uploaded_file) # read in the article
-    for idx, row in df.iterrows():
-        title = row["title"]
-        abstract = clean_abstract(row.get("abstract", ""))  # Check validity of the article
 
-        prompt = construct_prompt(title, abstract)
-        response_data = query_openai(prompt)
+    import pandas as pd
+    from screening_engine import results_path_for
+    version = get_prompt(prompt)
+    store_path = results_path_for(results_path, version)
+    df = pd.read_csv(uploaded_file) # read in the article
+    with ResultsStore(store_path) as store:
+        for idx, row in df.iterrows():
+            title = row["title"]
+            abstract = clean_abstract(row.get("abstract", ""))  # Check validity of the article
 
-        if response_data is None:
-            print(f"Skipping article {idx} due to invalid OpenAI response.")
-            continue  # Skip this iteration if response is invalid
+            article_prompt = version.render(title, abstract)
+            response_data = query_openai(article_prompt, version)
 
-        output_filename = f"article_{idx}.json"
-        with open(output_filename, "w") as json_file:
-            json.dump(response_data, json_file, indent=4)
+            if response_data is None:
+                print(f"Skipping article {idx} due to invalid OpenAI response.")
+                continue  # Skip this iteration if response is invalid
 
-        print(f"Processed {title} -> {output_filename}")
+            store.append(idx, response_data)
+            print(f"Processed {title} -> article {idx} in {store_path}")
+    return store_path
 
 
 
-# Processing the json files, aiming to write out the content to a single csv file to be processed later using pandas
-def process_json_files(directory,full_output_file, table_keyword="article"):
+# Processing the stored results, aiming to write out the content to a single csv file to be processed later using pandas
+def process_json_files(directory,full_output_file, table_keyword="article", results_path=RESULTS_PATH, prompt=None):
     """
-    Processes JSON files in a directory, filters them by a keyword in their filename,
-    extracts and normalizes their contents, writes full CSVs.
+    Writes the screening results stored in a directory to a full CSV.
+    Legacy per-article JSON files (e.g. article_0.json) are imported into an empty store first.
 
     Parameters:
-        directory (str): Path to the directory containing JSON files.
+        directory (str): Path to the directory containing the results store.
         full_output_file (str): User supplied named extracted from the app input.
-        table_keyword (str): Keyword to filter relevant JSON filenames.
+        table_keyword (str): Filename prefix of legacy JSON files to import.
+        results_path (str): Results store file name within the directory.
+        prompt (str): Prompt version the results were screened with, default prompt if None.
     """
     if not full_output_file.endswith(".csv"):
         full_output_file += ".csv"
-    
-    json_data = []
-    # Load JSON files
-    for filename in os.listdir(directory):
-        if table_keyword in filename and filename.endswith('.json'):
-            file_path = os.path.join(directory, filename)
-            with open(file_path, 'r') as file:
-                data = json.load(file)
-                if isinstance(data, dict):
-                    json_data.append(data)
-                elif isinstance(data, list):
-                    json_data.extend(data)
-
-    # Normalize to DataFrame
-    df = pd.json_normalize(json_data)
+
+    from screening_engine import results_path_for
+    with ResultsStore(results_path_for(os.path.join(directory, results_path), prompt)) as store:
+        if not len(store):
+            import_json_files(directory, store, table_keyword)
+        df = store.load()
 
     # Save full DataFrame
     df.to_csv(full_output_file, index=False)
@@ -233,17 +200,5 @@ def process_json_files(directory,full_output_file, table_keyword="article"):
 
 # A overall score to determine the relevance of each article
 def scorecard_modified(row):
-        return( int(row["term_analysis.bmi_adiposity.present"]*2)+
-            int(row["term_analysis.bmi_adiposity.is_main_exposure"]*10)+
-            int(row["term_analysis.blood_pressure.present"]*2)+
-            int(row["term_analysis.blood_pressure.is_main_outcome"]*10)+
-            int(row["term_analysis.mendelian_randomisation.present"]*2)+
-            #int(row["term_analysis.mendelian_randomisation.is_main_method"]*2)+
-            int(row["term_analysis.european_ancestry.present"]*2)
-            #int(row["term_analysis.european_ancestry.is_ancestry_European"]*5)
-        )
-
-
-
-
-
+    """Score a single result row; scoring.score does the same for a whole DataFrame at once."""
+    return sum(weight * (row.get(column) in TRUE_VALUES) for column, weight in SCORE_WEIGHTS.items())
@@ -0,0 +1,5 @@
+# The pipeline modules are flat scripts in Scripts/, imported the way the command line tools import them
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Scripts"))
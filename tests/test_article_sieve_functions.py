@@ -0,0 +1,15 @@
+# ArticleSieve_functions.evaluate: which columns are scored as models.
+import pandas as pd
+
+from ArticleSieve_functions import evaluate
+
+
+def test_only_decision_columns_are_scored_by_default():
+    df = pd.DataFrame({"title": ["a", "b", "c"], "abstract": ["x", "y", "z"],
+                       "Human": ["Included", "Excluded", "Included"],
+                       "zero_shot": ["Included", "Excluded", None],
+                       "DOI": ["10.1/a", "10.1/b", "10.1/c"], "year": [2020, 2021, 2022], "notes": [None] * 3})
+    table = evaluate(df, n_boot=0)
+    assert table.index.tolist() == ["zero_shot"]
+    assert table.loc["zero_shot", ["tp", "fn", "tn", "missing"]].tolist() == [1, 1, 1, 1]
+    assert evaluate(df, model_cols=["zero_shot"], n_boot=0).index.tolist() == ["zero_shot"]
@@ -0,0 +1,227 @@
+# batch_mode against a stubbed Batch API: collect_batch on canned output and error files and the
+# final states a batch can end in, and run_batch_screen end to end against a local stub server.
+import json
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from types import SimpleNamespace
+
+import pytest
+
+from batch_mode import write_batch_files, collect_batch, run_batch_screen, make_client
+from prompt_registry import get_prompt
+from response_schema import get_validator
+from results_store import ResultsStore
+
+TERM = {"present": True, "locations": ["title"], "variations_found": ["x"]}
+GOOD = {"document_info": {"title": "t", "abstract_preview": "a"},
+        "term_analysis": {"bmi_adiposity": {**TERM, "is_main_exposure": True},
+                          "blood_pressure": {**TERM, "is_main_outcome": True},
+                          "mendelian_randomisation": {**TERM, "is_main_method": True},
+                          "european_ancestry": {**TERM, "is_ancestry_European": True},
+                          "reviews": {"present": False, "locations": [], "variations_found": []}},
+        "Reason": {"justify": "x"}}
+
+
+class StubFiles:
+    """files.content(file_id).iter_lines() of the Batch API over canned JSON Lines files."""
+
+    def __init__(self, files):
+        self.files = files
+
+    def content(self, file_id):
+        return SimpleNamespace(iter_lines=lambda: iter(self.files[file_id]))
+
+
+def reply(custom_id, content, status_code=200):
+    body = {"choices": [{"index": 0, "message": {"role": "assistant", "content": content}}]}
+    return json.dumps({"custom_id": custom_id, "response": {"status_code": status_code, "body": body}, "error": None})
+
+
+def error_line(custom_id):
+    return json.dumps({"custom_id": custom_id, "response": None,
+                       "error": {"code": "server_error", "message": "failed"}})
+
+
+@pytest.fixture
+def request_path(tmp_path):
+    records = [{"idx": idx, "title": f"Title {idx}", "abstract": f"Abstract {idx}"} for idx in range(5)]
+    paths = write_batch_files(records, tmp_path / "batches")
+    assert len(paths) == 1
+    return paths[0]
+
+
+def collect(tmp_path, request_path, status, output=None, errors=None, prompt=None):
+    files = {"out": output or [], "err": errors or []}
+    client = SimpleNamespace(files=StubFiles(files))
+    batch = SimpleNamespace(id="batch_1", status=status, output_file_id="out" if output else None,
+                            error_file_id="err" if errors else None)
+    with ResultsStore(str(tmp_path / "results.jsonl")) as store:
+        failed = collect_batch(client, batch, store, request_path, prompt=prompt)
+        return sorted(failed), store.completed_ids()
+
+
+def test_canned_reply_is_valid():
+    assert get_validator(get_prompt().schema).check(json.loads(json.dumps(GOOD))) == []
+
+
+def test_completed_batch_sorts_replies_and_errors(tmp_path, request_path):
+    output = [reply("article-0", json.dumps(GOOD)),
+              reply("article-1", json.dumps(GOOD), status_code=500),
+              reply("article-2", "not json"),
+              reply("article-4", json.dumps(GOOD))]
+    failed, stored = collect(tmp_path, request_path, "completed", output, [error_line("article-3")])
+    assert failed == [1, 2, 3]
+    assert set(stored) == {0, 4}
+
+
+@pytest.mark.parametrize("status", ["failed", "expired", "cancelled"])
+def test_unfinished_batch_fails_every_unanswered_request(tmp_path, request_path, status):
+    failed, stored = collect(tmp_path, request_path, status, [reply("article-0", json.dumps(GOOD))])
+    assert failed == [1, 2, 3, 4]
+    assert set(stored) == {0}
+
+
+def test_batch_without_any_file_fails_everything(tmp_path, request_path):
+    failed, stored = collect(tmp_path, request_path, "failed")
+    assert failed == [0, 1, 2, 3, 4]
+    assert not stored
+
+
+def test_prompt_version_is_used_for_requests(tmp_path):
+    version = get_prompt("aim_extraction")
+    paths = write_batch_files([{"idx": 0, "title": "T", "abstract": "A"}], tmp_path / "batches", prompt=version.name)
+    with open(paths[0]) as f:
+        body = json.loads(f.readline())["body"]
+    assert body["messages"][0]["content"] == version.system_message
+    assert body["messages"][1]["content"] == version.render("T", "A")
+
+
+class BatchStubServer(ThreadingHTTPServer):
+    """
+    Local stub of the files and batches endpoints. Each created batch reports in_progress on
+    its first poll and then ends in the next state of final_states; an expired batch has
+    answered only its first half of requests.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, final_states):
+        super().__init__(("127.0.0.1", 0), BatchStubHandler)
+        self.final_states = list(final_states)
+        self.files = {}
+        self.batches = {}
+        self.polls = {}
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def add_file(self, content, purpose):
+        file_id = f"file-{len(self.files)}"
+        self.files[file_id] = content
+        return {"id": file_id, "object": "file", "bytes": len(content), "created_at": 0,
+                "filename": f"{file_id}.jsonl", "purpose": purpose, "status": "processed"}
+
+    def finish(self, batch):
+        """Write the output and error files of a batch reaching its final state."""
+        requests = [json.loads(line) for line in self.files[batch["input_file_id"]].splitlines() if line.strip()]
+        if batch["status"] == "expired":
+            requests = requests[:len(requests) // 2]
+        output, errors = [], []
+        for request in requests:
+            idx = int(request["custom_id"].split("-")[1])
+            if idx % 4 == 1:
+                output.append(reply(request["custom_id"], json.dumps(GOOD), status_code=500))
+            elif idx % 4 == 3 and batch["status"] == "completed":
+                errors.append(error_line(request["custom_id"]))
+            else:
+                output.append(reply(request["custom_id"], json.dumps(GOOD)))
+        if output:
+            batch["output_file_id"] = self.add_file("\n".join(output).encode() + b"\n", "batch_output")["id"]
+        if errors:
+            batch["error_file_id"] = self.add_file("\n".join(errors).encode() + b"\n", "batch_output")["id"]
+        batch["request_counts"] = {"total": len(requests), "completed": len(output), "failed": len(errors)}
+
+
+class BatchStubHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, body, content_type="application/json"):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.path.endswith("/files"):
+            # multipart/form-data upload of the request file
+            form = BytesParser(policy=HTTP).parsebytes(
+                f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body)
+            parts = {part.get_param("name", header="content-disposition"): part.get_payload(decode=True)
+                     for part in form.iter_parts()}
+            return self.send_body(server.add_file(parts["file"], parts["purpose"].decode()))
+        request = json.loads(body)
+        batch_id = f"batch-{len(server.batches)}"
+        server.batches[batch_id] = {"id": batch_id, "object": "batch", "endpoint": request["endpoint"],
+                                    "input_file_id": request["input_file_id"],
+                                    "completion_window": request["completion_window"], "status": "validating",
+                                    "created_at": 0, "request_counts": None,
+                                    "final": server.final_states[len(server.batches) % len(server.final_states)]}
+        server.polls[batch_id] = 0
+        self.send_body({key: value for key, value in server.batches[batch_id].items() if key != "final"})
+
+    def do_GET(self):
+        server = self.server
+        parts = self.path.split("/")
+        if parts[-1] == "content":
+            return self.send_body(server.files[parts[-2]], "application/octet-stream")
+        batch = server.batches[parts[-1]]
+        server.polls[batch["id"]] += 1
+        if server.polls[batch["id"]] == 1:
+            batch["status"] = "in_progress"
+        elif batch["status"] == "in_progress":
+            batch["status"] = batch["final"]
+            server.finish(batch)
+        self.send_body({key: value for key, value in batch.items() if key != "final"})
+
+
+@pytest.fixture
+def export(tmp_path):
+    path = tmp_path / "export.csv"
+    path.write_text("title,abstract\n" + "".join(f"Title {n},Abstract {n}\n" for n in range(8)))
+    return str(path)
+
+
+@pytest.mark.parametrize("final_state, expected_failed, expected_stored", [
+    ("completed", [1, 3, 5, 7], {0, 2, 4, 6}),
+    ("expired", [1, 4, 5, 6, 7], {0, 2, 3}),
+])
+def test_run_batch_screen_against_stub(tmp_path, export, final_state, expected_failed, expected_stored):
+    server = BatchStubServer([final_state])
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        results_path = str(tmp_path / "results.jsonl")
+        failed = run_batch_screen(export, batch_dir=str(tmp_path / "batches"), results_path=results_path,
+                                  cache_path=None, deduplicate=False, poll_interval=0,
+                                  client=make_client(api_key="test", base_url=server.base_url))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert failed == expected_failed
+    with ResultsStore(results_path, readonly=True) as store:
+        assert set(store.completed_ids()) == expected_stored
+    # Polled through in_progress to the final state, and the batch state records the outcome
+    assert list(server.polls.values()) == [2]
+    with open(tmp_path / "batches" / "batch_state.json") as f:
+        state = json.load(f)
+    assert state["batches"][0]["collected"] and sorted(state["batches"][0]["failed"]) == expected_failed
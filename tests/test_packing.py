@@ -0,0 +1,16 @@
+# packing.pack_records sizes packs with the preamble of the prompt version they are rendered with.
+from packing import pack_records, construct_packed_prompt, OUTPUT_TOKENS_PER_ARTICLE
+from prompt_registry import PromptVersion, get_prompt
+from rate_limiter import estimate_tokens
+
+RECORDS = [{"idx": idx, "title": f"Title {idx}", "abstract": "word " * 200} for idx in range(8)]
+
+
+def test_packs_are_sized_with_the_prompt_version():
+    default = get_prompt()
+    longer = PromptVersion("long_test", default.instructions * 3, default.term_schema, default.schema)
+    # Room for all eight articles under the default preamble, but not under the longer one
+    window = estimate_tokens(construct_packed_prompt(RECORDS), default.model) + 8 * OUTPUT_TOKENS_PER_ARTICLE + 200
+    assert [len(pack) for pack in pack_records(RECORDS, context_window=window)] == [8]
+    packs = list(pack_records(RECORDS, context_window=window, prompt=longer))
+    assert len(packs) > 1 and sum(len(pack) for pack in packs) == len(RECORDS)
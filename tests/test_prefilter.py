@@ -0,0 +1,39 @@
+# prefilter.Prefilter: the chunked screen_stream must make the same decisions as screen() record by record,
+# and excluded records are stored in the response schema of the prompt version.
+import pytest
+
+from prefilter import Prefilter
+from response_schema import SCHEMAS, get_validator
+
+RECORDS = [
+    {"idx": 0, "title": "Mendelian randomisation of BMI and blood pressure", "abstract": "UK Biobank"},
+    {"idx": 1, "title": "Body-mass index and hypertension", "abstract": "An observational cohort."},
+    {"idx": 2, "title": "Statins after stroke", "abstract": None},
+    {"idx": 3, "title": "Genetically predicted adiposity", "abstract": "Systolic\x1eand diastolic pressure"},
+    {"idx": 4, "title": "Vitamin D and sleep", "abstract": "A non-European sample."},
+]
+
+
+def test_default_excludes_records_matching_no_required_category():
+    prefilter = Prefilter()
+    assert [prefilter.screen(record) is not None for record in RECORDS] == [False, False, True, False, True]
+
+
+@pytest.mark.parametrize("require", ["any", "all"])
+@pytest.mark.parametrize("chunk_size", [1, 2, 1000])
+def test_screen_stream_matches_screen(require, chunk_size):
+    single, stream = Prefilter(require=require), Prefilter(require=require)
+    expected = [single.screen(record) for record in RECORDS]
+    screened = [stream.build_result(record, found) if found is not None else None
+                for record, found in stream.screen_stream(RECORDS, chunk_size)]
+    assert screened == expected
+    assert stream.report() == single.report()
+
+
+@pytest.mark.parametrize("schema", sorted(SCHEMAS))
+def test_excluded_result_matches_the_schema(schema):
+    result = Prefilter().screen(RECORDS[2], schema)
+    assert result["prefilter"] is True
+    assert get_validator(schema).check(result) == []
+    if "inclusion_decision" in result["Reason"]:
+        assert result["Reason"]["inclusion_decision"] == "EXCLUDE"
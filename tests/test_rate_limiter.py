@@ -0,0 +1,41 @@
+# rate_limiter: buckets reused across event loops, and Retry-After headers in every form a server sends.
+import asyncio
+import time
+from email.utils import formatdate
+from types import SimpleNamespace
+
+import pytest
+
+from rate_limiter import TokenBucket, retry_after_seconds
+
+
+def test_bucket_is_reused_across_event_loops():
+    bucket = TokenBucket(60000, capacity=2)
+
+    async def contend():
+        # More waiters than tokens, so the lock is contended and bound to this loop
+        await asyncio.gather(*(bucket.acquire(1) for _ in range(4)))
+
+    asyncio.run(contend())
+    asyncio.run(contend())
+
+
+def error_with(headers):
+    return SimpleNamespace(response=SimpleNamespace(headers=headers))
+
+
+@pytest.mark.parametrize("headers, expected", [
+    ({"retry-after-ms": "250"}, 0.25),
+    ({"retry-after": "3"}, 3.0),
+    ({"retry-after": "soon"}, None),
+    ({"retry-after": "Wed, 99 Foo 2024 25:61:00 GMT"}, None),
+    ({}, None),
+])
+def test_retry_after_forms(headers, expected):
+    assert retry_after_seconds(error_with(headers)) == expected
+
+
+def test_retry_after_http_date_is_read_as_utc():
+    # "-0000" makes parsedate_to_datetime return a naive datetime
+    value = formatdate(time.time() + 30, usegmt=False).rsplit(" ", 1)[0] + " -0000"
+    assert 25 <= retry_after_seconds(error_with({"retry-after": value})) <= 31
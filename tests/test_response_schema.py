@@ -0,0 +1,38 @@
+# response_schema validators: counters per validator, and harmless enum variants coerced locally.
+import copy
+
+from response_schema import get_validator, NOTES_SCHEMA
+from test_batch_mode import GOOD
+
+
+def test_validators_count_their_own_replies():
+    first, second = get_validator(), get_validator()
+    assert first.check(copy.deepcopy(GOOD)) == []
+    assert first.counters["valid"] == 1 and second.counters["valid"] == 0
+
+
+def test_location_variants_are_coerced():
+    validator = get_validator()
+    data = copy.deepcopy(GOOD)
+    data["term_analysis"]["bmi_adiposity"]["locations"] = [" Title ", "ABSTRACT"]
+    data["term_analysis"]["blood_pressure"]["locations"] = ["Title and Abstract", "title"]
+    assert validator.check(data) == []
+    assert data["term_analysis"]["bmi_adiposity"]["locations"] == ["title", "abstract"]
+    assert data["term_analysis"]["blood_pressure"]["locations"] == ["title", "abstract"]
+    assert validator.counters["coerced"] == 1
+
+
+def test_unknown_location_is_left_for_repair():
+    data = copy.deepcopy(GOOD)
+    data["term_analysis"]["reviews"]["locations"] = ["methods"]
+    assert get_validator().check(data) == [("term_analysis.reviews.locations[]", "enum")]
+
+
+def test_scalar_enum_case_is_coerced():
+    term = {"present": False, "locations": [], "variations_found": [], "notes": ""}
+    data = {"document_info": GOOD["document_info"],
+            "term_analysis": {name: dict(term) for name in ("bmi_adiposity", "mendelian_randomisation",
+                                                            "blood_pressure", "european_ancestry", "reviews")},
+            "Reason": {"justify": "x", "inclusion_decision": "exclude ", "reasoning": "x"}}
+    assert get_validator(NOTES_SCHEMA).check(data) == []
+    assert data["Reason"]["inclusion_decision"] == "EXCLUDE"
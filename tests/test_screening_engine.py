@@ -0,0 +1,234 @@
+# screening_engine.process_articles against a local stub of the chat completions endpoint:
+# bounded concurrency, retries after 429 and 5xx replies, and results in input order.
+import re
+import json
+import time
+import random
+import asyncio
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from llm_backends import OpenAIBackend
+from prompt_registry import PromptVersion
+from rate_limiter import RateLimitScheduler
+import screening_engine
+from screening_engine import process_articles
+from results_store import ResultsStore
+
+ARTICLES = 30
+MAX_IN_FLIGHT = 4
+TERM = {"present": True, "locations": ["title"], "variations_found": ["x"]}
+
+
+def screening_reply(title):
+    return {"document_info": {"title": title, "abstract_preview": "a"},
+            "term_analysis": {"bmi_adiposity": {**TERM, "is_main_exposure": True},
+                              "blood_pressure": {**TERM, "is_main_outcome": True},
+                              "mendelian_randomisation": {**TERM, "is_main_method": True},
+                              "european_ancestry": {**TERM, "is_ancestry_European": True},
+                              "reviews": {"present": False, "locations": [], "variations_found": []}},
+            "Reason": {"justify": "stub"}}
+
+
+class StubServer(ThreadingHTTPServer):
+    """Chat completions stub: article n % 5 == 1 is throttled (429) once, n % 5 == 2 gets a 500 once."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.peak = 0
+        self.attempts = {}
+        self.rng = random.Random(0)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status, data, headers=()):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        title = re.search(r"Stub article \d+", request["messages"][-1]["content"]).group(0)
+        number = int(title.rsplit(" ", 1)[1])
+        with server.lock:
+            server.in_flight += 1
+            server.peak = max(server.peak, server.in_flight)
+            attempt = server.attempts[title] = server.attempts.get(title, 0) + 1
+            delay = server.rng.uniform(0.01, 0.05)  # replies arrive out of order
+        try:
+            time.sleep(delay)
+            if attempt == 1 and number % 5 == 1:
+                return self.send_json(429, {"error": {"message": "slow down", "type": "rate_limit_error"}},
+                                      [("retry-after-ms", "10")])
+            if attempt == 1 and number % 5 == 2:
+                return self.send_json(500, {"error": {"message": "boom", "type": "server_error"}})
+            text = json.dumps(screening_reply(title))
+            message = {"role": "assistant", "content": text}
+            if "tools" in request:
+                message = {"role": "assistant", "content": None, "tool_calls": [
+                    {"id": "call", "type": "function",
+                     "function": {"name": request["tools"][0]["function"]["name"], "arguments": text}}]}
+            self.send_json(200, {"id": "stub", "object": "chat.completion", "created": 0, "model": request["model"],
+                                 "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+                                 "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}})
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+
+@pytest.fixture
+def stub():
+    server = StubServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def export(tmp_path):
+    path = tmp_path / "export.csv"
+    with open(path, "w") as f:
+        f.write("title,abstract\n")
+        for n in range(ARTICLES):
+            f.write(f"Stub article {n},Abstract of article {n}\n")
+    return str(path)
+
+
+def test_process_articles_against_stub(stub, export, tmp_path):
+    # Limits high enough that only the stub's 429s throttle the run
+    scheduler = RateLimitScheduler(requests_per_minute=100000, tokens_per_minute=10 ** 8,
+                                   base_delay=0.01, max_delay=0.05)
+    backend = OpenAIBackend(api_key="test", base_url=stub.base_url)
+    results_path = str(tmp_path / "results.jsonl")
+    results = process_articles(export, max_in_flight=MAX_IN_FLIGHT, timeout=10, results_path=results_path,
+                               client=backend, scheduler=scheduler, cache_path=None, deduplicate=False,
+                               manifest_path=None)
+
+    # Bounded concurrency: never more calls in flight than workers, and the workers do overlap
+    assert 1 < stub.peak <= MAX_IN_FLIGHT
+    # Every throttled or failed article was retried once and then succeeded
+    stats = scheduler.stats()
+    assert stats["throttled"] == ARTICLES // 5
+    assert stats["retried"] == 2 * ARTICLES // 5
+    assert stats["failed"] == 0
+    assert all(stub.attempts[f"Stub article {n}"] == (2 if n % 5 in (1, 2) else 1) for n in range(ARTICLES))
+    # Results come back in input order, each matched to its own article
+    assert [idx for idx, _ in results] == list(range(ARTICLES))
+    assert all(result["document_info"]["title"] == f"Stub article {idx}" for idx, result in results)
+    with ResultsStore(results_path, readonly=True) as store:
+        assert len(store) == ARTICLES
+
+
+def test_prefiltered_articles_skip_the_model(stub, tmp_path):
+    # Odd articles mention none of the required terms, so the default pre-filter stores their exclusion
+    path = tmp_path / "export.csv"
+    with open(path, "w") as f:
+        f.write("title,abstract\n")
+        for n in range(ARTICLES):
+            f.write(f"Stub article {n},{'Mendelian randomisation of BMI' if n % 2 == 0 else 'Statins'}\n")
+    scheduler = RateLimitScheduler(requests_per_minute=100000, tokens_per_minute=10 ** 8,
+                                   base_delay=0.01, max_delay=0.05)
+    backend = OpenAIBackend(api_key="test", base_url=stub.base_url)
+    results = process_articles(str(path), max_in_flight=MAX_IN_FLIGHT, timeout=10,
+                               results_path=str(tmp_path / "results.jsonl"), client=backend, scheduler=scheduler,
+                               cache_path=None, deduplicate=False, manifest_path=None, prefilter="any")
+
+    assert sorted(stub.attempts) == sorted(f"Stub article {n}" for n in range(0, ARTICLES, 2))
+    assert [idx for idx, _ in results] == list(range(ARTICLES))
+    assert all(bool(result.get("prefilter")) == (idx % 2 == 1) for idx, result in results)
+
+
+def test_backend_reused_across_runs_closes_its_clients(stub, export, tmp_path):
+    # The app's jobs reuse a backend across runs, each in its own event loop
+    backend = OpenAIBackend(api_key="test", base_url=stub.base_url)
+    for run in range(2):
+        scheduler = RateLimitScheduler(requests_per_minute=100000, tokens_per_minute=10 ** 8,
+                                       base_delay=0.01, max_delay=0.05)
+        results = process_articles(export, max_in_flight=MAX_IN_FLIGHT, timeout=10,
+                                   results_path=str(tmp_path / f"results_{run}.jsonl"), client=backend,
+                                   scheduler=scheduler, cache_path=None, deduplicate=False, manifest_path=None)
+        assert len(results) == ARTICLES
+        assert backend._client is None
+
+    # A client left open by an earlier event loop is closed by the next aclose()
+    request = {"model": "gpt-4o", "messages": [{"role": "user", "content": "TITLE: Stub article 0"}]}
+    asyncio.run(backend.create(**request))
+    stale = backend._client
+
+    async def second_loop():
+        await backend.create(**request)
+        await backend.aclose()
+
+    asyncio.run(second_loop())
+    assert stale.is_closed() and backend._client is None and not backend._stale
+
+
+def test_blank_titles_are_screened(stub, tmp_path):
+    # A blank title reaches the prompt as NaN; the stub finds the article by its abstract
+    path = tmp_path / "export.csv"
+    with open(path, "w") as f:
+        f.write("title,abstract\n")
+        for n in range(ARTICLES):
+            f.write(f"{'' if n % 3 == 0 else f'Title {n}'},Stub article {n}\n")
+    backend = OpenAIBackend(api_key="test", base_url=stub.base_url)
+    scheduler = RateLimitScheduler(requests_per_minute=100000, tokens_per_minute=10 ** 8,
+                                   base_delay=0.01, max_delay=0.05)
+    results = process_articles(str(path), max_in_flight=MAX_IN_FLIGHT, timeout=10,
+                               results_path=str(tmp_path / "results.jsonl"), client=backend, scheduler=scheduler,
+                               cache_path=None, deduplicate=False, manifest_path=None)
+    assert [idx for idx, result in results if result is not None] == list(range(ARTICLES))
+
+
+def test_a_failing_record_does_not_stop_the_workers(stub, export, tmp_path, monkeypatch):
+    render = PromptVersion.render
+
+    def flaky_render(self, title, abstract):
+        if title.endswith(" 7"):
+            raise ValueError("unrenderable")
+        return render(self, title, abstract)
+
+    monkeypatch.setattr(PromptVersion, "render", flaky_render)
+    backend = OpenAIBackend(api_key="test", base_url=stub.base_url)
+    scheduler = RateLimitScheduler(requests_per_minute=100000, tokens_per_minute=10 ** 8,
+                                   base_delay=0.01, max_delay=0.05)
+    # Fewer workers than bad records per pass would once hang the producer on the full queue
+    results = process_articles(export, max_in_flight=1, timeout=10, results_path=str(tmp_path / "results.jsonl"),
+                               client=backend, scheduler=scheduler, cache_path=None, deduplicate=False,
+                               manifest_path=None)
+    assert [idx for idx, result in results if result is None] == [7]
+    assert len(results) == ARTICLES
+
+
+def test_escalation_with_the_same_model_bypasses_the_cache(stub, export, tmp_path, monkeypatch):
+    monkeypatch.setattr(screening_engine, "borderline_ids", lambda results, weights, band: {0, 3, 4})
+    first = OpenAIBackend(api_key="test", base_url=stub.base_url)
+    second = OpenAIBackend(api_key="test", base_url=stub.base_url)
+    scheduler = RateLimitScheduler(requests_per_minute=100000, tokens_per_minute=10 ** 8,
+                                   base_delay=0.01, max_delay=0.05)
+    process_articles(export, max_in_flight=MAX_IN_FLIGHT, timeout=10, results_path=str(tmp_path / "results.jsonl"),
+                     client=first, scheduler=scheduler, cache_path=str(tmp_path / "cache.sqlite"), deduplicate=False,
+                     manifest_path=None, escalate_to=second)
+    # Both backends default to the prompt's model: the borderline articles really are asked again
+    assert second.counters["calls"] == 3
+    assert [stub.attempts[f"Stub article {n}"] for n in (0, 3, 4)] == [2, 2, 2]
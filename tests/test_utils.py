@@ -0,0 +1,50 @@
+# The serial utils.process_articles path with a stubbed synchronous client: results go to the
+# append-only results store, not to one article_{idx}.json per article.
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import utils
+from results_store import ResultsStore
+from test_batch_mode import GOOD
+
+
+class StubCompletions:
+    def __init__(self):
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        content = "not json" if self.calls == 2 else json.dumps(GOOD)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content, refusal=None))])
+
+
+@pytest.fixture
+def stub_client(monkeypatch):
+    completions = StubCompletions()
+    monkeypatch.setattr(utils, "client", SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+    return completions
+
+
+def test_serial_path_appends_to_the_store(stub_client, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    export = tmp_path / "export.csv"
+    export.write_text("title,abstract\nFirst,One\nSecond,Two\nThird,\n")
+
+    store_path = utils.process_articles(str(export), results_path=str(tmp_path / "results.jsonl"))
+
+    assert not list(tmp_path.glob("article_*.json"))
+    with ResultsStore(store_path, readonly=True) as store:
+        assert sorted(store.completed_ids()) == [0, 2]  # the second reply was not JSON
+    df = utils.process_json_files(str(tmp_path), str(tmp_path / "full"), results_path="results.jsonl")
+    assert df["article_idx"].tolist() == [0, 2]
+    assert (tmp_path / "full.csv").exists()
+
+
+def test_legacy_json_files_are_imported(tmp_path):
+    for idx in (3, 1):
+        (tmp_path / f"article_{idx}.json").write_text(json.dumps(GOOD))
+    df = utils.process_json_files(str(tmp_path), str(tmp_path / "full.csv"))
+    assert df["article_idx"].tolist() == [1, 3]
+    assert df["document_info.title"].tolist() == ["t", "t"]